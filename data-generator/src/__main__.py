@@ -1,39 +1,482 @@
+import argparse
+import asyncio
 import logging
+import sys
+import threading
+import time
+from collections.abc import Callable, Sequence
+from contextlib import ExitStack
+from datetime import UTC, datetime, timedelta
+from logging import getLogger
+from pathlib import Path
+from typing import Any
+
+from sqlalchemy import select
+from sqlalchemy.orm import sessionmaker
 
 from bass.bass_api import Back4AppApi
 from bass.gen_insert_bass import populate_bass
+from bass.mock_server import Faults, Latency, MockParseServer
 from bass.req_back4app import start_req_back4app
-from config import BACK4APP_APPLICATION_ID, BACK4APP_REST_API_KEY
-from db.db_conn import Session
-from db.gen_insert_db import populate_database
-from db.req_db import start_req_db
+from batch import (
+    back4app_runner,
+    batch_from_path,
+    check_queries,
+    db_runner,
+    duckdb_runner,
+    run_batch,
+    write_jsonl,
+)
+from config import (
+    BACK4APP_POOL_SIZE,
+    DB_ASYNC_CONCURRENCY,
+    DB_POOL_WARMUP,
+    DB_URL,
+    DUCKDB_PATH,
+    MEASURES_PARTITIONS_AHEAD,
+    MEASURES_RETENTION_MONTHS,
+    MOCK_ERROR_RATE,
+    MOCK_LATENCY,
+    MOCK_PORT,
+    MOCK_RATE_LIMIT,
+    MOCK_SEED,
+    SCALE_FACTOR,
+    back4app_credentials,
+)
+from db.db_conn import (
+    Session,
+    create_db_engine,
+    log_pool_stats,
+    warm_up,
+)
+from db.db_conn import (
+    engine as session_engine,
+)
+from db.db_conn_async import (
+    async_session_factory,
+    create_async_db_engine,
+    warm_up_async,
+)
+from db.gen_insert_db import (
+    INSERT_MODES,
+    InsertMode,
+    compare_insert_modes,
+    populate_database,
+    populate_database_async,
+    write_mode_timings_csv,
+    write_mode_timings_json,
+)
+from db.measure_stats import check_measure_stats, rebuild_measure_stats
+from db.models import Users
+from db.partitions import (
+    explain_partitions,
+    list_partitions,
+    maintain_partitions,
+    unpruned_partitions,
+)
+from db.req_db import (
+    check_measure_plans,
+    explain_measure_indexes,
+    start_req_db,
+)
+from db.req_db_async import find_many_user_device_types
+from duck.duck_conn import connect
+from duck.gen_insert_duck import copy_from_database, populate_duckdb
+from duck.req_duck import start_req_duck
+from timing import log_breakdown
 
+logger = getLogger(name=__name__)
 
-def main() -> None:
-    logging.basicConfig(level=logging.INFO)
 
+def measure_stats_command(action: str) -> None:
+    """Сверка сводки DeviceMeasureStats с Measures или её пересчёт"""
+    with Session() as session:
+        if action == "rebuild":
+            rebuild_measure_stats(session)
+            session.commit()
+            logger.info("DeviceMeasureStats пересчитана")
+            return
+
+        mismatched = check_measure_stats(session)
+        if mismatched:
+            logger.error(
+                "Сводка расходится с Measures для %d устройств: %s",
+                len(mismatched),
+                mismatched[:20],
+            )
+            raise SystemExit(1)
+        logger.info("Сводка совпадает с Measures")
+
+
+def partitions_command(action: str, days: int) -> None:
+    """
+    maintain - секции Measures вперёд и удаление устаревших,
+    show - список секций, explain - какие секции читает запрос
+    за последние days дней (ошибка, если секции вне окна),
+    indexes - читают ли запросы измерений свои индексы
+    """
+    now = datetime.now(UTC).replace(tzinfo=None)
+    with Session() as session:
+        if action == "maintain":
+            added, dropped = maintain_partitions(
+                session,
+                now.date(),
+                months_ahead=MEASURES_PARTITIONS_AHEAD,
+                retention_months=MEASURES_RETENTION_MONTHS,
+            )
+            if dropped:
+                # удалённые измерения есть в сводке
+                rebuild_measure_stats(session)
+            session.commit()
+            logger.info("Добавлены секции: %s, удалены: %s", added, dropped)
+        elif action == "show":
+            for partition in list_partitions(session):
+                logger.info(
+                    "%-8s до %-10s ~%d строк",
+                    partition.name,
+                    partition.less_than or "MAXVALUE",
+                    partition.rows,
+                )
+        elif action == "indexes":
+            plans = explain_measure_indexes(session)
+            logger.info("Планы Measures из EXPLAIN: %s", plans)
+            problems = check_measure_plans(plans)
+            if problems:
+                logger.error("Планы запросов к Measures: %s", problems)
+                raise SystemExit(1)
+        else:
+            start = now - timedelta(days=days)
+            logger.info(
+                "Измерения за %d дн. читаются из секций: %s",
+                days,
+                explain_partitions(session, start, now),
+            )
+            unpruned = unpruned_partitions(session, start, now)
+            if unpruned:
+                logger.error("Секции вне окна запроса: %s", unpruned)
+                raise SystemExit(1)
+
+
+def insert_modes_command(
+    modes: Sequence[InsertMode], json_path: Path | None, csv_path: Path | None
+) -> None:
+    """Заполнение MySQL каждым способом записи, время этапов - в файлы"""
+    results = compare_insert_modes(
+        Session, modes, scale_factor=SCALE_FACTOR, partitions=True
+    )
+    if json_path is not None:
+        write_mode_timings_json(results, json_path)
+    if csv_path is not None:
+        write_mode_timings_csv(results, csv_path)
+
+
+def duckdb_command(action: str, path: str) -> None:
+    """
+    populate - генерация данных прямо в DuckDB, copy - копия таблиц
+    MySQL, query - запросы из консоли
+    """
+    with connect(path) as con:
+        if action == "populate":
+            timings = populate_duckdb(con, scale_factor=SCALE_FACTOR)
+            logger.info("DuckDB заполнена за %.2f с", sum(timings.values()))
+        elif action == "copy":
+            with Session() as session:
+                copied = copy_from_database(con, session)
+            logger.info("Скопировано из MySQL: %s", copied)
+        else:
+            start_req_duck(con)
+
+
+async def async_db_command(action: str, concurrency: int) -> None:
+    """
+    MySQL через AsyncEngine: populate - генерация (пачки одной таблицы
+    пишутся параллельно), lookup - права всех пользователей из одного
+    цикла событий, до concurrency запросов одновременно
+    """
+    engine = create_async_db_engine(pool_size=concurrency)
+    make_session = async_session_factory(engine)
+    try:
+        await warm_up_async(engine, concurrency)
+        if action == "populate":
+            timings = await populate_database_async(
+                make_session,
+                scale_factor=SCALE_FACTOR,
+                concurrency=concurrency,
+                partitions=True,
+            )
+            logger.info("MySQL заполнена за %.2f с", sum(timings.values()))
+            return
+
+        async with make_session() as session:
+            user_names = list(await session.scalars(select(Users.name)))
+        start = time.perf_counter()
+        permissions = await find_many_user_device_types(
+            make_session, user_names, concurrency=concurrency
+        )
+        elapsed = time.perf_counter() - start
+        logger.info(
+            "Права %d пользователей за %.2f с (%.0f в секунду)",
+            len(permissions),
+            elapsed,
+            len(permissions) / elapsed,
+        )
+    finally:
+        log_pool_stats(engine.sync_engine)
+        await engine.dispose()
+
+
+def batch_command(
+    path: Path, backend: str, workers: int, output: Path | None
+) -> None:
+    """
+    Запросы из файла JSON lines в workers потоков, результаты -
+    JSON lines в output (по умолчанию stdout)
+    """
+    try:
+        items = batch_from_path(path)
+        check_queries(backend, items)
+    except ValueError as e:
+        raise SystemExit(f"{path}: {e}") from e
+
+    start = time.perf_counter()
+    with ExitStack() as stack:
+        # по соединению MySQL / HTTP / курсору DuckDB на поток
+        run: Callable[[str, dict[str, Any]], object]
+        if backend == "db":
+            engine = create_db_engine(DB_URL, pool_size=workers)
+            stack.callback(engine.dispose)
+            stack.callback(log_pool_stats, engine)
+            warm_up(engine, workers)
+            run = db_runner(sessionmaker(bind=engine))
+        elif backend == "back4app":
+            application_id, rest_api_key = back4app_credentials()
+            back4app_api = stack.enter_context(
+                Back4AppApi(
+                    application_id=application_id,
+                    rest_api_key=rest_api_key,
+                    pool_size=workers,
+                )
+            )
+            run = back4app_runner(back4app_api)
+        else:
+            duckdb_con = stack.enter_context(
+                connect(DUCKDB_PATH, read_only=True)
+            )
+            run = duckdb_runner(duckdb_con)
+
+        records = run_batch(backend, items, run, workers=workers)
+        if output is None:
+            errors = write_jsonl(records, sys.stdout)
+        else:
+            with output.open("w", encoding="utf-8") as file:
+                errors = write_jsonl(records, file)
+    elapsed = time.perf_counter() - start
+
+    logger.info(
+        "%s: %d запросов за %.2f с (%.1f в секунду), ошибок %d",
+        backend,
+        len(items),
+        elapsed,
+        len(items) / elapsed if elapsed else 0.0,
+        errors,
+    )
+
+
+def mock_server_command(
+    address: tuple[str, int], faults: Faults, seed: int, *, populate: bool
+) -> None:
+    """
+    Локальный Parse Server до Ctrl+C. populate - данные генератора
+    (SCALE_FACTOR) через /batch до включения задержек и отказов
+    """
+    with MockParseServer(address, seed=seed) as server:
+        thread = threading.Thread(target=server.serve_forever, daemon=True)
+        thread.start()
+        if populate:
+            with Back4AppApi(
+                application_id="mock",
+                rest_api_key="mock",
+                server_url=server.url,
+            ) as back4app_api:
+                populate_bass(
+                    back4app_api, batch=True, scale_factor=SCALE_FACTOR
+                )
+            logger.info("Загружено: %s", server.store.counts())
+        server.set_faults(faults)
+
+        logger.info("Parse Server: BACK4APP_SERVER_URL=%s", server.url)
+        try:
+            thread.join()
+        except KeyboardInterrupt:
+            server.shutdown()
+        logger.info("Запросы: %s", server.stats)
+
+
+def parse_args(argv: Sequence[str] | None = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        description="Без команды - загрузка и запросы (см. main)"
+    )
+    commands = parser.add_subparsers(dest="command")
+    stats = commands.add_parser(
+        "stats", help="сводка измерений DeviceMeasureStats"
+    )
+    stats.add_argument("action", choices=("check", "rebuild"))
+    partitions = commands.add_parser(
+        "partitions", help="секции и индексы Measures"
+    )
+    partitions.add_argument(
+        "action", choices=("maintain", "show", "explain", "indexes")
+    )
+    partitions.add_argument(
+        "--days", type=int, default=7, help="окно запроса для explain"
+    )
+    insert_modes = commands.add_parser(
+        "insert-modes", help="время заполнения MySQL разными способами"
+    )
+    insert_modes.add_argument(
+        "--modes", nargs="+", choices=INSERT_MODES, default=INSERT_MODES
+    )
+    insert_modes.add_argument("--json", type=Path)
+    insert_modes.add_argument("--csv", type=Path)
+    duck = commands.add_parser(
+        "duckdb", help="встроенная DuckDB: те же таблицы и запросы"
+    )
+    duck.add_argument("action", choices=("populate", "copy", "query"))
+    duck.add_argument("--path", default=DUCKDB_PATH, help="файл DuckDB")
+    async_db = commands.add_parser(
+        "async-db", help="MySQL через AsyncEngine из одного цикла событий"
+    )
+    async_db.add_argument("action", choices=("populate", "lookup"))
+    async_db.add_argument(
+        "--concurrency",
+        type=int,
+        default=DB_ASYNC_CONCURRENCY,
+        help="одновременных запросов и соединений пула",
+    )
+    batch = commands.add_parser(
+        "batch", help="запросы из файла, параллельно, без диалога"
+    )
+    batch.add_argument(
+        "queries",
+        type=Path,
+        help='JSON lines: {"query": "getMeasures", "params": {...}}',
+    )
+    batch.add_argument(
+        "--backend", choices=("db", "back4app", "duckdb"), default="db"
+    )
+    batch.add_argument("--workers", type=int, default=8)
+    batch.add_argument(
+        "--output", type=Path, help="файл JSON lines, по умолчанию stdout"
+    )
+    mock = commands.add_parser(
+        "mock-server", help="локальный Parse Server вместо Back4app"
+    )
+    mock.add_argument("--host", default="127.0.0.1")
+    mock.add_argument("--port", type=int, default=MOCK_PORT)
+    mock.add_argument(
+        "--latency",
+        type=Latency.parse,
+        default=MOCK_LATENCY,
+        help='задержка ответа в мс, например "lognormal:30:0.5"',
+    )
+    mock.add_argument(
+        "--rate-limit",
+        type=float,
+        default=MOCK_RATE_LIMIT,
+        help="запросов в секунду до ответа 429, 0 - без лимита",
+    )
+    mock.add_argument(
+        "--error-rate",
+        type=float,
+        default=MOCK_ERROR_RATE,
+        help="доля ответов 500",
+    )
+    mock.add_argument("--seed", type=int, default=MOCK_SEED)
+    mock.add_argument(
+        "--populate", action="store_true", help="заполнить генератором"
+    )
+    return parser.parse_args(argv)
+
+
+def run_command(args: argparse.Namespace) -> None:
+    match args.command:
+        case "stats":
+            measure_stats_command(args.action)
+        case "partitions":
+            partitions_command(args.action, args.days)
+        case "insert-modes":
+            insert_modes_command(args.modes, args.json, args.csv)
+        case "duckdb":
+            duckdb_command(args.action, args.path)
+        case "async-db":
+            asyncio.run(async_db_command(args.action, args.concurrency))
+        case "batch":
+            batch_command(
+                args.queries, args.backend, args.workers, args.output
+            )
+        case "mock-server":
+            mock_server_command(
+                (args.host, args.port),
+                Faults(args.latency, args.rate_limit, args.error_rate),
+                args.seed,
+                populate=args.populate,
+            )
+        case _:
+            console_command()
+
+
+def uses_session_engine(args: argparse.Namespace) -> bool:
+    """Команда работает через общий db_conn.engine (Session)"""
+    match args.command:
+        case "stats" | "partitions" | "insert-modes":
+            return True
+        case "duckdb":
+            return bool(args.action == "copy")
+        case _:
+            return False
+
+
+def console_command() -> None:
+    """Без команды: загрузка и запросы из консоли"""
     # Загрузка в бд
 
     # with Session() as session:
-    #     populate_database(session, clear_first=True)
+    #     populate_database(
+    #         session,
+    #         clear_first=True,
+    #         scale_factor=SCALE_FACTOR,
+    #         partitions=True,
+    #     )
 
     # Запросы к бд
     # with Session() as session:
     #     start_req_db(session=session)
 
-    #  Загрузка в back4app
-    # back4app_api = Back4AppApi(
-    #     application_id=BACK4APP_APPLICATION_ID,
-    #     rest_api_key=BACK4APP_REST_API_KEY,
-    # )
-    # populate_bass(back4app_api)
+    # Одна сессия с пулом соединений на загрузку и запросы к back4app
+    application_id, rest_api_key = back4app_credentials()
+    with Back4AppApi(
+        application_id=application_id,
+        rest_api_key=rest_api_key,
+        pool_size=BACK4APP_POOL_SIZE,
+    ) as back4app_api:
+        #  Загрузка в back4app
+        # populate_bass(back4app_api, scale_factor=SCALE_FACTOR)
 
-    # Запросы к бд
+        # Запросы к бд
+        start_req_back4app(back4app_api)
 
-    start_req_back4app(
-        application_id=BACK4APP_APPLICATION_ID,
-        rest_api_key=BACK4APP_REST_API_KEY,
-    )
+
+def main(argv: Sequence[str] | None = None) -> None:
+    logging.basicConfig(level=logging.INFO)
+    args = parse_args(argv)
+    try:
+        if DB_POOL_WARMUP and uses_session_engine(args):
+            warm_up(session_engine, DB_POOL_WARMUP)
+        run_command(args)
+    finally:
+        log_pool_stats(session_engine)
+        # самые долгие операции, выражения SQL и запросы HTTP
+        log_breakdown()
 
 
 if __name__ == "__main__":
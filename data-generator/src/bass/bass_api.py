@@ -1,217 +1,388 @@
+import json
+from collections.abc import Callable, Sequence
+from http import HTTPStatus
+from itertools import batched
+from typing import Any, Self, override
+
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 
+from bass.models import (
+    ActivationsToDevices,
+    CoNEToDevices,
+    Devices,
+    DeviceTypes,
+    DeviceTypesToUserTypes,
+    Events,
+    Houses,
+    Measures,
+    Scenarios,
+    Users,
+    UserTypes,
+)
+from config import BACK4APP_SERVER_URL
+from timing import instrument_session
 
-class Back4AppApi:
-    def __init__(self, application_id: str, rest_api_key: str) -> None:
-        self.headers = {
-            "X-Parse-Application-Id": application_id,
-            "X-Parse-REST-API-Key": rest_api_key,
-            "Content-Type": "application/json",
-        }
-        self.base_url = "https://parseapi.back4app.com/classes/"
+SERVER_URL = BACK4APP_SERVER_URL
 
-    def create_user_types(self, type_: str) -> str:
-        json_data = {"type": type_}
-        res = requests.post(
-            url=self.base_url + "UserTypes",
-            json=json_data,
-            headers=self.headers,
-            timeout=30,
-        )
-        return res.json()["objectId"]
+# Parse Server принимает не больше 50 операций в одном /batch
+BATCH_SIZE = 50
 
-    def create_houses(self, address: str) -> str:
-        json_data = {"address": address}
-        res = requests.post(
-            url=self.base_url + "Houses",
-            json=json_data,
-            headers=self.headers,
-            timeout=30,
-        )
-        return res.json()["objectId"]
+# 429 - лимит запросов Back4app, 5xx - временные ошибки сервера.
+# При 429 запрос не выполнен и повторяется любой, 5xx повторяется только
+# для чтения: POST на /classes и /batch мог записать объекты до ошибки
+RETRY_STATUSES = (429, 500, 502, 503, 504)
 
-    def create_device_types(self, type_: str, name: str) -> str:
-        json_data = {"type": type_, "name": name}
-        res = requests.post(
-            url=self.base_url + "DeviceTypes",
-            json=json_data,
-            headers=self.headers,
-            timeout=30,
-        )
-        return res.json()["objectId"]
+type BassObject = (
+    DeviceTypes
+    | Houses
+    | Scenarios
+    | UserTypes
+    | DeviceTypesToUserTypes
+    | Devices
+    | Users
+    | ActivationsToDevices
+    | CoNEToDevices
+    | Events
+    | Measures
+)
 
-    def create_scenaries(self, time_from: int, time_till: int) -> str:
-        json_data = {"time_from": time_from, "time_till": time_till}
-        res = requests.post(
-            url=self.base_url + "Scenaries",
-            json=json_data,
-            headers=self.headers,
-            timeout=30,
+
+class Back4AppObjectError(Exception):
+    """Ошибка Parse при создании объекта"""
+
+    def __init__(self, class_name: str, error: dict[str, Any]) -> None:
+        super().__init__(
+            f"{class_name}: {error.get('code')} {error.get('error')}"
         )
-        return res.json()["objectId"]
-
-    def create_device_types_to_user_types(
-        self, device_type_id: str, user_type_id: str
-    ) -> str:
-        json_data = {
-            "device_type_id": {
-                "__type": "Pointer",
-                "className": "DeviceTypes",
-                "objectId": device_type_id,
-            },
-            "user_type_id": {
-                "__type": "Pointer",
-                "className": "UserTypes",
-                "objectId": user_type_id,
-            },
-        }
-        res = requests.post(
-            url=self.base_url + "DeviceTypesToUserTypes",
-            json=json_data,
-            headers=self.headers,
-            timeout=30,
+        self.class_name = class_name
+        self.error = error
+
+
+class Back4AppBatchError(Exception):
+    """
+    Ошибки операций /batch по индексам объектов. Остальные объекты
+    пачки Parse уже создал, их objectId проставлены - при повторе
+    создавать заново нужно только объекты без object_id
+    """
+
+    def __init__(self, errors: dict[int, Back4AppObjectError]) -> None:
+        super().__init__(
+            "; ".join(f"#{index} {error}" for index, error in errors.items())
         )
-        return res.json()["objectId"]
-
-    def create_user(self, name: str, user_type_id: str) -> str:
-        json_data = {
-            "name": name,
-            "user_type_id": {
-                "__type": "Pointer",
-                "className": "UserTypes",
-                "objectId": user_type_id,
-            },
-        }
-        res = requests.post(
-            url=self.base_url + "Users",
-            json=json_data,
-            headers=self.headers,
-            timeout=30,
+        self.errors = errors
+
+
+def parse_error(status_code: int, text: str) -> dict[str, Any]:
+    """Тело ошибки Parse {"code": ..., "error": ...} или текст ответа"""
+    try:
+        error = json.loads(text)
+    except ValueError:
+        error = None
+    if not isinstance(error, dict):
+        return {"code": status_code, "error": text}
+    return error
+
+
+def pointer(class_name: str, object_id: str | None) -> dict[str, str] | None:
+    if object_id is None:
+        return None
+    return {
+        "__type": "Pointer",
+        "className": class_name,
+        "objectId": object_id,
+    }
+
+
+def apply_batch_results(
+    chunk: Sequence[tuple[int, BassObject]],
+    class_names: Sequence[str],
+    results: Sequence[dict[str, Any]],
+) -> None:
+    """
+    objectId из ответа /batch - объектам пачки (индекс, объект).
+    Ошибки собираются и поднимаются одним Back4AppBatchError
+    после того, как проставлены все objectId
+    """
+    errors: dict[int, Back4AppObjectError] = {}
+    for (index, obj), class_name, item in zip(
+        chunk, class_names, results, strict=True
+    ):
+        if "error" in item:
+            errors[index] = Back4AppObjectError(class_name, item["error"])
+        else:
+            obj.object_id = item["success"]["objectId"]
+    if errors:
+        raise Back4AppBatchError(errors)
+
+
+def saved_id(obj: BassObject) -> str:
+    """objectId объекта, уже записанного в Back4app"""
+    if obj.object_id is None:
+        msg = f"{type(obj).__name__} ещё не записан в Back4app"
+        raise ValueError(msg)
+    return obj.object_id
+
+
+# Тип объекта -> имя класса в Back4app и тело запроса на создание
+PARSE_CLASSES: dict[
+    type[BassObject], tuple[str, Callable[[Any], dict[str, Any]]]
+] = {
+    UserTypes: ("UserTypes", lambda obj: {"type": obj.type}),
+    Houses: ("Houses", lambda obj: {"address": obj.address}),
+    DeviceTypes: (
+        "DeviceTypes",
+        lambda obj: {"type": obj.type, "name": obj.name},
+    ),
+    Scenarios: (
+        "Scenaries",
+        lambda obj: {"time_from": obj.time_from, "time_till": obj.time_till},
+    ),
+    DeviceTypesToUserTypes: (
+        "DeviceTypesToUserTypes",
+        lambda obj: {
+            "device_type_id": pointer("DeviceTypes", obj.device_type_id),
+            "user_type_id": pointer("UserTypes", obj.user_type_id),
+        },
+    ),
+    Users: (
+        "Users",
+        lambda obj: {
+            "name": obj.name,
+            "user_type_id": pointer("UserTypes", obj.user_type_id),
+        },
+    ),
+    Devices: (
+        "Devices",
+        lambda obj: {
+            "house_id": pointer("Houses", obj.house_id),
+            "device_type_id": pointer("DeviceTypes", obj.device_type_id),
+        },
+    ),
+    CoNEToDevices: (
+        "CoNEToDevises",
+        lambda obj: {
+            "scenary_id": pointer("Scenaries", obj.scenario_id),
+            "device_id": pointer("Devices", obj.device_id),
+            "is_on": obj.is_on,
+        },
+    ),
+    ActivationsToDevices: (
+        "ActivationsToDevices",
+        lambda obj: {
+            "scenary_id": pointer("Scenaries", obj.scenario_id),
+            "device_id": pointer("Devices", obj.device_id),
+            "is_on": obj.is_on,
+            "affect_time": obj.affect_time,
+        },
+    ),
+    Events: (
+        "Events",
+        lambda obj: {
+            "user_id": pointer("Users", obj.user_id),
+            "device_id": pointer("Devices", obj.device_id),
+            "scenary_id": pointer("Scenaries", obj.scenario_id),
+            "value": obj.value,
+        },
+    ),
+    Measures: (
+        "Measures",
+        lambda obj: {
+            "device_id": pointer("Devices", obj.device_id),
+            "measure_time": obj.measure_time,
+            "value": obj.value,
+        },
+    ),
+}
+
+
+def to_parse_object(obj: BassObject) -> tuple[str, dict[str, Any]]:
+    """Имя класса в Back4app и тело запроса на создание объекта"""
+    class_name, body = PARSE_CLASSES[type(obj)]
+    return class_name, body(obj)
+
+
+class Back4AppFunctionError(Exception):
+    def __init__(self, name: str, status_code: int, text: str) -> None:
+        super().__init__(f"{name}: {status_code} {text}")
+        self.name = name
+        self.status_code = status_code
+
+
+class ParseRetry(Retry):
+    """
+    Retry с повтором 429 для любого метода. Остальные статусы
+    повторяются только для allowed_methods (по умолчанию -
+    идемпотентные, без POST)
+    """
+
+    @override
+    def is_retry(
+        self, method: str, status_code: int, has_retry_after: bool = False
+    ) -> bool:
+        if status_code == HTTPStatus.TOO_MANY_REQUESTS:
+            return True
+        return super().is_retry(method, status_code, has_retry_after)
+
+
+def create_session(
+    headers: dict[str, str],
+    pool_size: int = 10,
+    max_retries: int = 3,
+    backoff_factor: float = 0.5,
+    *,
+    read_urls: Sequence[str] = (),
+) -> requests.Session:
+    """
+    Долгоживущая сессия: keep-alive соединения из пула и повторы
+    с экспоненциальной задержкой (учитывается Retry-After) на ошибки
+    соединения и 429, на 5xx - только GET и POST по адресам read_urls
+    (функции Cloud Code, которые только читают)
+    """
+
+    def adapter(allowed_methods: frozenset[str]) -> HTTPAdapter:
+        retry = ParseRetry(
+            total=max_retries,
+            backoff_factor=backoff_factor,
+            status_forcelist=RETRY_STATUSES,
+            allowed_methods=allowed_methods,
+            raise_on_status=False,
         )
-        return res.json()["objectId"]
-
-    def create_devices(self, house_id: str, device_type_id: str) -> str:
-        json_data = {
-            "house_id": {
-                "__type": "Pointer",
-                "className": "Houses",
-                "objectId": house_id,
-            },
-            "device_type_id": {
-                "__type": "Pointer",
-                "className": "DeviceTypes",
-                "objectId": device_type_id,
-            },
-        }
-        res = requests.post(
-            url=self.base_url + "Devices",
-            json=json_data,
-            headers=self.headers,
-            timeout=30,
+        return HTTPAdapter(
+            pool_connections=pool_size,
+            pool_maxsize=pool_size,
+            max_retries=retry,
         )
-        return res.json()["objectId"]
-
-    def create_co_ne_to_devises(
-        self, scenary_id: str, device_id: str, is_on: bool
-    ) -> str:
-        json_data = {
-            "scenary_id": {
-                "__type": "Pointer",
-                "className": "Scenaries",
-                "objectId": scenary_id,
-            },
-            "device_id": {
-                "__type": "Pointer",
-                "className": "Devices",
-                "objectId": device_id,
-            },
-            "is_on": is_on,
+
+    session = requests.Session()
+    session.headers.update(headers)
+    writes = adapter(Retry.DEFAULT_ALLOWED_METHODS)
+    session.mount("https://", writes)
+    session.mount("http://", writes)
+    reads = adapter(Retry.DEFAULT_ALLOWED_METHODS | {"POST"})
+    for url in read_urls:
+        session.mount(url, reads)
+    instrument_session(session)
+    return session
+
+
+class Back4AppApi:
+    def __init__(  # noqa: PLR0913
+        self,
+        application_id: str,
+        rest_api_key: str,
+        *,
+        pool_size: int = 10,
+        max_retries: int = 3,
+        backoff_factor: float = 0.5,
+        server_url: str = SERVER_URL,
+    ) -> None:
+        self.headers = {
+            "X-Parse-Application-Id": application_id,
+            "X-Parse-REST-API-Key": rest_api_key,
+            "Content-Type": "application/json",
         }
-        res = requests.post(
-            url=self.base_url + "CoNEToDevises",
-            json=json_data,
-            headers=self.headers,
-            timeout=30,
+        self.server_url = server_url
+        self.base_url = self.server_url + "classes/"
+        self.functions_url = self.server_url + "functions/"
+        self.session = create_session(
+            self.headers,
+            pool_size=pool_size,
+            max_retries=max_retries,
+            backoff_factor=backoff_factor,
+            read_urls=[self.functions_url],
         )
-        return res.json()["objectId"]
-
-    def create_activations_to_devices(
-        self, scenary_id: str, device_id: str, is_on: bool, affect_time: int
-    ) -> str:
-        json_data = {
-            "scenary_id": {
-                "__type": "Pointer",
-                "className": "Scenaries",
-                "objectId": scenary_id,
-            },
-            "device_id": {
-                "__type": "Pointer",
-                "className": "Devices",
-                "objectId": device_id,
-            },
-            "is_on": is_on,
-            "affect_time": affect_time,
-        }
-        res = requests.post(
-            url=self.base_url + "ActivationsToDevices",
-            json=json_data,
-            headers=self.headers,
+
+    def close(self) -> None:
+        self.session.close()
+
+    def __enter__(self) -> Self:
+        return self
+
+    def __exit__(self, *_: object) -> None:
+        self.close()
+
+    def call_function(
+        self, name: str, params: dict[str, Any] | None = None
+    ) -> Any:  # noqa: ANN401
+        """Вызов Cloud Code функции, возвращает поле result ответа"""
+        res = self.session.post(
+            url=self.functions_url + name,
+            json=params,
             timeout=30,
         )
-        return res.json()["objectId"]
 
-    def create_events(
+        if res.status_code != HTTPStatus.OK:
+            raise Back4AppFunctionError(name, res.status_code, res.text)
+
+        return res.json()["result"]
+
+    def find_objects(
         self,
-        user_id: str,
-        device_id: str,
-        scenary_id: str,
-        value: bool,
-    ) -> str:
-        json_data = {
-            "user_id": {
-                "__type": "Pointer",
-                "className": "Users",
-                "objectId": user_id,
-            },
-            "device_id": {
-                "__type": "Pointer",
-                "className": "Devices",
-                "objectId": device_id,
-            },
-            "scenary_id": {
-                "__type": "Pointer",
-                "className": "Scenaries",
-                "objectId": scenary_id,
-            },
-            "value": value,
-        }
-        res = requests.post(
-            url=self.base_url + "Events",
-            json=json_data,
-            headers=self.headers,
+        class_name: str,
+        *,
+        where: dict[str, Any] | None = None,
+        include: Sequence[str] = (),
+        limit: int = 1000,
+    ) -> list[dict[str, Any]]:
+        """GET /classes: объекты класса с условием where в формате Parse"""
+        params: dict[str, Any] = {"limit": limit}
+        if where is not None:
+            params["where"] = json.dumps(where, ensure_ascii=False)
+        if include:
+            params["include"] = ",".join(include)
+        res = self.session.get(
+            url=self.base_url + class_name,
+            params=params,
             timeout=30,
         )
-        return res.json()["objectId"]
+        res.raise_for_status()
+        results: list[dict[str, Any]] = res.json()["results"]
+        return results
 
-    def create_measures(
-        self,
-        device_id: str,
-        measure_time: int,
-        value: int,
-    ) -> str:
-        json_data = {
-            "device_id": {
-                "__type": "Pointer",
-                "className": "Devices",
-                "objectId": device_id,
-            },
-            "measure_time": measure_time,
-            "value": value,
-        }
-        res = requests.post(
-            url=self.base_url + "Measures",
+    def create_object(self, obj: BassObject) -> str:
+        class_name, json_data = to_parse_object(obj)
+        res = self.session.post(
+            url=self.base_url + class_name,
             json=json_data,
-            headers=self.headers,
             timeout=30,
         )
-        return res.json()["objectId"]
+        if not res.ok:
+            raise Back4AppObjectError(
+                class_name, parse_error(res.status_code, res.text)
+            )
+        object_id: str = res.json()["objectId"]
+        obj.object_id = object_id
+        return object_id
+
+    def create_objects_batch(self, objects: Sequence[BassObject]) -> None:
+        """
+        Создание объектов пачками через /batch.
+        objectId из ответа проставляются объектам в том же порядке.
+        Back4AppBatchError - на первой пачке с ошибками, индексы - в objects
+        """
+        for chunk in batched(enumerate(objects), BATCH_SIZE, strict=False):
+            parse_objects = [to_parse_object(obj) for _, obj in chunk]
+            json_data: dict[str, Any] = {
+                "requests": [
+                    {
+                        "method": "POST",
+                        "path": "/classes/" + class_name,
+                        "body": body,
+                    }
+                    for class_name, body in parse_objects
+                ]
+            }
+            res = self.session.post(
+                url=self.server_url + "batch",
+                json=json_data,
+                timeout=30,
+            )
+            res.raise_for_status()
+
+            apply_batch_results(
+                chunk,
+                [class_name for class_name, _ in parse_objects],
+                res.json(),
+            )
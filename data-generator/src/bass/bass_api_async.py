@@ -0,0 +1,201 @@
+import asyncio
+from collections.abc import Awaitable, Callable, Iterable, Sequence
+from http import HTTPStatus
+from itertools import batched
+from typing import Any, Self
+
+import httpx
+
+from bass.bass_api import (
+    BATCH_SIZE,
+    RETRY_STATUSES,
+    SERVER_URL,
+    Back4AppFunctionError,
+    Back4AppObjectError,
+    BassObject,
+    apply_batch_results,
+    parse_error,
+    to_parse_object,
+)
+
+
+def is_retry(res: httpx.Response, *, read: bool) -> bool:
+    """429 - запрос не выполнен, 5xx - мог выполниться (повтор для чтения)"""
+    if res.status_code == HTTPStatus.TOO_MANY_REQUESTS:
+        return True
+    return read and res.status_code in RETRY_STATUSES
+
+
+class AsyncBack4AppApi:
+    """
+    Асинхронный клиент Back4app.
+    Число одновременных запросов ограничено семафором, при 429
+    все запросы клиента ждут Retry-After (или экспоненциальную задержку),
+    не занимая слоты семафора. 5xx повторяются только для чтения
+    """
+
+    def __init__(  # noqa: PLR0913
+        self,
+        application_id: str,
+        rest_api_key: str,
+        *,
+        concurrency: int = 10,
+        max_retries: int = 3,
+        backoff_factor: float = 0.5,
+        server_url: str = SERVER_URL,
+    ) -> None:
+        self.headers = {
+            "X-Parse-Application-Id": application_id,
+            "X-Parse-REST-API-Key": rest_api_key,
+            "Content-Type": "application/json",
+        }
+        self.server_url = server_url
+        self.base_url = self.server_url + "classes/"
+        self.functions_url = self.server_url + "functions/"
+        self.concurrency = concurrency
+        self.max_retries = max_retries
+        self.backoff_factor = backoff_factor
+
+        self.client = httpx.AsyncClient(
+            headers=self.headers,
+            limits=httpx.Limits(
+                max_connections=concurrency,
+                max_keepalive_connections=concurrency,
+            ),
+            timeout=30,
+        )
+        self.semaphore = asyncio.Semaphore(concurrency)
+        self._resume_at = 0.0
+
+    async def aclose(self) -> None:
+        await self.client.aclose()
+
+    async def __aenter__(self) -> Self:
+        return self
+
+    async def __aexit__(self, *_: object) -> None:
+        await self.aclose()
+
+    def _retry_delay(self, res: httpx.Response | None, attempt: int) -> float:
+        retry_after = res.headers.get("Retry-After") if res else None
+        if retry_after is not None and retry_after.isdigit():
+            return float(retry_after)
+        return self.backoff_factor * 2.0**attempt
+
+    async def _post(
+        self,
+        url: str,
+        json: Any = None,  # noqa: ANN401
+        *,
+        read: bool = False,
+    ) -> httpx.Response:
+        """
+        POST с повторами: при 429 и ошибке соединения - всегда,
+        при 5xx - только если read (запрос ничего не записывает)
+        """
+        loop = asyncio.get_running_loop()
+        attempt = 0
+        while True:
+            pause = self._resume_at - loop.time()
+            if pause > 0:
+                await asyncio.sleep(pause)
+            async with self.semaphore:
+                if self._resume_at > loop.time():
+                    # пока ждали слот, пришёл 429 - ждём без слота
+                    continue
+                try:
+                    res = await self.client.post(url, json=json)
+                except httpx.ConnectError:
+                    # запрос не отправлен - повтор безопасен
+                    if attempt >= self.max_retries:
+                        raise
+                    res = None
+
+            if res is not None and (
+                not is_retry(res, read=read) or attempt >= self.max_retries
+            ):
+                return res
+
+            delay = self._retry_delay(res, attempt)
+            if res is not None and (
+                res.status_code == HTTPStatus.TOO_MANY_REQUESTS
+            ):
+                # лимит общий на приложение - притормаживаем весь клиент
+                self._resume_at = max(self._resume_at, loop.time() + delay)
+            await asyncio.sleep(delay)
+            attempt += 1
+
+    async def create_object(self, obj: BassObject) -> str:
+        class_name, json_data = to_parse_object(obj)
+        res = await self._post(self.base_url + class_name, json=json_data)
+        if not res.is_success:
+            raise Back4AppObjectError(
+                class_name, parse_error(res.status_code, res.text)
+            )
+        object_id: str = res.json()["objectId"]
+        obj.object_id = object_id
+        return object_id
+
+    async def _drain[T](
+        self, items: Iterable[T], create: Callable[[T], Awaitable[object]]
+    ) -> None:
+        """
+        concurrency задач берут элементы из общего итератора: корутины
+        не создаются на каждый объект сразу, items читается лениво
+        """
+        it = iter(items)
+
+        async def worker() -> None:
+            for item in it:
+                await create(item)
+
+        await asyncio.gather(*(worker() for _ in range(self.concurrency)))
+
+    async def create_objects(self, objects: Iterable[BassObject]) -> None:
+        await self._drain(objects, self.create_object)
+
+    async def _create_chunk(
+        self, chunk: Sequence[tuple[int, BassObject]]
+    ) -> None:
+        parse_objects = [to_parse_object(obj) for _, obj in chunk]
+        json_data = {
+            "requests": [
+                {
+                    "method": "POST",
+                    "path": "/classes/" + class_name,
+                    "body": body,
+                }
+                for class_name, body in parse_objects
+            ]
+        }
+        res = await self._post(self.server_url + "batch", json=json_data)
+        res.raise_for_status()
+
+        apply_batch_results(
+            chunk, [class_name for class_name, _ in parse_objects], res.json()
+        )
+
+    async def create_objects_batch(
+        self, objects: Iterable[BassObject]
+    ) -> None:
+        """
+        Как Back4AppApi.create_objects_batch, но пачки по BATCH_SIZE
+        пишутся параллельно. Индексы в Back4AppBatchError - в objects
+        """
+        await self._drain(
+            batched(enumerate(objects), BATCH_SIZE, strict=False),
+            self._create_chunk,
+        )
+
+    async def call_function(
+        self, name: str, params: dict[str, Any] | None = None
+    ) -> Any:  # noqa: ANN401
+        """Вызов Cloud Code функции, возвращает поле result ответа"""
+        res = await self._post(
+            self.functions_url + name, json=params, read=True
+        )
+
+        if res.status_code != HTTPStatus.OK:
+            raise Back4AppFunctionError(name, res.status_code, res.text)
+
+        return res.json()["result"]
@@ -1,12 +1,19 @@
+import asyncio
 import random
+from collections.abc import Callable, Iterable, Iterator, Sequence
+from contextlib import nullcontext
 from datetime import UTC, datetime, time, timedelta
+from itertools import batched, chain
 from logging import getLogger
+from typing import Any
 
 from faker import Faker
 from tqdm import tqdm
 
-from bass.bass_api import Back4AppApi
+from bass.bass_api import Back4AppApi, BassObject, saved_id
+from bass.bass_api_async import AsyncBack4AppApi
 from bass.models import (
+    REFERENCES,
     ActivationsToDevices,
     CoNEToDevices,
     Devices,
@@ -19,20 +26,29 @@ from bass.models import (
     Users,
     UserTypes,
 )
+from cache import notify_write
+from scale import CHUNK_SIZE, GenerationCounts
+from scheduler import Stage, derive_seed, run_stages
+from shards import ShardPool, shard_faker
 
 logger = getLogger(name=__name__)
 
-random.seed(42)
+type StageFill = Callable[[random.Random, Faker], None]
 
-Faker.seed(42)
+SEED = 42
+
+rng = random.Random(SEED)
 
 fake = Faker("ru_RU")
+fake.seed_instance(SEED)
 
 
-def generate_time_between(hour_start: int, hour_end: int) -> time:
+def generate_time_between(
+    hour_start: int, hour_end: int, *, rng: random.Random = rng
+) -> time:
     """Случайное время в диапазоне часов"""
-    hour = random.randint(hour_start, hour_end)
-    minute = random.randint(0, 59)
+    hour = rng.randint(hour_start, hour_end)
+    minute = rng.randint(0, 59)
     return time(hour, minute)
 
 
@@ -40,25 +56,54 @@ def time_to_int(t: time) -> int:
     return 60 * t.hour + t.minute
 
 
-def create_reference_data(
+async def save_objects_async(
+    back4app_api: AsyncBack4AppApi,
+    objects: Iterable[BassObject],
+    *,
+    batch: bool = False,
+    chunk_size: int = CHUNK_SIZE,
+) -> None:
+    """save_objects для AsyncBack4AppApi: тоже по chunk_size объектов"""
+    for chunk in batched(objects, chunk_size, strict=False):
+        if batch:
+            await back4app_api.create_objects_batch(chunk)
+        else:
+            await back4app_api.create_objects(chunk)
+        notify_write("back4app", {type(obj).__name__ for obj in chunk})
+
+
+def save_objects(
     back4app_api: Back4AppApi,
-) -> tuple[list[UserTypes], list[DeviceTypes]]:
-    """Создаём справочники — их обычно немного и они стабильны"""
+    objects: Iterable[BassObject],
+    *,
+    batch: bool = False,
+    chunk_size: int = CHUNK_SIZE,
+) -> None:
+    """
+    Запись объектов в Back4app: по одному или пачками через /batch.
+    Объекты берутся из objects по chunk_size штук, поэтому генератор
+    не держит в памяти всю таблицу
+    """
+    for chunk in batched(objects, chunk_size, strict=False):
+        if batch:
+            back4app_api.create_objects_batch(chunk)
+        else:
+            for obj in chunk:
+                back4app_api.create_object(obj)
+        notify_write("back4app", {type(obj).__name__ for obj in chunk})
+
 
+def build_user_types() -> list[UserTypes]:
     user_types_data = [
         {"type": "Взрослый"},
         {"type": "Ребёнок"},
         {"type": "Гость"},
         {"type": "Пенсионер"},
     ]
+    return [UserTypes(object_id=None, type=d["type"]) for d in user_types_data]
 
-    user_types: list[UserTypes] = []
-    for user_type in user_types_data:
-        ut = UserTypes(object_id=None, type=user_type["type"])
-        object_id = back4app_api.create_user_types(type_=ut.type)
-        ut.object_id = object_id
-        user_types.append(ut)
 
+def build_device_types() -> list[DeviceTypes]:
     device_types_data = [
         {"type": "light", "name": "Умная лампа"},
         {"type": "socket", "name": "Умная розетка"},
@@ -67,104 +112,144 @@ def create_reference_data(
         {"type": "door", "name": "Датчик открытия двери"},
         {"type": "camera", "name": "Камера"},
     ]
+    return [
+        DeviceTypes(object_id=None, type=d["type"], name=d["name"])
+        for d in device_types_data
+    ]
 
-    device_types: list[DeviceTypes] = []
-    for device_type in device_types_data:
-        dt = DeviceTypes(
-            object_id=None, type=device_type["type"], name=device_type["name"]
-        )
-        object_id = back4app_api.create_device_types(
-            type_=dt.type, name=dt.name
-        )
-        dt.object_id = object_id
-        device_types.append(dt)
 
+def build_associations(
+    user_types: list[UserTypes],
+    device_types: list[DeviceTypes],
+    *,
+    rng: random.Random = rng,
+) -> list[DeviceTypesToUserTypes]:
     associations: list[DeviceTypesToUserTypes] = []
     for dt in tqdm(device_types, desc="device_types"):
-        allowed_user_types = random.sample(
-            user_types, k=random.randint(1, len(user_types))
+        allowed_user_types = rng.sample(
+            user_types, k=rng.randint(1, len(user_types))
         )
         associations.extend(
             DeviceTypesToUserTypes(
                 object_id=None,
-                device_type_id=dt.object_id,
-                user_type_id=ut.object_id,
+                device_type_id=saved_id(dt),
+                user_type_id=saved_id(ut),
             )
             for ut in allowed_user_types
         )
+    return associations
 
-    for association in associations:
-        object_id = back4app_api.create_device_types_to_user_types(
-            device_type_id=association.device_type_id,
-            user_type_id=association.user_type_id,
-        )
-        association.object_id = object_id
 
-    return user_types, device_types
+def build_houses(count_houses: int, *, fake: Faker = fake) -> list[Houses]:
+    return [
+        Houses(object_id=None, address=fake.address())
+        for _ in tqdm(range(count_houses), desc="create_houses")
+    ]
 
 
-def create_houses_and_devices(
-    back4app_api: Back4AppApi,
+def houses_shard(seed: int, count: int) -> list[Houses]:
+    fake = shard_faker(seed)
+    return [
+        Houses(object_id=None, address=fake.address()) for _ in range(count)
+    ]
+
+
+def house_devices(
+    house_id: str,
+    device_type_ids: Sequence[str],
+    devices_per_house: int,
+    *,
+    rng: random.Random = rng,
+) -> list[Devices]:
+    return [
+        Devices(object_id=None, house_id=house_id, device_type_id=dt_id)
+        for dt_id in rng.sample(
+            device_type_ids, k=min(devices_per_house, len(device_type_ids))
+        )
+    ]
+
+
+def build_devices(
+    houses: list[Houses],
     device_types: list[DeviceTypes],
-    count_houses: int = 5,
     devices_per_house: int = 6,
-) -> tuple[list[Houses], list[Devices]]:
-    houses: list[Houses] = []
-    all_devices: list[Devices] = []
-
-    for _ in tqdm(range(count_houses), desc="create_houses_and_devices"):
-        house = Houses(object_id=None, address=fake.address())
-        object_id = back4app_api.create_houses(address=house.address)
-        house.object_id = object_id
-        houses.append(house)
-
-        for dt in random.sample(
-            device_types, k=min(devices_per_house, len(device_types))
-        ):
-            device = Devices(
-                object_id=None,
-                house_id=house.object_id,
-                device_type_id=dt.object_id,
-            )
-            object_id = back4app_api.create_devices(
-                house_id=device.house_id, device_type_id=device.device_type_id
-            )
-            device.object_id = object_id
-            all_devices.append(device)
+    *,
+    rng: random.Random = rng,
+) -> list[Devices]:
+    # fake и random независимы, поэтому адреса домов можно сгенерировать
+    # заранее - устройства получатся те же, что и при поочерёдной генерации
+    device_type_ids = [saved_id(dt) for dt in device_types]
+    return [
+        dev
+        for house in tqdm(houses, desc="create_devices")
+        for dev in house_devices(
+            saved_id(house), device_type_ids, devices_per_house, rng=rng
+        )
+    ]
 
-    return houses, all_devices
 
+def devices_shard(
+    seed: int,
+    house_ids: Sequence[str],
+    device_type_ids: Sequence[str],
+    devices_per_house: int,
+) -> list[Devices]:
+    shard_rng = random.Random(seed)
+    return [
+        dev
+        for house_id in house_ids
+        for dev in house_devices(
+            house_id, device_type_ids, devices_per_house, rng=shard_rng
+        )
+    ]
 
-def create_users(
-    back4app_api: Back4AppApi,
+
+def user_object(
+    user_type_ids: Sequence[str],
+    *,
+    rng: random.Random = rng,
+    fake: Faker = fake,
+) -> Users:
+    ut_id = rng.choice(user_type_ids)
+    return Users(object_id=None, name=fake.name(), user_type_id=ut_id)
+
+
+def build_users(
     user_types: list[UserTypes],
-    count_users: int = 12,
+    count_users: int,
+    *,
+    rng: random.Random = rng,
+    fake: Faker = fake,
 ) -> list[Users]:
-    users: list[Users] = []
-    for _ in tqdm(
-        range(count_users),
-        desc="create_users",
-    ):
-        ut = random.choice(user_types)
-        user = Users(
-            object_id=None, name=fake.name(), user_type_id=ut.object_id
+    user_type_ids = [saved_id(ut) for ut in user_types]
+    return [
+        user_object(user_type_ids, rng=rng, fake=fake)
+        for _ in tqdm(
+            range(count_users),
+            desc="create_users",
         )
-        object_id = back4app_api.create_user(
-            name=user.name, user_type_id=user.user_type_id
-        )
-        user.object_id = object_id
-        users.append(user)
-    return users
+    ]
 
 
-def create_scenarios(
-    back4app_api: Back4AppApi, count_scenarios: int = 8
+def users_shard(
+    seed: int, count: int, user_type_ids: Sequence[str]
+) -> list[Users]:
+    shard_rng = random.Random(seed)
+    shard_fake = shard_faker(seed)
+    return [
+        user_object(user_type_ids, rng=shard_rng, fake=shard_fake)
+        for _ in range(count)
+    ]
+
+
+def build_scenarios(
+    count_scenarios: int, *, rng: random.Random = rng
 ) -> list[Scenarios]:
     scenarios: list[Scenarios] = []
     for _ in tqdm(range(count_scenarios), desc="create_scenarios"):
-        t_from = generate_time_between(6, 22)
+        t_from = generate_time_between(6, 22, rng=rng)
         t_till = (
-            generate_time_between(t_from.hour + 1, 23)
+            generate_time_between(t_from.hour + 1, 23, rng=rng)
             if t_from.hour < 22
             else time(23, 59)
         )
@@ -174,137 +259,524 @@ def create_scenarios(
             time_from=time_to_int(t_from),
             time_till=time_to_int(t_till),
         )
-        object_id = back4app_api.create_scenaries(
-            time_from=sc.time_from, time_till=sc.time_till
-        )
-        sc.object_id = object_id
         scenarios.append(sc)
     return scenarios
 
 
-def create_activations_and_cone(
-    back4app_api: Back4AppApi,
+def build_activations_and_cone(
     devices: list[Devices],
     scenarios: list[Scenarios],
-) -> None:
-    activations = []
-    cones = []
+    *,
+    rng: random.Random = rng,
+) -> tuple[list[ActivationsToDevices], list[CoNEToDevices]]:
+    activations: list[ActivationsToDevices] = []
+    cones: list[CoNEToDevices] = []
 
     for scenario in tqdm(scenarios, desc="create_activations_and_cone"):
-        selected_devices = random.sample(
-            devices, k=random.randint(2, min(6, len(devices)))
+        selected_devices = rng.sample(
+            devices, k=rng.randint(2, min(6, len(devices)))
         )
 
         for dev in selected_devices:
-            if random.random() < 0.75:  # ~75% устройств активируются
-                activation = ActivationsToDevices(
-                    object_id=None,
-                    scenario_id=scenario.object_id,
-                    device_id=dev.object_id,
-                    is_on=bool(random.choice([0, 1])),
-                    affect_time=time_to_int(generate_time_between(0, 23))
-                    if random.random() < 0.4
-                    else None,
-                )
-                object_id = back4app_api.create_activations_to_devices(
-                    scenary_id=activation.scenario_id,
-                    device_id=activation.device_id,
-                    is_on=activation.is_on,
-                    affect_time=activation.affect_time,
-                )
-                activation.object_id = object_id
-                activations.append(activation)
-
-            if random.random() < 0.35:
-                cone = CoNEToDevices(
-                    object_id=None,
-                    scenario_id=scenario.object_id,
-                    device_id=dev.object_id,
-                    is_on=bool(random.choice([0, 1])),
+            if rng.random() < 0.75:  # ~75% устройств активируются
+                activations.append(
+                    ActivationsToDevices(
+                        object_id=None,
+                        scenario_id=saved_id(scenario),
+                        device_id=saved_id(dev),
+                        is_on=bool(rng.choice([0, 1])),
+                        affect_time=time_to_int(
+                            generate_time_between(0, 23, rng=rng)
+                        )
+                        if rng.random() < 0.4
+                        else None,
+                    )
                 )
-                object_id = back4app_api.create_co_ne_to_devises(
-                    scenary_id=cone.scenario_id,
-                    device_id=cone.device_id,
-                    is_on=cone.is_on,
+
+            if rng.random() < 0.35:
+                cones.append(
+                    CoNEToDevices(
+                        object_id=None,
+                        scenario_id=saved_id(scenario),
+                        device_id=saved_id(dev),
+                        is_on=bool(rng.choice([0, 1])),
+                    )
                 )
-                cone.object_id = object_id
-                cones.append(cone)
 
+    return activations, cones
+
+
+def event_object(
+    user_ids: Sequence[str],
+    device_ids: Sequence[str],
+    scenario_ids: Sequence[str],
+    *,
+    rng: random.Random = rng,
+) -> Events:
+    return Events(
+        object_id=None,
+        value=bool(rng.choice([0, 1])),
+        user_id=rng.choice([None, rng.choice(user_ids)]),
+        device_id=rng.choice([None, rng.choice(device_ids)]),
+        scenario_id=rng.choice([None, rng.choice(scenario_ids)]),
+    )
 
-def create_events_and_measures(
-    back4app_api: Back4AppApi,
-    users: list[Users],
-    devices: list[Devices],
-    scenarios: list[Scenarios],
-    count_events: int = 150,
-    count_measures: int = 400,
-) -> None:
-    events = []
-    measures = []
 
-    now = datetime.now(UTC)
+def measure_object(
+    device_ids: Sequence[str],
+    now: datetime,
+    *,
+    rng: random.Random = rng,
+) -> Measures:
+    past = now - timedelta(days=rng.randint(0, 60), hours=rng.randint(0, 23))
+    return Measures(
+        object_id=None,
+        device_id=rng.choice(device_ids),
+        measure_time=int(past.timestamp()),
+        value=int(rng.uniform(0.0, 100.0)),
+    )
+
 
+def iter_events(
+    users: Sequence[Users],
+    devices: Sequence[Devices],
+    scenarios: Sequence[Scenarios],
+    count_events: int,
+    *,
+    rng: random.Random = rng,
+) -> Iterator[Events]:
+    user_ids = [saved_id(user) for user in users]
+    device_ids = [saved_id(dev) for dev in devices]
+    scenario_ids = [saved_id(sc) for sc in scenarios]
     for _ in tqdm(
         range(count_events),
         desc="create_events",
     ):
-        ev = Events(
-            object_id=None,
-            value=bool(random.choice([0, 1])),
-            user_id=random.choice([None, random.choice(users).object_id]),
-            device_id=random.choice([None, random.choice(devices).object_id]),
-            scenario_id=random.choice(
-                [None, random.choice(scenarios).object_id]
-            ),
-        )
-        object_id = back4app_api.create_events(
-            user_id=ev.user_id,
-            device_id=ev.device_id,
-            scenary_id=ev.scenario_id,
-            value=ev.value,
-        )
-        ev.object_id = object_id
-        events.append(ev)
+        yield event_object(user_ids, device_ids, scenario_ids, rng=rng)
+
 
+def iter_measures(
+    devices: Sequence[Devices],
+    count_measures: int,
+    now: datetime,
+    *,
+    rng: random.Random = rng,
+) -> Iterator[Measures]:
+    device_ids = [saved_id(dev) for dev in devices]
     for _ in tqdm(
         range(count_measures),
         desc="create_measures",
     ):
-        past = now - timedelta(
-            days=random.randint(0, 60), hours=random.randint(0, 23)
+        yield measure_object(device_ids, now, rng=rng)
+
+
+def events_shard(
+    seed: int,
+    count: int,
+    user_ids: Sequence[str],
+    device_ids: Sequence[str],
+    scenario_ids: Sequence[str],
+) -> list[Events]:
+    shard_rng = random.Random(seed)
+    return [
+        event_object(user_ids, device_ids, scenario_ids, rng=shard_rng)
+        for _ in range(count)
+    ]
+
+
+def measures_shard(
+    seed: int, count: int, device_ids: Sequence[str], now: datetime
+) -> list[Measures]:
+    shard_rng = random.Random(seed)
+    return [
+        measure_object(device_ids, now, rng=shard_rng) for _ in range(count)
+    ]
+
+
+def create_reference_data(
+    back4app_api: Back4AppApi,
+    *,
+    batch: bool = False,
+    rng: random.Random = rng,
+) -> tuple[list[UserTypes], list[DeviceTypes]]:
+    """Создаём справочники — их обычно немного и они стабильны"""
+    user_types = build_user_types()
+    save_objects(back4app_api, user_types, batch=batch)
+
+    device_types = build_device_types()
+    save_objects(back4app_api, device_types, batch=batch)
+
+    associations = build_associations(user_types, device_types, rng=rng)
+    save_objects(back4app_api, associations, batch=batch)
+
+    return user_types, device_types
+
+
+def create_houses(
+    back4app_api: Back4AppApi,
+    count_houses: int = 5,
+    *,
+    batch: bool = False,
+    fake: Faker = fake,
+    pool: ShardPool | None = None,
+) -> list[Houses]:
+    houses = (
+        list(pool.generate(houses_shard, "create_houses", count_houses))
+        if pool is not None
+        else build_houses(count_houses, fake=fake)
+    )
+    save_objects(back4app_api, houses, batch=batch)
+    return houses
+
+
+def create_devices(  # noqa: PLR0913
+    back4app_api: Back4AppApi,
+    houses: list[Houses],
+    device_types: list[DeviceTypes],
+    devices_per_house: int = 6,
+    *,
+    batch: bool = False,
+    rng: random.Random = rng,
+    pool: ShardPool | None = None,
+) -> list[Devices]:
+    if pool is None:
+        devices = build_devices(
+            houses, device_types, devices_per_house, rng=rng
         )
-        meas = Measures(
-            object_id=None,
-            device_id=random.choice(devices).object_id,
-            measure_time=int(past.timestamp()),
-            value=int(random.uniform(0.0, 100.0)),
+    else:
+        # шард - chunk_size домов со всеми их устройствами
+        house_ids = [saved_id(house) for house in houses]
+        device_type_ids = [saved_id(dt) for dt in device_types]
+        shards = (
+            (
+                house_ids[start : start + pool.chunk_size],
+                device_type_ids,
+                devices_per_house,
+            )
+            for start in range(0, len(house_ids), pool.chunk_size)
+        )
+        devices = list(
+            chain.from_iterable(
+                pool.map_shards(devices_shard, "create_devices", shards)
+            )
         )
-        object_id = back4app_api.create_measures(
-            device_id=meas.device_id,
-            measure_time=meas.measure_time,
-            value=meas.value,
+    save_objects(back4app_api, devices, batch=batch)
+    return devices
+
+
+def create_users(  # noqa: PLR0913
+    back4app_api: Back4AppApi,
+    user_types: list[UserTypes],
+    count_users: int = 12,
+    *,
+    batch: bool = False,
+    rng: random.Random = rng,
+    fake: Faker = fake,
+    pool: ShardPool | None = None,
+) -> list[Users]:
+    users = (
+        list(
+            pool.generate(
+                users_shard,
+                "create_users",
+                count_users,
+                [saved_id(ut) for ut in user_types],
+            )
         )
-        meas.object_id = object_id
-        measures.append(meas)
+        if pool is not None
+        else build_users(user_types, count_users, rng=rng, fake=fake)
+    )
+    save_objects(back4app_api, users, batch=batch)
+    return users
+
+
+def create_scenarios(
+    back4app_api: Back4AppApi,
+    count_scenarios: int = 8,
+    *,
+    batch: bool = False,
+    rng: random.Random = rng,
+) -> list[Scenarios]:
+    scenarios = build_scenarios(count_scenarios, rng=rng)
+    save_objects(back4app_api, scenarios, batch=batch)
+    return scenarios
 
 
-def populate_bass(
-    back4app_api: Back4AppApi, *, clear_first: bool = True
+def create_activations_and_cone(
+    back4app_api: Back4AppApi,
+    devices: list[Devices],
+    scenarios: list[Scenarios],
+    *,
+    batch: bool = False,
+    rng: random.Random = rng,
+) -> None:
+    activations, cones = build_activations_and_cone(
+        devices, scenarios, rng=rng
+    )
+    save_objects(back4app_api, activations, batch=batch)
+    save_objects(back4app_api, cones, batch=batch)
+
+
+def create_events_and_measures(  # noqa: PLR0913
+    back4app_api: Back4AppApi,
+    users: list[Users],
+    devices: list[Devices],
+    scenarios: list[Scenarios],
+    *,
+    count_events: int = 150,
+    count_measures: int = 400,
+    batch: bool = False,
+    chunk_size: int = CHUNK_SIZE,
+    rng: random.Random = rng,
+    pool: ShardPool | None = None,
 ) -> None:
+    now = datetime.now(UTC)
+
+    events: Iterable[Events]
+    measures: Iterable[Measures]
+    if pool is None:
+        events = iter_events(users, devices, scenarios, count_events, rng=rng)
+        measures = iter_measures(devices, count_measures, now, rng=rng)
+    else:
+        device_ids = [saved_id(dev) for dev in devices]
+        events = pool.generate(
+            events_shard,
+            "create_events",
+            count_events,
+            [saved_id(user) for user in users],
+            device_ids,
+            [saved_id(sc) for sc in scenarios],
+        )
+        measures = pool.generate(
+            measures_shard, "create_measures", count_measures, device_ids, now
+        )
+
+    save_objects(back4app_api, events, batch=batch, chunk_size=chunk_size)
+    save_objects(back4app_api, measures, batch=batch, chunk_size=chunk_size)
+
+
+def class_references() -> dict[str, list[str]]:
+    """Класс -> классы, на которые он ссылается указателями"""
+    return {
+        model.__name__: [ref.__name__ for ref in refs]
+        for model, refs in REFERENCES.items()
+    }
+
+
+def stage_runner(
+    name: str, fill: StageFill, *, parallel: bool
+) -> Callable[[], None]:
     """
-    Основная функция - запуск всего генератора
+    Запуск этапа: последовательно - с общими rng и fake,
+    параллельно - со своими, от seed этапа
     """
 
-    user_types, device_types = create_reference_data(back4app_api)
-    houses, devices = create_houses_and_devices(
-        back4app_api, device_types, count_houses=200
+    def run() -> None:
+        if not parallel:
+            fill(rng, fake)
+            return
+
+        stage_fake = Faker("ru_RU")
+        stage_fake.seed_instance(derive_seed(SEED, name))
+        fill(random.Random(derive_seed(SEED, name)), stage_fake)
+
+    return run
+
+
+def populate_bass(  # noqa: PLR0913
+    back4app_api: Back4AppApi,
+    *,
+    clear_first: bool = True,
+    batch: bool = False,
+    max_workers: int = 1,
+    scale_factor: float = 1.0,
+    chunk_size: int = CHUNK_SIZE,
+    processes: int = 1,
+) -> dict[str, float]:
+    """
+    Основная функция - запуск всего генератора.
+    batch=True - запись всех таблиц через /batch (до 50 объектов за запрос).
+    Порядок этапов выводится из указателей между классами bass.models,
+    max_workers > 1 - независимые этапы выполняются параллельно, каждый
+    со своим seed (данные воспроизводимы, но отличаются
+    от последовательного режима).
+    scale_factor умножает количество всех сущностей. События и измерения
+    генерируются лениво и отправляются пачками по chunk_size, остальные
+    таблицы держатся в памяти - на них ссылаются указатели по objectId.
+    processes > 1 - дома, устройства, пользователи, события и измерения
+    генерируются шардами по chunk_size в пуле процессов.
+    Возвращает время выполнения этапов
+    """
+    parallel = max_workers > 1
+    counts = GenerationCounts.scaled(scale_factor)
+    data: dict[str, Any] = {}
+
+    def reference(rng: random.Random, _: Faker) -> None:
+        data["user_types"], data["device_types"] = create_reference_data(
+            back4app_api, batch=batch, rng=rng
+        )
+
+    def houses(_: random.Random, fake: Faker) -> None:
+        data["houses"] = create_houses(
+            back4app_api,
+            count_houses=counts.houses,
+            batch=batch,
+            fake=fake,
+            pool=pool,
+        )
+
+    def devices(rng: random.Random, _: Faker) -> None:
+        data["devices"] = create_devices(
+            back4app_api,
+            data["houses"],
+            data["device_types"],
+            batch=batch,
+            rng=rng,
+            pool=pool,
+        )
+
+    def users(rng: random.Random, fake: Faker) -> None:
+        data["users"] = create_users(
+            back4app_api,
+            data["user_types"],
+            count_users=counts.users,
+            batch=batch,
+            rng=rng,
+            fake=fake,
+            pool=pool,
+        )
+
+    def scenarios(rng: random.Random, _: Faker) -> None:
+        data["scenarios"] = create_scenarios(
+            back4app_api,
+            count_scenarios=counts.scenarios,
+            batch=batch,
+            rng=rng,
+        )
+
+    def activations_and_cone(rng: random.Random, _: Faker) -> None:
+        create_activations_and_cone(
+            back4app_api,
+            data["devices"],
+            data["scenarios"],
+            batch=batch,
+            rng=rng,
+        )
+
+    def events_and_measures(rng: random.Random, _: Faker) -> None:
+        create_events_and_measures(
+            back4app_api,
+            data["users"],
+            data["devices"],
+            data["scenarios"],
+            count_events=counts.events,
+            count_measures=counts.measures,
+            batch=batch,
+            chunk_size=chunk_size,
+            rng=rng,
+            pool=pool,
+        )
+
+    stages = [
+        Stage(
+            name,
+            tuple(model.__name__ for model in models),
+            stage_runner(name, fill, parallel=parallel),
+        )
+        for name, models, fill in (
+            (
+                "reference",
+                (UserTypes, DeviceTypes, DeviceTypesToUserTypes),
+                reference,
+            ),
+            ("houses", (Houses,), houses),
+            ("devices", (Devices,), devices),
+            ("users", (Users,), users),
+            ("scenarios", (Scenarios,), scenarios),
+            (
+                "activations_and_cone",
+                (ActivationsToDevices, CoNEToDevices),
+                activations_and_cone,
+            ),
+            ("events_and_measures", (Events, Measures), events_and_measures),
+        )
+    ]
+    with (
+        ShardPool(processes, SEED, chunk_size=chunk_size)
+        if processes > 1
+        else nullcontext()
+    ) as pool:
+        timings = run_stages(
+            stages, class_references(), max_workers=max_workers
+        )
+
+    log_generated(
+        data["houses"], data["devices"], data["users"], data["scenarios"]
     )
-    users = create_users(back4app_api, user_types, count_users=200)
-    scenarios = create_scenarios(back4app_api, count_scenarios=50)
+    return timings
+
+
+async def populate_bass_async(
+    back4app_api: AsyncBack4AppApi,
+    *,
+    batch: bool = False,
+    scale_factor: float = 1.0,
+    chunk_size: int = CHUNK_SIZE,
+) -> None:
+    """
+    Асинхронный генератор. Таблицы одного уровня зависимостей
+    записываются параллельно, а random вызывается в том же порядке,
+    что и в populate_bass, поэтому данные совпадают.
+    События и измерения генерируются лениво и отправляются пачками
+    по chunk_size
+    """
+    counts = GenerationCounts.scaled(scale_factor)
 
-    create_activations_and_cone(back4app_api, devices, scenarios)
-    create_events_and_measures(back4app_api, users, devices, scenarios)
+    async def save(*groups: Iterable[BassObject]) -> None:
+        await asyncio.gather(
+            *(
+                save_objects_async(
+                    back4app_api, objects, batch=batch, chunk_size=chunk_size
+                )
+                for objects in groups
+            )
+        )
 
+    # Уровень 0: без внешних ключей
+    user_types = build_user_types()
+    device_types = build_device_types()
+    houses = build_houses(count_houses=counts.houses)
+    await save(user_types, device_types, houses)
+
+    # Уровень 1: ссылаются на справочники и дома
+    associations = build_associations(user_types, device_types)
+    devices = build_devices(houses, device_types)
+    users = build_users(user_types, count_users=counts.users)
+    scenarios = build_scenarios(count_scenarios=counts.scenarios)
+    await save(associations, devices, users, scenarios)
+
+    # Уровень 2: ссылаются на устройства, пользователей и сценарии
+    # События и измерения - друг за другом: генераторы берут random
+    # по мере отправки, и параллельно их вызовы перемешались бы
+    activations, cones = build_activations_and_cone(devices, scenarios)
+    events = iter_events(users, devices, scenarios, counts.events)
+    measures = iter_measures(devices, counts.measures, datetime.now(UTC))
+
+    async def save_in_order() -> None:
+        await save(events)
+        await save(measures)
+
+    await asyncio.gather(save(activations, cones), save_in_order())
+
+    log_generated(houses, devices, users, scenarios)
+
+
+def log_generated(
+    houses: list[Houses],
+    devices: list[Devices],
+    users: list[Users],
+    scenarios: list[Scenarios],
+) -> None:
     log = (
         f"Сгенерировано:\n"
         f"  домов       : {len(houses)}\n"
@@ -162,6 +162,201 @@ Parse.Cloud.define("getMaxThermostatValue", async (request) => {
     return result;
 });
 
+async function controllableDevices(pairs) {
+    // Устройства домов, которыми могут управлять пользователи, для пар
+    // { userId, houseId }: три запроса на все пары, без загрузки
+    // указателей по одному
+    const useMaster = { useMasterKey: true };
+    const userIds = [...new Set(pairs.map(pair => pair.userId))];
+    const houseIds = [...new Set(pairs.map(pair => pair.houseId))];
+
+    const userQuery = new Parse.Query("Users");
+    userQuery.containedIn("objectId", userIds);
+    userQuery.limit(userIds.length);
+    const users = await userQuery.find(useMaster);
+
+    const userTypeByUser = new Map();
+    users.forEach(user => {
+        const userType = user.get("user_type_id");
+        if (userType) {
+            userTypeByUser.set(user.id, userType.id);
+        }
+    });
+
+    const UserType = Parse.Object.extend("UserTypes");
+    const linkQuery = new Parse.Query("DeviceTypesToUserTypes");
+    linkQuery.containedIn(
+        "user_type_id",
+        [...new Set(userTypeByUser.values())].map(id => UserType.createWithoutData(id))
+    );
+    linkQuery.include("device_type_id");
+    linkQuery.limit(10000);
+    const links = await linkQuery.find(useMaster);
+
+    // тип пользователя -> Set id типов устройств, тип устройства по id
+    const allowed = new Map();
+    const deviceTypes = new Map();
+    links.forEach(link => {
+        const userType = link.get("user_type_id");
+        const deviceType = link.get("device_type_id");
+        if (!userType || !deviceType) {
+            return;
+        }
+        if (!allowed.has(userType.id)) {
+            allowed.set(userType.id, new Set());
+        }
+        allowed.get(userType.id).add(deviceType.id);
+        deviceTypes.set(deviceType.id, deviceType);
+    });
+
+    const House = Parse.Object.extend("Houses");
+    const DeviceType = Parse.Object.extend("DeviceTypes");
+    const deviceQuery = new Parse.Query("Devices");
+    deviceQuery.containedIn("house_id", houseIds.map(id => House.createWithoutData(id)));
+    deviceQuery.containedIn(
+        "device_type_id",
+        [...deviceTypes.keys()].map(id => DeviceType.createWithoutData(id))
+    );
+    deviceQuery.ascending("objectId");
+    deviceQuery.limit(10000);
+    const devices = await deviceQuery.find(useMaster);
+
+    const devicesByHouse = new Map();
+    devices.forEach(device => {
+        const houseId = device.get("house_id")?.id;
+        if (!devicesByHouse.has(houseId)) {
+            devicesByHouse.set(houseId, []);
+        }
+        devicesByHouse.get(houseId).push(device);
+    });
+
+    return pairs.map(({ userId, houseId }) => {
+        const types = allowed.get(userTypeByUser.get(userId)) ?? new Set();
+        const result = (devicesByHouse.get(houseId) ?? [])
+            .filter(device => types.has(device.get("device_type_id")?.id))
+            .map(device => {
+                const deviceType = deviceTypes.get(device.get("device_type_id").id);
+                return {
+                    objectId: device.id,
+                    deviceType: deviceType.get("type"),
+                    deviceName: deviceType.get("name")
+                };
+            });
+        return { userId, houseId, devices: result };
+    });
+}
+
+Parse.Cloud.define("findControllableDevices", async (request) => {
+    // Устройства дома houseId, которыми может управлять пользователь userId
+    const { userId, houseId } = request.params;
+    if (!userId || !houseId) {
+        throw new Parse.Error(Parse.Error.INVALID_QUERY, "Не передан userId или houseId");
+    }
+    const [result] = await controllableDevices([{ userId, houseId }]);
+    return result.devices;
+});
+
+Parse.Cloud.define("findControllableDevicesBatch", async (request) => {
+    // То же для списка пар pairs: [{ userId, houseId }]
+    const pairs = request.params.pairs || [];
+    if (pairs.length === 0) {
+        return [];
+    }
+    return await controllableDevices(pairs);
+});
+
+function measuresQuery(params) {
+    // Измерения устройства deviceId или дома houseId за [from, till)
+    const query = new Parse.Query("Measures");
+    if (params.deviceId) {
+        const Device = Parse.Object.extend("Devices");
+        query.equalTo("device_id", Device.createWithoutData(params.deviceId));
+    } else if (params.houseId) {
+        const House = Parse.Object.extend("Houses");
+        const deviceQuery = new Parse.Query("Devices");
+        deviceQuery.equalTo("house_id", House.createWithoutData(params.houseId));
+        query.matchesQuery("device_id", deviceQuery);
+    } else {
+        throw new Parse.Error(Parse.Error.INVALID_QUERY, "Не передан deviceId или houseId");
+    }
+    query.greaterThanOrEqualTo("measure_time", params.from);
+    query.lessThan("measure_time", params.till);
+    return query;
+}
+
+Parse.Cloud.define("getMeasures", async (request) => {
+    // Измерения за период страницами: следующая страница - после
+    // (measure_time, objectId) последнего измерения, без skip
+    const { afterTime, afterId } = request.params;
+    const limit = request.params.limit || 1000;
+
+    let query = measuresQuery(request.params);
+    if (afterTime !== undefined && afterTime !== null) {
+        const later = measuresQuery(request.params);
+        later.greaterThan("measure_time", afterTime);
+        const sameTime = measuresQuery(request.params);
+        sameTime.equalTo("measure_time", afterTime);
+        sameTime.greaterThan("objectId", afterId);
+        query = Parse.Query.or(later, sameTime);
+    }
+    query.ascending("measure_time");
+    query.addAscending("objectId");
+    query.limit(limit);
+
+    const measures = await query.find({ useMasterKey: true });
+
+    const result = measures.map(measure => ({
+        objectId: measure.id,
+        device_id: measure.get("device_id")?.id ?? null,
+        measure_time: measure.get("measure_time"),
+        value: measure.get("value")
+    }));
+
+    const last = measures[measures.length - 1];
+    const next = measures.length === limit
+        ? { afterTime: last.get("measure_time"), afterId: last.id }
+        : null;
+
+    return { measures: result, next };
+});
+
+Parse.Cloud.define("getMeasureBuckets", async (request) => {
+    // avg/min/max за интервалы bucketMinutes минут от from,
+    // интервалы без измерений пропускаются
+    const { from, bucketMinutes } = request.params;
+    const bucketSeconds = bucketMinutes * 60;
+    const buckets = new Map();
+
+    await measuresQuery(request.params).each(measure => {
+        const value = measure.get("value");
+        if (value === undefined || value === null) {
+            return;
+        }
+        const bucket = Math.floor((measure.get("measure_time") - from) / bucketSeconds);
+        const stats = buckets.get(bucket);
+        if (!stats) {
+            buckets.set(bucket, { sum: value, min: value, max: value, count: 1 });
+            return;
+        }
+        stats.sum += value;
+        stats.min = Math.min(stats.min, value);
+        stats.max = Math.max(stats.max, value);
+        stats.count += 1;
+    }, { useMasterKey: true });
+
+    const result = Array.from(buckets.entries())
+        .sort((a, b) => a[0] - b[0])
+        .map(([bucket, stats]) => ({
+            start: from + bucket * bucketSeconds,
+            avg: stats.sum / stats.count,
+            min: stats.min,
+            max: stats.max,
+            count: stats.count
+        }));
+
+    return { buckets: result };
+});
+
 Parse.Cloud.define("ping", async (request) => {
     // Проверка работы сервера
     return { status: "alive", receivedParams: request.params };
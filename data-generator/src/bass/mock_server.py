@@ -0,0 +1,859 @@
+import json
+import math
+import operator
+import random
+import string
+import threading
+import time
+from collections import defaultdict
+from collections.abc import Callable, Iterable, Mapping, Sequence
+from dataclasses import dataclass, field
+from datetime import UTC, datetime
+from http import HTTPStatus
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from logging import getLogger
+from typing import Any, Self, TypeGuard, override
+from urllib.parse import parse_qsl, urlsplit
+
+from bass.bass_api import BATCH_SIZE, pointer
+
+logger = getLogger(name=__name__)
+
+# Коды ошибок Parse Server
+INTERNAL_SERVER_ERROR = 1
+OBJECT_NOT_FOUND = 101
+INVALID_QUERY = 102
+INVALID_JSON = 107
+SCRIPT_FAILED = 141
+REQUEST_LIMIT_EXCEEDED = 155
+
+# Parse без limit отдаёт 100 объектов
+DEFAULT_LIMIT = 100
+
+# Число параметров распределений задержки
+LATENCY_PARAMS = {
+    "constant": 1,
+    "uniform": 2,
+    "normal": 2,
+    "lognormal": 2,
+    "exponential": 1,
+}
+
+OBJECT_ID_ALPHABET = string.digits + string.ascii_lowercase
+
+type ParseObject = dict[str, Any]
+type CloudFunction = Callable[[ParseStore, dict[str, Any]], Any]
+type Response = tuple[HTTPStatus, dict[str, str], Any]
+
+
+class ParseError(Exception):
+    def __init__(self, code: int, message: str) -> None:
+        super().__init__(f"{code} {message}")
+        self.code = code
+        self.message = message
+
+
+def object_id(number: int) -> str:
+    """Счётчик в base36: objectId сортируются в порядке создания"""
+    digits = ""
+    while number:
+        number, digit = divmod(number, len(OBJECT_ID_ALPHABET))
+        digits = OBJECT_ID_ALPHABET[digit] + digits
+    return digits.rjust(10, "0")
+
+
+def is_pointer(value: object) -> TypeGuard[dict[str, Any]]:
+    return isinstance(value, dict) and value.get("__type") in {
+        "Pointer",
+        "Object",
+    }
+
+
+def plain_value(value: Any) -> Any:  # noqa: ANN401
+    """Указатель сравнивается по objectId, дата - по строке ISO"""
+    if is_pointer(value):
+        return value["objectId"]
+    if isinstance(value, dict) and value.get("__type") == "Date":
+        return value["iso"]
+    return value
+
+
+ORDERINGS: dict[str, Callable[[Any, Any], bool]] = {
+    "$gt": operator.gt,
+    "$gte": operator.ge,
+    "$lt": operator.lt,
+    "$lte": operator.le,
+}
+
+
+# Операторы, которые проверяют и отсутствующее значение
+VALUE_CHECKS: dict[str, Callable[[Any, Any], bool]] = {
+    "$exists": lambda value, arg: (value is not None) == bool(arg),
+    "$in": lambda value, arg: value in arg,
+    "$nin": lambda value, arg: value not in arg,
+    "$ne": lambda value, arg: bool(value != plain_value(arg)),
+}
+
+
+def check(op: str, value: Any, arg: Any) -> bool:  # noqa: ANN401
+    value_check = VALUE_CHECKS.get(op)
+    if value_check is not None:
+        return value_check(value, arg)
+    compare = ORDERINGS.get(op)
+    if compare is None:
+        raise ParseError(INVALID_QUERY, f"Неподдерживаемый оператор {op}")
+    if value is None:
+        return False
+    try:
+        return compare(value, plain_value(arg))
+    except TypeError:
+        return False
+
+
+def prepare_where(where: Mapping[str, Any]) -> dict[str, Any]:
+    """$in и $nin - множества: условие проверяется на каждом объекте"""
+    prepared: dict[str, Any] = {}
+    for key, condition in where.items():
+        if key == "$or":
+            prepared[key] = [prepare_where(sub) for sub in condition]
+        elif isinstance(condition, dict) and "__type" not in condition:
+            prepared[key] = {
+                op: frozenset(map(plain_value, arg))
+                if op in {"$in", "$nin"}
+                else arg
+                for op, arg in condition.items()
+            }
+        else:
+            prepared[key] = condition
+    return prepared
+
+
+def matches(obj: ParseObject, where: Mapping[str, Any]) -> bool:
+    """
+    Условие where после prepare_where: равенство,
+    $in/$nin/$ne/$gt/$gte/$lt/$lte, $or
+    """
+    for key, condition in where.items():
+        if key == "$or":
+            if not any(matches(obj, sub) for sub in condition):
+                return False
+            continue
+        value = plain_value(obj.get(key))
+        if not isinstance(condition, dict) or "__type" in condition:
+            if value != plain_value(condition):
+                return False
+            continue
+        if not all(check(op, value, arg) for op, arg in condition.items()):
+            return False
+    return True
+
+
+def order_key(name: str) -> Callable[[ParseObject], tuple[bool, Any]]:
+    """null раньше значений, как в MongoDB"""
+
+    def key(obj: ParseObject) -> tuple[bool, Any]:
+        value = plain_value(obj.get(name))
+        return value is not None, value
+
+    return key
+
+
+def sort_objects(objects: list[ParseObject], order: str) -> None:
+    """order как в Parse: "-value,objectId" """
+    for name in reversed(order.split(",")):
+        objects.sort(
+            key=order_key(name.removeprefix("-")),
+            reverse=name.startswith("-"),
+        )
+
+
+class ParseStore:
+    """
+    Объекты классов Parse в памяти. Потокобезопасен, созданный объект
+    не изменяется - в ответы попадает без копирования
+    """
+
+    def __init__(self) -> None:
+        self._classes: defaultdict[str, dict[str, ParseObject]] = defaultdict(
+            dict
+        )
+        self._lock = threading.Lock()
+        self._created = 0
+
+    def counts(self) -> dict[str, int]:
+        with self._lock:
+            return {name: len(objs) for name, objs in self._classes.items()}
+
+    def create(self, class_name: str, body: Mapping[str, Any]) -> ParseObject:
+        """Ответ Parse на создание: objectId и createdAt"""
+        now = datetime.now(UTC).isoformat(timespec="milliseconds")
+        created_at = now.replace("+00:00", "Z")
+        with self._lock:
+            self._created += 1
+            new_id = object_id(self._created)
+            self._classes[class_name][new_id] = {
+                **body,
+                "objectId": new_id,
+                "createdAt": created_at,
+                "updatedAt": created_at,
+            }
+        return {"objectId": new_id, "createdAt": created_at}
+
+    def get(self, class_name: str, obj_id: str) -> ParseObject | None:
+        with self._lock:
+            return self._classes.get(class_name, {}).get(obj_id)
+
+    def find(  # noqa: PLR0913
+        self,
+        class_name: str,
+        where: Mapping[str, Any] | None = None,
+        *,
+        include: Iterable[str] = (),
+        order: str = "",
+        limit: int | None = DEFAULT_LIMIT,
+        skip: int = 0,
+    ) -> list[ParseObject]:
+        """limit=None - все объекты, как query.each в Cloud Code"""
+        if where is not None:
+            where = prepare_where(where)
+        with self._lock:
+            objects = [
+                obj
+                for obj in self._classes.get(class_name, {}).values()
+                if where is None or matches(obj, where)
+            ]
+        if order:
+            sort_objects(objects, order)
+        include = tuple(include)
+        return [
+            self.expand(obj, include) if include else obj
+            for obj in objects[skip : None if limit is None else skip + limit]
+        ]
+
+    def expand(self, obj: ParseObject, include: Iterable[str]) -> ParseObject:
+        """Указатели из include ("a.b" - вложенные) заменяются объектами"""
+        nested: defaultdict[str, list[str]] = defaultdict(list)
+        for path in include:
+            name, _, rest = path.partition(".")
+            nested[name].extend(filter(None, [rest]))
+
+        result = dict(obj)
+        for name, paths in nested.items():
+            ref = result.get(name)
+            if not is_pointer(ref):
+                continue
+            target = self.get(ref["className"], ref["objectId"])
+            if target is not None:
+                result[name] = {
+                    "__type": "Object",
+                    "className": ref["className"],
+                    **self.expand(target, paths),
+                }
+        return result
+
+
+# Функции Cloud Code - те же запросы и ответы, что в main.js
+
+
+def find_user_device_types(
+    store: ParseStore, params: dict[str, Any]
+) -> list[dict[str, Any]] | dict[str, Any]:
+    user_name = params.get("name")
+    if not user_name:
+        return {"results": [], "message": "Не передан параметр name"}
+
+    users = store.find(
+        "Users", {"name": user_name}, include=("user_type_id",), limit=1
+    )
+    if not users:
+        return {"results": [], "message": "Пользователь не найден"}
+    user = users[0]
+    user_type = user.get("user_type_id")
+    if not user_type:
+        return {"results": [], "message": "У пользователя нет типа"}
+
+    links = store.find(
+        "DeviceTypesToUserTypes",
+        {"user_type_id": user_type},
+        include=("user_type_id", "device_type_id"),
+    )
+    return [
+        {
+            "userName": user["name"],
+            "userType": (link.get("user_type_id") or {}).get("type"),
+            "deviceType": (link.get("device_type_id") or {}).get("type"),
+            "deviceName": (link.get("device_type_id") or {}).get("name"),
+        }
+        for link in links
+    ]
+
+
+def get_houses_with_activated_devices(
+    store: ParseStore, _: dict[str, Any]
+) -> dict[str, Any]:
+    activations = store.find("ActivationsToDevices", include=("device_id",))
+    if not activations:
+        return {"houses": [], "count": 0, "message": "No activations found"}
+
+    device_ids = list(
+        dict.fromkeys(
+            atd["device_id"]["objectId"]
+            for atd in activations
+            if is_pointer(atd.get("device_id"))
+        )
+    )
+    devices = store.find(
+        "Devices", {"objectId": {"$in": device_ids}}, include=("house_id",)
+    )
+    houses = {
+        device["house_id"]["objectId"]: device["house_id"]
+        for device in devices
+        if is_pointer(device.get("house_id"))
+    }
+    return {
+        "houses": [
+            {"objectId": house_id, "address": house.get("address")}
+            for house_id, house in houses.items()
+        ]
+    }
+
+
+def get_max_thermostat_value(
+    store: ParseStore, _: dict[str, Any]
+) -> dict[str, Any]:
+    thermostats = store.find("DeviceTypes", {"type": "thermostat"}, limit=1)
+    if not thermostats:
+        raise ParseError(OBJECT_NOT_FOUND, "Thermostat device type not found")
+
+    devices = store.find(
+        "Devices",
+        {"device_type_id": pointer("DeviceTypes", thermostats[0]["objectId"])},
+    )
+    if not devices:
+        return {"message": "No thermostat devices found"}
+
+    measures = store.find(
+        "Measures",
+        {"device_id": {"$in": [device["objectId"] for device in devices]}},
+        include=("device_id.house_id", "device_id"),
+        order="-value",
+        limit=1,
+    )
+    if not measures:
+        return {"message": "No measurements found for thermostats"}
+
+    top = measures[0]
+    house = (top.get("device_id") or {}).get("house_id")
+    return {
+        "address": house.get("address") if is_pointer(house) else None,
+        "measure_time": top.get("measure_time"),
+        "value": top.get("value"),
+    }
+
+
+def controllable_devices(
+    store: ParseStore, pairs: Sequence[Mapping[str, str]]
+) -> list[dict[str, Any]]:
+    user_ids = list(dict.fromkeys(pair["userId"] for pair in pairs))
+    house_ids = list(dict.fromkeys(pair["houseId"] for pair in pairs))
+
+    users = store.find(
+        "Users", {"objectId": {"$in": user_ids}}, limit=len(user_ids)
+    )
+    user_type_by_user = {
+        user["objectId"]: user["user_type_id"]["objectId"]
+        for user in users
+        if is_pointer(user.get("user_type_id"))
+    }
+
+    links = store.find(
+        "DeviceTypesToUserTypes",
+        {"user_type_id": {"$in": list(set(user_type_by_user.values()))}},
+        include=("device_type_id",),
+        limit=10000,
+    )
+    allowed: defaultdict[str, set[str]] = defaultdict(set)
+    device_types: dict[str, ParseObject] = {}
+    for link in links:
+        user_type = link.get("user_type_id")
+        device_type = link.get("device_type_id")
+        if not is_pointer(user_type) or not is_pointer(device_type):
+            continue
+        allowed[user_type["objectId"]].add(device_type["objectId"])
+        device_types[device_type["objectId"]] = device_type
+
+    devices = store.find(
+        "Devices",
+        {
+            "house_id": {"$in": house_ids},
+            "device_type_id": {"$in": list(device_types)},
+        },
+        order="objectId",
+        limit=10000,
+    )
+    devices_by_house: defaultdict[str, list[ParseObject]] = defaultdict(list)
+    for device in devices:
+        devices_by_house[device["house_id"]["objectId"]].append(device)
+
+    result = []
+    for pair in pairs:
+        types = allowed.get(user_type_by_user.get(pair["userId"], ""), set())
+        result.append(
+            {
+                "userId": pair["userId"],
+                "houseId": pair["houseId"],
+                "devices": [
+                    {
+                        "objectId": device["objectId"],
+                        "deviceType": device_types[type_id]["type"],
+                        "deviceName": device_types[type_id]["name"],
+                    }
+                    for device in devices_by_house[pair["houseId"]]
+                    if (type_id := device["device_type_id"]["objectId"])
+                    in types
+                ],
+            }
+        )
+    return result
+
+
+def find_controllable_devices(
+    store: ParseStore, params: dict[str, Any]
+) -> list[dict[str, Any]]:
+    if not params.get("userId") or not params.get("houseId"):
+        raise ParseError(INVALID_QUERY, "Не передан userId или houseId")
+    [result] = controllable_devices(store, [params])
+    devices: list[dict[str, Any]] = result["devices"]
+    return devices
+
+
+def find_controllable_devices_batch(
+    store: ParseStore, params: dict[str, Any]
+) -> list[dict[str, Any]]:
+    pairs = params.get("pairs") or []
+    return controllable_devices(store, pairs) if pairs else []
+
+
+def measures_where(
+    store: ParseStore, params: Mapping[str, Any]
+) -> dict[str, Any]:
+    """Измерения устройства deviceId или дома houseId за [from, till)"""
+    if params.get("deviceId"):
+        where: dict[str, Any] = {
+            "device_id": pointer("Devices", params["deviceId"])
+        }
+    elif params.get("houseId"):
+        devices = store.find(
+            "Devices",
+            {"house_id": pointer("Houses", params["houseId"])},
+            limit=10000,
+        )
+        where = {
+            "device_id": {"$in": [device["objectId"] for device in devices]}
+        }
+    else:
+        raise ParseError(INVALID_QUERY, "Не передан deviceId или houseId")
+    where["measure_time"] = {"$gte": params["from"], "$lt": params["till"]}
+    return where
+
+
+def get_measures(store: ParseStore, params: dict[str, Any]) -> dict[str, Any]:
+    limit = params.get("limit") or 1000
+    where = measures_where(store, params)
+    after_time = params.get("afterTime")
+    if after_time is not None:
+        later = {
+            **where,
+            "measure_time": {**where["measure_time"], "$gt": after_time},
+        }
+        same_time = {
+            **where,
+            "measure_time": after_time,
+            "objectId": {"$gt": params.get("afterId")},
+        }
+        where = {"$or": [later, same_time]}
+
+    measures = store.find(
+        "Measures", where, order="measure_time,objectId", limit=limit
+    )
+    last = measures[-1] if len(measures) == limit else None
+    return {
+        "measures": [
+            {
+                "objectId": measure["objectId"],
+                "device_id": plain_value(measure.get("device_id")),
+                "measure_time": measure.get("measure_time"),
+                "value": measure.get("value"),
+            }
+            for measure in measures
+        ],
+        "next": None
+        if last is None
+        else {"afterTime": last["measure_time"], "afterId": last["objectId"]},
+    }
+
+
+def get_measure_buckets(
+    store: ParseStore, params: dict[str, Any]
+) -> dict[str, Any]:
+    start = params["from"]
+    bucket_seconds = params["bucketMinutes"] * 60
+    buckets: defaultdict[int, list[float]] = defaultdict(list)
+    for measure in store.find(
+        "Measures", measures_where(store, params), limit=None
+    ):
+        if measure.get("value") is not None:
+            bucket = (measure["measure_time"] - start) // bucket_seconds
+            buckets[bucket].append(measure["value"])
+    return {
+        "buckets": [
+            {
+                "start": start + bucket * bucket_seconds,
+                "avg": sum(values) / len(values),
+                "min": min(values),
+                "max": max(values),
+                "count": len(values),
+            }
+            for bucket, values in sorted(buckets.items())
+        ]
+    }
+
+
+def ping(_: ParseStore, params: dict[str, Any]) -> dict[str, Any]:
+    return {"status": "alive", "receivedParams": params}
+
+
+CLOUD_FUNCTIONS: dict[str, CloudFunction] = {
+    "findUserDeviceTypes": find_user_device_types,
+    "getHousesWithActivatedDevices": get_houses_with_activated_devices,
+    "getMaxThermostatValue": get_max_thermostat_value,
+    "findControllableDevices": find_controllable_devices,
+    "findControllableDevicesBatch": find_controllable_devices_batch,
+    "getMeasures": get_measures,
+    "getMeasureBuckets": get_measure_buckets,
+    "ping": ping,
+}
+
+
+@dataclass(slots=True, frozen=True)
+class Latency:
+    """
+    Задержка ответа в мс: "constant:20", "uniform:5:50", "normal:30:10"
+    (среднее и отклонение), "lognormal:30:0.5" (медиана и sigma),
+    "exponential:20" (среднее)
+    """
+
+    kind: str = "constant"
+    params: tuple[float, ...] = (0.0,)
+
+    @classmethod
+    def parse(cls, spec: str) -> Self:
+        kind, *params = spec.split(":")
+        if LATENCY_PARAMS.get(kind) != len(params):
+            kinds = ", ".join(LATENCY_PARAMS)
+            msg = f"Задержка {spec!r}: ожидается вид:параметры, виды: {kinds}"
+            raise ValueError(msg)
+        return cls(kind, tuple(map(float, params)))
+
+    def sample(self, rng: random.Random) -> float:
+        """Задержка в секундах"""
+        match self.kind, self.params:
+            case "uniform", (low, high):
+                ms = rng.uniform(low, high)
+            case "normal", (mean, deviation):
+                ms = rng.gauss(mean, deviation)
+            case "lognormal", (median, sigma):
+                ms = median * math.exp(rng.gauss(0, sigma))
+            case "exponential", (mean,):
+                ms = rng.expovariate(1 / mean) if mean else 0.0
+            case _:
+                ms = self.params[0]
+        return max(ms, 0.0) / 1000
+
+
+class TokenBucket:
+    """rate запросов в секунду, подряд - не больше burst"""
+
+    def __init__(
+        self,
+        rate: float,
+        burst: float,
+        *,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        self.rate = rate
+        self.burst = burst
+        self.clock = clock
+        self._tokens = burst
+        self._updated = clock()
+        self._lock = threading.Lock()
+
+    def take(self) -> float:
+        """0 - запрос пропускается, иначе секунды до следующего токена"""
+        with self._lock:
+            now = self.clock()
+            self._tokens = min(
+                self.burst, self._tokens + (now - self._updated) * self.rate
+            )
+            self._updated = now
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return 0.0
+            return (1 - self._tokens) / self.rate
+
+
+@dataclass(slots=True)
+class Faults:
+    latency: Latency = field(default_factory=Latency)
+    # запросов в секунду на весь сервер, сверх - 429; 0 - без лимита
+    rate_limit: float = 0.0
+    # доля запросов, на которые сервер отвечает 500
+    error_rate: float = 0.0
+
+
+@dataclass(slots=True)
+class MockStats:
+    requests: int = 0
+    throttled: int = 0
+    failed: int = 0
+
+
+def error_body(code: int, message: str) -> dict[str, Any]:
+    return {"code": code, "error": message}
+
+
+class MockParseServer(ThreadingHTTPServer):
+    """
+    Parse Server в памяти для замеров без Back4app: /classes, /batch
+    и функции Cloud Code из main.js. Перед ответом - задержка
+    faults.latency, затем 429 сверх faults.rate_limit или 500
+    с вероятностью faults.error_rate. Случайность - от seed.
+    application_id=None - заголовки ключей не проверяются
+    """
+
+    daemon_threads = True
+
+    def __init__(
+        self,
+        address: tuple[str, int],
+        *,
+        store: ParseStore | None = None,
+        faults: Faults | None = None,
+        seed: int = 0,
+        application_id: str | None = None,
+    ) -> None:
+        super().__init__(address, ParseRequestHandler)
+        self.store = ParseStore() if store is None else store
+        self.application_id = application_id
+        self.stats = MockStats()
+        self._rng = random.Random(seed)  # noqa: S311 - сбои, не криптография
+        self._lock = threading.Lock()
+        self.faults = Faults()
+        self._bucket: TokenBucket | None = None
+        self.set_faults(faults or Faults())
+
+    @property
+    def url(self) -> str:
+        """Адрес для server_url клиентов (BACK4APP_SERVER_URL)"""
+        host, port = self.socket.getsockname()[:2]
+        return f"http://{host}:{port}/"
+
+    def set_faults(self, faults: Faults) -> None:
+        bucket = (
+            TokenBucket(faults.rate_limit, max(faults.rate_limit, 1.0))
+            if faults.rate_limit > 0
+            else None
+        )
+        with self._lock:
+            self.faults = faults
+            self._bucket = bucket
+
+    def delay(self) -> float:
+        with self._lock:
+            self.stats.requests += 1
+            return self.faults.latency.sample(self._rng)
+
+    def fault(self) -> Response | None:
+        """Отказ вместо ответа на запрос или None"""
+        with self._lock:
+            bucket = self._bucket
+        wait = bucket.take() if bucket is not None else 0.0
+        with self._lock:
+            if wait:
+                self.stats.throttled += 1
+                return (
+                    HTTPStatus.TOO_MANY_REQUESTS,
+                    {"Retry-After": str(math.ceil(wait))},
+                    error_body(REQUEST_LIMIT_EXCEEDED, "Too many requests"),
+                )
+            if self._rng.random() < self.faults.error_rate:
+                self.stats.failed += 1
+                return (
+                    HTTPStatus.INTERNAL_SERVER_ERROR,
+                    {},
+                    error_body(INTERNAL_SERVER_ERROR, "Internal server error"),
+                )
+        return None
+
+    def respond(
+        self,
+        method: str,
+        target: str,
+        application_id: str | None,
+        raw: bytes,
+    ) -> Response:
+        time.sleep(self.delay())
+        fault = self.fault()
+        if fault is not None:
+            return fault
+        if self.application_id not in {None, application_id}:
+            return HTTPStatus.FORBIDDEN, {}, {"error": "unauthorized"}
+
+        url = urlsplit(target)
+        try:
+            body = json.loads(raw) if raw else None
+        except ValueError:
+            return (
+                HTTPStatus.BAD_REQUEST,
+                {},
+                error_body(INVALID_JSON, "Invalid JSON"),
+            )
+        try:
+            status, payload = self.dispatch(
+                method, url.path, dict(parse_qsl(url.query)), body
+            )
+        except ParseError as e:
+            status = (
+                HTTPStatus.NOT_FOUND
+                if e.code == OBJECT_NOT_FOUND
+                else HTTPStatus.BAD_REQUEST
+            )
+            payload = error_body(e.code, e.message)
+        return status, {}, payload
+
+    def dispatch(
+        self,
+        method: str,
+        path: str,
+        query: Mapping[str, str],
+        body: Any,  # noqa: ANN401
+    ) -> tuple[HTTPStatus, Any]:
+        """Маршруты REST API Parse, в том числе операции /batch"""
+        parts = path.removeprefix("/parse").strip("/").split("/")
+        match method, parts:
+            case "POST", ["classes", class_name]:
+                if not isinstance(body, dict):
+                    raise ParseError(INVALID_JSON, "Ожидается объект JSON")
+                return HTTPStatus.CREATED, self.store.create(class_name, body)
+            case "GET", ["classes", class_name]:
+                return HTTPStatus.OK, {"results": self.find(class_name, query)}
+            case "GET", ["classes", class_name, obj_id]:
+                obj = self.store.get(class_name, obj_id)
+                if obj is None:
+                    raise ParseError(OBJECT_NOT_FOUND, "Object not found.")
+                return HTTPStatus.OK, obj
+            case "POST", ["batch"]:
+                return HTTPStatus.OK, self.batch(body)
+            case "POST", ["functions", name]:
+                return HTTPStatus.OK, {"result": self.call(name, body or {})}
+        return HTTPStatus.NOT_FOUND, {"error": f"Cannot {method} {path}"}
+
+    def find(
+        self, class_name: str, query: Mapping[str, str]
+    ) -> list[ParseObject]:
+        try:
+            where = json.loads(query["where"]) if "where" in query else None
+            limit = int(query.get("limit", DEFAULT_LIMIT))
+            skip = int(query.get("skip", 0))
+        except ValueError as e:
+            raise ParseError(INVALID_JSON, str(e)) from e
+        if where is not None and not isinstance(where, dict):
+            raise ParseError(INVALID_QUERY, "where - объект JSON")
+        return self.store.find(
+            class_name,
+            where,
+            include=filter(None, query.get("include", "").split(",")),
+            order=query.get("order", ""),
+            limit=limit,
+            skip=skip,
+        )
+
+    def batch(self, body: Any) -> list[dict[str, Any]]:  # noqa: ANN401
+        """Операции выполняются по очереди, ошибка одной не прерывает"""
+        requests = body.get("requests") if isinstance(body, dict) else None
+        if not isinstance(requests, list):
+            raise ParseError(INVALID_JSON, "requests - список операций")
+        if len(requests) > BATCH_SIZE:
+            msg = f"Не больше {BATCH_SIZE} операций в /batch"
+            raise ParseError(INVALID_JSON, msg)
+
+        results: list[dict[str, Any]] = []
+        for request in requests:
+            try:
+                status, payload = self.dispatch(
+                    request["method"],
+                    request["path"],
+                    {},
+                    request.get("body"),
+                )
+            except ParseError as e:
+                results.append({"error": error_body(e.code, e.message)})
+            except (KeyError, TypeError):
+                results.append(
+                    {"error": error_body(INVALID_JSON, "Неверная операция")}
+                )
+            else:
+                if status >= HTTPStatus.BAD_REQUEST:
+                    results.append(
+                        {"error": error_body(INVALID_JSON, payload["error"])}
+                    )
+                else:
+                    results.append({"success": payload})
+        return results
+
+    def call(self, name: str, params: dict[str, Any]) -> Any:  # noqa: ANN401
+        function = CLOUD_FUNCTIONS.get(name)
+        if function is None:
+            raise ParseError(SCRIPT_FAILED, f'Invalid function: "{name}"')
+        try:
+            return function(self.store, params)
+        except (KeyError, TypeError, ValueError) as e:
+            raise ParseError(SCRIPT_FAILED, f"{name}: {e!r}") from e
+
+
+class ParseRequestHandler(BaseHTTPRequestHandler):
+    # keep-alive: пул клиента переиспользует соединения, как с Back4app
+    protocol_version = "HTTP/1.1"
+    # заголовки и тело пишутся отдельно: без TCP_NODELAY ответ ждёт
+    # отложенного ACK клиента (~40 мс)
+    disable_nagle_algorithm = True
+    server: MockParseServer
+
+    def do_GET(self) -> None:
+        self.handle_parse("GET")
+
+    def do_POST(self) -> None:
+        self.handle_parse("POST")
+
+    @override
+    def log_message(self, fmt: str, *args: object) -> None:
+        logger.debug(fmt, *args)
+
+    def handle_parse(self, method: str) -> None:
+        length = int(self.headers.get("Content-Length") or 0)
+        raw = self.rfile.read(length) if length else b""
+        status, headers, payload = self.server.respond(
+            method,
+            self.path,
+            self.headers.get("X-Parse-Application-Id"),
+            raw,
+        )
+
+        data = json.dumps(payload, ensure_ascii=False).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(data)))
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
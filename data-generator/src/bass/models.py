@@ -1,7 +1,7 @@
 from dataclasses import dataclass
 
 
-@dataclass
+@dataclass(slots=True)
 class DeviceTypes:
     object_id: str | None
 
@@ -9,14 +9,14 @@ class DeviceTypes:
     name: str
 
 
-@dataclass
+@dataclass(slots=True)
 class Houses:
     object_id: str | None
 
     address: str
 
 
-@dataclass
+@dataclass(slots=True)
 class Scenarios:
     object_id: str | None
 
@@ -24,14 +24,14 @@ class Scenarios:
     time_till: int
 
 
-@dataclass
+@dataclass(slots=True)
 class UserTypes:
     object_id: str | None
 
     type: str
 
 
-@dataclass
+@dataclass(slots=True)
 class DeviceTypesToUserTypes:
     object_id: str | None
 
@@ -39,7 +39,7 @@ class DeviceTypesToUserTypes:
     user_type_id: str
 
 
-@dataclass
+@dataclass(slots=True)
 class Devices:
     object_id: str | None
 
@@ -47,7 +47,7 @@ class Devices:
     device_type_id: str
 
 
-@dataclass
+@dataclass(slots=True)
 class Users:
     object_id: str | None
 
@@ -55,7 +55,7 @@ class Users:
     user_type_id: str
 
 
-@dataclass
+@dataclass(slots=True)
 class ActivationsToDevices:
     object_id: str | None
 
@@ -65,7 +65,7 @@ class ActivationsToDevices:
     affect_time: int | None
 
 
-@dataclass
+@dataclass(slots=True)
 class CoNEToDevices:
     object_id: str | None
 
@@ -74,7 +74,7 @@ class CoNEToDevices:
     is_on: bool
 
 
-@dataclass
+@dataclass(slots=True)
 class Events:
     object_id: str | None
 
@@ -84,10 +84,26 @@ class Events:
     scenario_id: str | None
 
 
-@dataclass
+@dataclass(slots=True)
 class Measures:
     object_id: str | None
 
     device_id: str
     measure_time: int
     value: int | None
+
+
+# Указатели между классами: класс -> классы, на которые он ссылается
+REFERENCES: dict[type, tuple[type, ...]] = {
+    DeviceTypes: (),
+    Houses: (),
+    Scenarios: (),
+    UserTypes: (),
+    DeviceTypesToUserTypes: (DeviceTypes, UserTypes),
+    Devices: (Houses, DeviceTypes),
+    Users: (UserTypes,),
+    ActivationsToDevices: (Scenarios, Devices),
+    CoNEToDevices: (Scenarios, Devices),
+    Events: (Users, Devices, Scenarios),
+    Measures: (Devices,),
+}
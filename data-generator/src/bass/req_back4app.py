@@ -1,9 +1,25 @@
+from collections import defaultdict
+from collections.abc import Iterable, Iterator
 from dataclasses import dataclass
+from datetime import UTC, datetime
+from itertools import batched
+from logging import getLogger
+from typing import Any
 
-import requests
+from bass.bass_api import Back4AppApi
+from cache import PermissionCache, PermissionMatrix, ResultCache
+from config import (
+    PERMISSION_CACHE_SIZE,
+    PERMISSION_CACHE_TTL,
+    RESULT_CACHE_SIZE,
+    RESULT_CACHE_TTL,
+)
+from timing import timed
 
+logger = getLogger(name=__name__)
 
-@dataclass
+
+@dataclass(slots=True)
 class UserDeviceTypes:
     user_name: str
     user_type: str
@@ -11,28 +27,14 @@ class UserDeviceTypes:
     device_name: str
 
 
+@timed
 def find_user_device_types(
-    application_id: str, rest_api_key: str, user_name: str
+    back4app_api: Back4AppApi, user_name: str
 ) -> list[UserDeviceTypes]:
-    headers = {
-        "X-Parse-Application-Id": application_id,
-        "X-Parse-REST-API-Key": rest_api_key,
-        "Content-Type": "application/json",
-    }
-    url = "https://parseapi.back4app.com/functions/findUserDeviceTypes"
-
-    res = requests.post(
-        url=url,
-        json={"name": user_name},
-        headers=headers,
-        timeout=30,
+    result = back4app_api.call_function(
+        "findUserDeviceTypes", {"name": user_name}
     )
 
-    if res.status_code != 200:
-        raise Exception
-
-    result = res.json()["result"]
-
     return [
         UserDeviceTypes(
             user_name=utd["userName"],
@@ -44,36 +46,143 @@ def find_user_device_types(
     ]
 
 
-@dataclass
-class HousesWithActivatedDevices:
-    objectId: str
-    address: str
+# Результаты запросов, сбрасываются записью генераторов в их таблицы
+result_cache = ResultCache("back4app", RESULT_CACHE_SIZE, RESULT_CACHE_TTL)
 
+permission_cache = PermissionCache(
+    "back4app", PERMISSION_CACHE_SIZE, PERMISSION_CACHE_TTL
+)
 
-def get_houses_with_activated_devices(
-    application_id: str,
-    rest_api_key: str,
-) -> list[HousesWithActivatedDevices]:
-    headers = {
-        "X-Parse-Application-Id": application_id,
-        "X-Parse-REST-API-Key": rest_api_key,
-        "Content-Type": "application/json",
-    }
 
-    url = (
-        "https://parseapi.back4app.com/functions/getHousesWithActivatedDevices"
+@timed
+def load_user_types(back4app_api: Back4AppApi, user_name: str) -> list[str]:
+    """Типы всех пользователей с именем user_name"""
+    users = back4app_api.find_objects(
+        "Users", where={"name": user_name}, include=("user_type_id",)
     )
+    return [
+        user["user_type_id"]["type"]
+        for user in users
+        if user.get("user_type_id")
+    ]
+
 
-    res = requests.post(
-        url=url,
-        headers=headers,
-        timeout=30,
+@timed
+def load_permission_matrix(back4app_api: Back4AppApi) -> PermissionMatrix:
+    """Тип пользователя -> доступные типы устройств"""
+    links = back4app_api.find_objects(
+        "DeviceTypesToUserTypes", include=("user_type_id", "device_type_id")
     )
+    matrix: defaultdict[str, list[tuple[str, str]]] = defaultdict(list)
+    for link in links:
+        user_type = link.get("user_type_id")
+        device_type = link.get("device_type_id")
+        if user_type and device_type:
+            matrix[user_type["type"]].append(
+                (device_type["type"], device_type["name"])
+            )
+    return dict(matrix)
+
 
-    if res.status_code != 200:
-        raise Exception
+def find_user_device_types_cached(
+    back4app_api: Back4AppApi,
+    user_name: str,
+    cache: PermissionCache = permission_cache,
+) -> list[UserDeviceTypes]:
+    """
+    То же, что find_user_device_types, через кеш прав:
+    запросы к Back4app только при промахе
+    """
+    return [
+        UserDeviceTypes(
+            user_name=user_name,
+            user_type=user_type,
+            device_type=device_type,
+            device_name=device_name,
+        )
+        for user_type, device_type, device_name in cache.device_types(
+            user_name,
+            lambda: load_user_types(back4app_api, user_name),
+            lambda: load_permission_matrix(back4app_api),
+        )
+    ]
 
-    houses = res.json()["result"]["houses"]
+
+@dataclass(slots=True)
+class ControllableDevice:
+    objectId: str
+    device_type: str
+    device_name: str
+
+
+def to_controllable_devices(
+    devices: list[dict[str, Any]],
+) -> list[ControllableDevice]:
+    return [
+        ControllableDevice(
+            objectId=device["objectId"],
+            device_type=device["deviceType"],
+            device_name=device["deviceName"],
+        )
+        for device in devices
+    ]
+
+
+@timed
+def find_controllable_devices(
+    back4app_api: Back4AppApi, user_id: str, house_id: str
+) -> list[ControllableDevice]:
+    result = back4app_api.call_function(
+        "findControllableDevices", {"userId": user_id, "houseId": house_id}
+    )
+    return to_controllable_devices(result)
+
+
+# Пар (пользователь, дом) в одном вызове Cloud Code
+PAIRS_PER_CALL = 500
+
+
+@timed
+def find_controllable_devices_batch(
+    back4app_api: Back4AppApi, pairs: Iterable[tuple[str, str]]
+) -> dict[tuple[str, str], list[ControllableDevice]]:
+    """
+    find_controllable_devices для многих пар (user_id, house_id),
+    один вызов findControllableDevicesBatch на PAIRS_PER_CALL пар
+    """
+    result: dict[tuple[str, str], list[ControllableDevice]] = {
+        pair: [] for pair in pairs
+    }
+    for chunk in batched(result, PAIRS_PER_CALL, strict=False):
+        answers = back4app_api.call_function(
+            "findControllableDevicesBatch",
+            {
+                "pairs": [
+                    {"userId": user_id, "houseId": house_id}
+                    for user_id, house_id in chunk
+                ]
+            },
+        )
+        for answer in answers:
+            result[answer["userId"], answer["houseId"]] = (
+                to_controllable_devices(answer["devices"])
+            )
+    return result
+
+
+@dataclass(slots=True)
+class HousesWithActivatedDevices:
+    objectId: str
+    address: str
+
+
+@timed
+def get_houses_with_activated_devices(
+    back4app_api: Back4AppApi,
+) -> list[HousesWithActivatedDevices]:
+    houses = back4app_api.call_function("getHousesWithActivatedDevices")[
+        "houses"
+    ]
 
     return [
         HousesWithActivatedDevices(
@@ -83,70 +192,200 @@ def get_houses_with_activated_devices(
     ]
 
 
-@dataclass
+@dataclass(slots=True)
 class MaxThermostatValue:
     address: str
     measure_time: int
     value: float
 
 
-def get_max_thermostat_value(
-    application_id: str, rest_api_key: str
-) -> MaxThermostatValue:
-    headers = {
-        "X-Parse-Application-Id": application_id,
-        "X-Parse-REST-API-Key": rest_api_key,
-        "Content-Type": "application/json",
+@timed
+def get_max_thermostat_value(back4app_api: Back4AppApi) -> MaxThermostatValue:
+    result = back4app_api.call_function("getMaxThermostatValue")
+
+    return MaxThermostatValue(
+        address=result["address"],
+        measure_time=result["measure_time"],
+        value=result["value"],
+    )
+
+
+get_houses_with_activated_devices_cached = result_cache.cached(
+    "Houses", "Devices", "ActivationsToDevices"
+)(get_houses_with_activated_devices)
+
+get_max_thermostat_value_cached = result_cache.cached(
+    "Measures", "Devices", "DeviceTypes", "Houses"
+)(get_max_thermostat_value)
+
+
+# Измерений / интервалов в одной странице запроса
+PAGE_SIZE = 1000
+PAGE_BUCKETS = 500
+
+
+def measures_target(
+    device_id: str | None, house_id: str | None
+) -> dict[str, str]:
+    if device_id is not None and house_id is None:
+        return {"deviceId": device_id}
+    if house_id is not None and device_id is None:
+        return {"houseId": house_id}
+    msg = "Нужен ровно один из device_id и house_id"
+    raise ValueError(msg)
+
+
+@dataclass(slots=True)
+class MeasurePoint:
+    objectId: str
+    device_id: str | None
+    measure_time: int
+    value: float | None
+
+
+@timed
+def iter_measures(  # noqa: PLR0913
+    back4app_api: Back4AppApi,
+    start: int,
+    end: int,
+    *,
+    device_id: str | None = None,
+    house_id: str | None = None,
+    page_size: int = PAGE_SIZE,
+) -> Iterator[MeasurePoint]:
+    """
+    Измерения устройства или дома в [start, end) (unix-время)
+    страницами getMeasures по ключу (measure_time, objectId)
+    """
+    params: dict[str, Any] = {
+        **measures_target(device_id, house_id),
+        "from": start,
+        "till": end,
+        "limit": page_size,
     }
+    while True:
+        result = back4app_api.call_function("getMeasures", params)
+        for measure in result["measures"]:
+            yield MeasurePoint(
+                objectId=measure["objectId"],
+                device_id=measure["device_id"],
+                measure_time=measure["measure_time"],
+                value=measure["value"],
+            )
+        if result["next"] is None:
+            return
+        params = {**params, **result["next"]}
 
-    url = "https://parseapi.back4app.com/functions/getMaxThermostatValue"
 
-    res = requests.post(
-        url=url,
-        headers=headers,
-        timeout=30,
-    )
+@dataclass(slots=True)
+class MeasureBucket:
+    start: int
+    avg_value: float
+    min_value: float
+    max_value: float
+    count: int
 
-    if res.status_code != 200:
-        raise Exception
 
-    result = res.json()["result"]
+@timed
+def iter_measure_buckets(  # noqa: PLR0913
+    back4app_api: Back4AppApi,
+    start: int,
+    end: int,
+    bucket_minutes: int,
+    *,
+    device_id: str | None = None,
+    house_id: str | None = None,
+    page_buckets: int = PAGE_BUCKETS,
+) -> Iterator[MeasureBucket]:
+    """
+    avg/min/max по интервалам bucket_minutes минут от start.
+    Один вызов getMeasureBuckets - page_buckets интервалов
+    """
+    target = measures_target(device_id, house_id)
+    bucket_seconds = bucket_minutes * 60
+    page_start = start
+    while page_start < end:
+        page_end = min(end, page_start + page_buckets * bucket_seconds)
+        result = back4app_api.call_function(
+            "getMeasureBuckets",
+            {
+                **target,
+                "from": page_start,
+                "till": page_end,
+                "bucketMinutes": bucket_minutes,
+            },
+        )
+        for bucket in result["buckets"]:
+            yield MeasureBucket(
+                start=bucket["start"],
+                avg_value=bucket["avg"],
+                min_value=bucket["min"],
+                max_value=bucket["max"],
+                count=bucket["count"],
+            )
+        page_start = page_end
 
-    return MaxThermostatValue(
-        address=result["address"],
-        measure_time=result["measure_time"],
-        value=result["value"],
+
+def input_measures_query() -> dict[str, Any]:
+    """Устройство или дом и период [start, end) для консоли"""
+
+    def timestamp(prompt: str) -> int:
+        moment = datetime.fromisoformat(input(prompt))
+        return int(moment.replace(tzinfo=UTC).timestamp())
+
+    device_id = input("objectId устройства (пусто - измерения дома): ")
+    target = (
+        {"device_id": device_id}
+        if device_id
+        else {"house_id": input("objectId дома: ")}
     )
+    return {
+        **target,
+        "start": timestamp("С (ГГГГ-ММ-ДД ЧЧ:ММ, UTC): "),
+        "end": timestamp("По (ГГГГ-ММ-ДД ЧЧ:ММ, UTC): "),
+    }
 
 
-def start_req_back4app(application_id: str, rest_api_key: str) -> None:
+def start_req_back4app(back4app_api: Back4AppApi) -> None:
     func = input(
         """Выберите функцию:
-        - findUserDeviceTypes, 
+        - findUserDeviceTypes
         - getHousesWithActivatedDevices
         - getMaxThermostatValue
+        - findControllableDevices
+        - getMeasures
+        - getMeasureBuckets
         : """
     )
     if func == "findUserDeviceTypes":
         user_name = input("Введите имя: ")
-        print(
-            find_user_device_types(
-                application_id=application_id,
-                rest_api_key=rest_api_key,
-                user_name=user_name,
-            )
+        logger.info(
+            "%s",
+            find_user_device_types_cached(
+                back4app_api=back4app_api, user_name=user_name
+            ),
         )
     elif func == "getHousesWithActivatedDevices":
-        print(
-            get_houses_with_activated_devices(
-                application_id=application_id, rest_api_key=rest_api_key
-            )
+        logger.info(
+            "%s", get_houses_with_activated_devices_cached(back4app_api)
         )
     elif func == "getMaxThermostatValue":
-        print(
-            get_max_thermostat_value(
-                application_id=application_id, rest_api_key=rest_api_key
-            )
+        logger.info("%s", get_max_thermostat_value_cached(back4app_api))
+    elif func == "findControllableDevices":
+        user_id = input("objectId пользователя: ")
+        house_id = input("objectId дома: ")
+        logger.info(
+            "%s", find_controllable_devices(back4app_api, user_id, house_id)
         )
+    elif func == "getMeasures":
+        for measure in iter_measures(back4app_api, **input_measures_query()):
+            logger.info("%s", measure)
+    elif func == "getMeasureBuckets":
+        query = input_measures_query()
+        bucket_minutes = int(input("Интервал, минут: "))
+        for bucket in iter_measure_buckets(
+            back4app_api, **query, bucket_minutes=bucket_minutes
+        ):
+            logger.info("%s", bucket)
     else:
-        print("Неверное имя функции")
+        logger.error("Неверное имя функции: %s", func)
@@ -0,0 +1,232 @@
+import json
+import time
+from collections.abc import Callable, Iterator, Mapping, Sequence
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import asdict, dataclass, is_dataclass
+from datetime import UTC, date, datetime
+from decimal import Decimal
+from pathlib import Path
+from typing import Any, TextIO
+
+import duckdb
+from sqlalchemy.orm import Session
+
+from bass import req_back4app
+from bass.bass_api import Back4AppApi
+from benchmark import QUERY_ERRORS
+from db import req_db
+from duck import req_duck
+
+# Запрос батча: query(сессия, клиент Back4app или курсор DuckDB, **params)
+type BatchQuery = Callable[..., object]
+
+# Параметры со временем: в файле - ISO-строка (UTC)
+TIME_PARAMS = ("start", "end")
+
+# Ошибки одной строки батча: пишутся в результат, батч продолжается
+BATCH_ERRORS = (*QUERY_ERRORS, LookupError, TypeError, ValueError)
+
+
+def collect[**P, T](func: Callable[P, Iterator[T]]) -> Callable[P, list[T]]:
+    """Постраничный запрос целиком - для записи одной строкой JSON"""
+
+    def call(*args: P.args, **kwargs: P.kwargs) -> list[T]:
+        return list(func(*args, **kwargs))
+
+    return call
+
+
+# Имена те же, что в консольном меню и Cloud Code
+DB_QUERIES: dict[str, BatchQuery] = {
+    "findUserDeviceTypes": req_db.find_user_device_types,
+    "getHousesWithActivatedDevices": req_db.get_houses_with_activated_devices,
+    "getMaxThermostatValue": req_db.get_max_thermostat_value,
+    "findControllableDevices": req_db.find_controllable_devices,
+    "getMeasures": collect(req_db.iter_measures),
+    "getMeasureBuckets": collect(req_db.iter_measure_buckets),
+}
+
+BACK4APP_QUERIES: dict[str, BatchQuery] = {
+    "findUserDeviceTypes": req_back4app.find_user_device_types,
+    "getHousesWithActivatedDevices": (
+        req_back4app.get_houses_with_activated_devices
+    ),
+    "getMaxThermostatValue": req_back4app.get_max_thermostat_value,
+    "findControllableDevices": req_back4app.find_controllable_devices,
+    "getMeasures": collect(req_back4app.iter_measures),
+    "getMeasureBuckets": collect(req_back4app.iter_measure_buckets),
+}
+
+DUCKDB_QUERIES: dict[str, BatchQuery] = {
+    "findUserDeviceTypes": req_duck.find_user_device_types,
+    "getHousesWithActivatedDevices": (
+        req_duck.get_houses_with_activated_devices
+    ),
+    "getMaxThermostatValue": req_duck.get_max_thermostat_value,
+    "findControllableDevices": req_duck.find_controllable_devices,
+    "getMeasures": collect(req_duck.iter_measures),
+    "getMeasureBuckets": collect(req_duck.iter_measure_buckets),
+}
+
+BACKEND_QUERIES: dict[str, Mapping[str, BatchQuery]] = {
+    "db": DB_QUERIES,
+    "back4app": BACK4APP_QUERIES,
+    "duckdb": DUCKDB_QUERIES,
+}
+
+
+@dataclass(slots=True)
+class BatchItem:
+    # номер строки во входном файле
+    line: int
+    query: str
+    params: dict[str, Any]
+
+
+def read_batch(file: TextIO) -> list[BatchItem]:
+    """
+    Строки JSON: {"query": "getMeasures", "params": {...}}.
+    Пустые строки пропускаются
+    """
+    items = []
+    for line, text in enumerate(file, start=1):
+        if not text.strip():
+            continue
+        try:
+            item = json.loads(text)
+            items.append(
+                BatchItem(line, item["query"], dict(item.get("params", {})))
+            )
+        except (KeyError, TypeError, ValueError) as e:
+            msg = f"Строка {line}: ожидается {{'query': ..., 'params': ...}}"
+            raise ValueError(msg) from e
+    return items
+
+
+def check_queries(backend: str, items: Sequence[BatchItem]) -> None:
+    """
+    ValueError - в файле есть запросы, которых нет у бэкенда:
+    проверяется до запуска, а не ошибкой на каждой строке
+    """
+    queries = BACKEND_QUERIES[backend]
+    unknown = [item for item in items if item.query not in queries]
+    if unknown:
+        msg = (
+            f"строка {unknown[0].line}: неизвестный запрос "
+            f"{unknown[0].query!r} (всего таких строк {len(unknown)}); "
+            f"{backend} поддерживает: {', '.join(queries)}"
+        )
+        raise ValueError(msg)
+
+
+def parse_time(backend: str, value: str) -> datetime | int:
+    """MySQL и DuckDB хранят время без зоны, Back4app - секунды unix"""
+    moment = datetime.fromisoformat(value)
+    if backend != "back4app":
+        return moment.replace(tzinfo=None)
+    return int(moment.replace(tzinfo=moment.tzinfo or UTC).timestamp())
+
+
+def prepare_params(backend: str, params: Mapping[str, Any]) -> dict[str, Any]:
+    return {
+        name: parse_time(backend, value)
+        if name in TIME_PARAMS and isinstance(value, str)
+        else value
+        for name, value in params.items()
+    }
+
+
+def db_runner(
+    make_session: Callable[[], Session],
+) -> Callable[[str, dict[str, Any]], object]:
+    """Каждый запрос - в своей сессии: соединение из пула на время запроса"""
+
+    def run(query: str, params: dict[str, Any]) -> object:
+        with make_session() as session:
+            return DB_QUERIES[query](session, **params)
+
+    return run
+
+
+def back4app_runner(
+    back4app_api: Back4AppApi,
+) -> Callable[[str, dict[str, Any]], object]:
+    """Клиент общий для потоков, его пул HTTP-соединений - на все"""
+
+    def run(query: str, params: dict[str, Any]) -> object:
+        return BACK4APP_QUERIES[query](back4app_api, **params)
+
+    return run
+
+
+def duckdb_runner(
+    con: duckdb.DuckDBPyConnection,
+) -> Callable[[str, dict[str, Any]], object]:
+    """Соединение DuckDB не потокобезопасно - у запроса свой курсор"""
+
+    def run(query: str, params: dict[str, Any]) -> object:
+        with con.cursor() as cursor:
+            return DUCKDB_QUERIES[query](cursor, **params)
+
+    return run
+
+
+def run_batch(
+    backend: str,
+    items: Sequence[BatchItem],
+    run: Callable[[str, dict[str, Any]], object],
+    *,
+    workers: int,
+) -> Iterator[dict[str, Any]]:
+    """
+    Запросы в workers потоков, результаты - в порядке входного файла
+    по мере готовности очередного
+    """
+
+    def execute(item: BatchItem) -> dict[str, Any]:
+        record: dict[str, Any] = {
+            "line": item.line,
+            "query": item.query,
+            "params": item.params,
+        }
+        start = time.perf_counter()
+        try:
+            result = run(item.query, prepare_params(backend, item.params))
+        except BATCH_ERRORS as e:
+            record["ok"] = False
+            record["error"] = f"{type(e).__name__}: {e}"
+        else:
+            record["ok"] = True
+            record["result"] = result
+        record["ms"] = round(1000 * (time.perf_counter() - start), 3)
+        return record
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        yield from executor.map(execute, items)
+
+
+def to_json(obj: object) -> object:
+    """default для json.dumps: результаты запросов - dataclass'ы"""
+    if is_dataclass(obj) and not isinstance(obj, type):
+        return asdict(obj)
+    if isinstance(obj, date):
+        return obj.isoformat()
+    if isinstance(obj, Decimal):
+        return float(obj)
+    msg = f"{type(obj).__name__} не сериализуется в JSON"
+    raise TypeError(msg)
+
+
+def write_jsonl(records: Iterator[dict[str, Any]], file: TextIO) -> int:
+    """Записывает строки JSON, возвращает число ошибок"""
+    errors = 0
+    for record in records:
+        errors += not record["ok"]
+        file.write(json.dumps(record, ensure_ascii=False, default=to_json))
+        file.write("\n")
+    return errors
+
+
+def batch_from_path(path: Path) -> list[BatchItem]:
+    with path.open(encoding="utf-8") as file:
+        return read_batch(file)
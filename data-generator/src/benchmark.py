@@ -0,0 +1,628 @@
+import argparse
+import asyncio
+import csv
+import inspect
+import json
+import logging
+import math
+import statistics
+import time
+from collections.abc import Awaitable, Callable, Sequence
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import ExitStack
+from dataclasses import asdict, dataclass, fields
+from functools import partial
+from logging import getLogger
+from pathlib import Path
+from typing import cast
+
+import duckdb
+import requests
+from sqlalchemy import select
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+from sqlalchemy.orm import Session, sessionmaker
+
+from bass import req_back4app
+from bass.bass_api import SERVER_URL, Back4AppApi, Back4AppFunctionError
+from config import (
+    DB_ASYNC_URL,
+    DB_URL,
+    DUCKDB_PATH,
+    back4app_credentials,
+)
+from db import req_db, req_db_async
+from db.db_conn import create_db_engine, log_pool_stats, warm_up
+from db.db_conn_async import (
+    async_session_factory,
+    create_async_db_engine,
+    warm_up_async,
+)
+from db.models import Users
+from duck import req_duck
+from duck.duck_conn import connect
+from timing import log_breakdown
+
+logger = getLogger(name=__name__)
+
+type QueryCall = Callable[[], object]
+# Запрос асинхронного бэкенда: вызовы идут из одного цикла событий
+type AsyncQueryCall = Callable[[], Awaitable[object]]
+
+BACKENDS = ("db", "db_async", "back4app", "duckdb")
+
+# Ошибки отдельного запроса - считаются, но не прерывают замер
+QUERY_ERRORS = (
+    LookupError,
+    SQLAlchemyError,
+    requests.RequestException,
+    Back4AppFunctionError,
+    duckdb.Error,
+)
+
+
+@dataclass
+class BenchmarkQuery:
+    backend: str
+    name: str
+    # имя пользователя для findUserDeviceTypes, для остальных - пусто
+    param: str
+    call: QueryCall | AsyncQueryCall
+
+
+@dataclass
+class BenchmarkResult:
+    backend: str
+    query: str
+    param: str
+    concurrency: int
+    iterations: int
+    errors: int
+    p50_ms: float
+    p95_ms: float
+    p99_ms: float
+    mean_ms: float
+    # успешных запросов в секунду
+    throughput: float
+
+
+def percentiles(latencies: Sequence[float]) -> tuple[float, float, float]:
+    """p50, p95, p99"""
+    if not latencies:
+        return math.nan, math.nan, math.nan
+    if len(latencies) == 1:
+        return latencies[0], latencies[0], latencies[0]
+    q = statistics.quantiles(latencies, n=100, method="inclusive")
+    return q[49], q[94], q[98]
+
+
+def measure_threads(
+    query: BenchmarkQuery, *, iterations: int, warmup: int, concurrency: int
+) -> tuple[list[float | None], float]:
+    """Замеры в concurrency потоков и общее время"""
+    for _ in range(warmup):
+        query.call()
+
+    def timed(_: int) -> float | None:
+        start = time.perf_counter()
+        try:
+            query.call()
+        except QUERY_ERRORS:
+            logger.exception("%s %s", query.backend, query.name)
+            return None
+        return time.perf_counter() - start
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        samples = list(executor.map(timed, range(iterations)))
+    return samples, time.perf_counter() - start
+
+
+async def measure_tasks(
+    call: AsyncQueryCall,
+    query: BenchmarkQuery,
+    *,
+    iterations: int,
+    warmup: int,
+    concurrency: int,
+) -> tuple[list[float | None], float]:
+    """Замеры задачами одного цикла, не больше concurrency одновременно"""
+    for _ in range(warmup):
+        await call()
+
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def timed(_: int) -> float | None:
+        async with semaphore:
+            start = time.perf_counter()
+            try:
+                await call()
+            except QUERY_ERRORS:
+                logger.exception("%s %s", query.backend, query.name)
+                return None
+            return time.perf_counter() - start
+
+    start = time.perf_counter()
+    samples = await asyncio.gather(*map(timed, range(iterations)))
+    return samples, time.perf_counter() - start
+
+
+def run_benchmark(
+    query: BenchmarkQuery,
+    *,
+    iterations: int = 100,
+    warmup: int = 10,
+    concurrency: int = 1,
+    runner: asyncio.Runner | None = None,
+) -> BenchmarkResult:
+    """
+    warmup прогревочных вызовов, затем iterations замеров
+    в concurrency потоков. Асинхронный запрос выполняется в цикле
+    runner: concurrency задач вместо потоков
+    """
+    if inspect.iscoroutinefunction(query.call):
+        if runner is None:
+            msg = f"{query.backend}: асинхронному запросу нужен runner"
+            raise ValueError(msg)
+        samples, elapsed = runner.run(
+            measure_tasks(
+                cast("AsyncQueryCall", query.call),
+                query,
+                iterations=iterations,
+                warmup=warmup,
+                concurrency=concurrency,
+            )
+        )
+    else:
+        samples, elapsed = measure_threads(
+            query,
+            iterations=iterations,
+            warmup=warmup,
+            concurrency=concurrency,
+        )
+
+    latencies = [1000 * s for s in samples if s is not None]
+    p50, p95, p99 = percentiles(latencies)
+    return BenchmarkResult(
+        backend=query.backend,
+        query=query.name,
+        param=query.param,
+        concurrency=concurrency,
+        iterations=iterations,
+        errors=iterations - len(latencies),
+        p50_ms=p50,
+        p95_ms=p95,
+        p99_ms=p99,
+        mean_ms=statistics.fmean(latencies) if latencies else math.nan,
+        throughput=len(latencies) / elapsed,
+    )
+
+
+def db_queries(
+    make_session: Callable[[], Session], user_names: Sequence[str]
+) -> list[BenchmarkQuery]:
+    """Запросы к MySQL, каждый вызов - в своей сессии из пула"""
+
+    def with_session(func: Callable[..., object], *args: str) -> QueryCall:
+        def call() -> object:
+            with make_session() as session:
+                return func(session, *args)
+
+        return call
+
+    return [
+        *(
+            BenchmarkQuery(
+                "db",
+                "findUserDeviceTypes",
+                name,
+                with_session(req_db.find_user_device_types, name),
+            )
+            for name in user_names
+        ),
+        *(
+            BenchmarkQuery(
+                "db",
+                "findUserDeviceTypesCached",
+                name,
+                with_session(req_db.find_user_device_types_cached, name),
+            )
+            for name in user_names
+        ),
+        BenchmarkQuery(
+            "db",
+            "getHousesWithActivatedDevices",
+            "",
+            with_session(req_db.get_houses_with_activated_devices),
+        ),
+        BenchmarkQuery(
+            "db",
+            "getMaxThermostatValue",
+            "",
+            with_session(req_db.get_max_thermostat_value),
+        ),
+        BenchmarkQuery(
+            "db",
+            "getHousesWithActivatedDevicesCached",
+            "",
+            with_session(req_db.get_houses_with_activated_devices_cached),
+        ),
+        BenchmarkQuery(
+            "db",
+            "getMaxThermostatValueCached",
+            "",
+            with_session(req_db.get_max_thermostat_value_cached),
+        ),
+    ]
+
+
+def db_async_queries(
+    make_session: async_sessionmaker[AsyncSession], user_names: Sequence[str]
+) -> list[BenchmarkQuery]:
+    """Запросы к MySQL через AsyncEngine, каждый вызов - в своей сессии"""
+
+    def with_session(
+        func: Callable[..., Awaitable[object]], *args: str
+    ) -> AsyncQueryCall:
+        async def call() -> object:
+            async with make_session() as session:
+                return await func(session, *args)
+
+        return call
+
+    return [
+        *(
+            BenchmarkQuery(
+                "db_async",
+                "findUserDeviceTypes",
+                name,
+                with_session(req_db_async.find_user_device_types, name),
+            )
+            for name in user_names
+        ),
+        BenchmarkQuery(
+            "db_async",
+            "getHousesWithActivatedDevices",
+            "",
+            with_session(req_db_async.get_houses_with_activated_devices),
+        ),
+        BenchmarkQuery(
+            "db_async",
+            "getMaxThermostatValue",
+            "",
+            with_session(req_db_async.get_max_thermostat_value),
+        ),
+    ]
+
+
+def back4app_queries(
+    back4app_api: Back4AppApi, user_names: Sequence[str]
+) -> list[BenchmarkQuery]:
+    return [
+        *(
+            BenchmarkQuery(
+                "back4app",
+                "findUserDeviceTypes",
+                name,
+                partial(
+                    req_back4app.find_user_device_types, back4app_api, name
+                ),
+            )
+            for name in user_names
+        ),
+        *(
+            BenchmarkQuery(
+                "back4app",
+                "findUserDeviceTypesCached",
+                name,
+                partial(
+                    req_back4app.find_user_device_types_cached,
+                    back4app_api,
+                    name,
+                ),
+            )
+            for name in user_names
+        ),
+        BenchmarkQuery(
+            "back4app",
+            "getHousesWithActivatedDevices",
+            "",
+            partial(
+                req_back4app.get_houses_with_activated_devices, back4app_api
+            ),
+        ),
+        BenchmarkQuery(
+            "back4app",
+            "getMaxThermostatValue",
+            "",
+            partial(req_back4app.get_max_thermostat_value, back4app_api),
+        ),
+        BenchmarkQuery(
+            "back4app",
+            "getHousesWithActivatedDevicesCached",
+            "",
+            partial(
+                req_back4app.get_houses_with_activated_devices_cached,
+                back4app_api,
+            ),
+        ),
+        BenchmarkQuery(
+            "back4app",
+            "getMaxThermostatValueCached",
+            "",
+            partial(
+                req_back4app.get_max_thermostat_value_cached, back4app_api
+            ),
+        ),
+    ]
+
+
+def duckdb_queries(
+    con: duckdb.DuckDBPyConnection, user_names: Sequence[str]
+) -> list[BenchmarkQuery]:
+    """Запросы к DuckDB, каждый вызов - со своим курсором"""
+
+    def with_cursor(func: Callable[..., object], *args: str) -> QueryCall:
+        def call() -> object:
+            with con.cursor() as cursor:
+                return func(cursor, *args)
+
+        return call
+
+    return [
+        *(
+            BenchmarkQuery(
+                "duckdb",
+                "findUserDeviceTypes",
+                name,
+                with_cursor(req_duck.find_user_device_types, name),
+            )
+            for name in user_names
+        ),
+        BenchmarkQuery(
+            "duckdb",
+            "getHousesWithActivatedDevices",
+            "",
+            with_cursor(req_duck.get_houses_with_activated_devices),
+        ),
+        BenchmarkQuery(
+            "duckdb",
+            "getMaxThermostatValue",
+            "",
+            with_cursor(req_duck.get_max_thermostat_value),
+        ),
+        BenchmarkQuery(
+            "duckdb",
+            "getHousesWithActivatedDevicesCached",
+            "",
+            with_cursor(req_duck.get_houses_with_activated_devices_cached),
+        ),
+        BenchmarkQuery(
+            "duckdb",
+            "getMaxThermostatValueCached",
+            "",
+            with_cursor(req_duck.get_max_thermostat_value_cached),
+        ),
+    ]
+
+
+def sample_user_names(session: Session, count: int) -> list[str]:
+    """Имена первых count пользователей - для перебора параметра"""
+    return list(
+        session.scalars(select(Users.name).order_by(Users.id).limit(count))
+    )
+
+
+def write_json(results: Sequence[BenchmarkResult], path: Path) -> None:
+    with path.open("w", encoding="utf-8") as file:
+        json.dump(
+            [asdict(r) for r in results], file, ensure_ascii=False, indent=2
+        )
+
+
+def write_csv(results: Sequence[BenchmarkResult], path: Path) -> None:
+    with path.open("w", encoding="utf-8", newline="") as file:
+        writer = csv.DictWriter(
+            file, fieldnames=[f.name for f in fields(BenchmarkResult)]
+        )
+        writer.writeheader()
+        writer.writerows(asdict(r) for r in results)
+
+
+def log_results(results: Sequence[BenchmarkResult]) -> None:
+    for r in results:
+        logger.info(
+            "%-8s %-30s %-20s c=%-3d p50=%8.2f p95=%8.2f p99=%8.2f мс "
+            "%8.1f rps ошибок %d",
+            r.backend,
+            r.query,
+            r.param,
+            r.concurrency,
+            r.p50_ms,
+            r.p95_ms,
+            r.p99_ms,
+            r.throughput,
+            r.errors,
+        )
+
+
+def log_cache_stats() -> None:
+    for backend, cache in (
+        ("db", req_db.permission_cache),
+        ("back4app", req_back4app.permission_cache),
+    ):
+        for name, stats in cache.stats().items():
+            logger.info(
+                "%-8s кеш прав %-10s попаданий %d промахов %d (%.1f%%)",
+                backend,
+                name,
+                stats.hits,
+                stats.misses,
+                100 * stats.hit_ratio,
+            )
+    for backend, result_cache in (
+        ("db", req_db.result_cache),
+        ("back4app", req_back4app.result_cache),
+        ("duckdb", req_duck.result_cache),
+    ):
+        for name, stats in result_cache.stats().items():
+            logger.info(
+                "%-8s кеш результатов %-6s попаданий %d промахов %d "
+                "вытеснено %d (%.1f%%)",
+                backend,
+                name,
+                stats.hits,
+                stats.misses,
+                stats.evictions,
+                100 * stats.hit_ratio,
+            )
+
+
+def parse_args(argv: Sequence[str] | None = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        description="Задержки запросов MySQL и Back4app"
+    )
+    parser.add_argument(
+        "--backends",
+        nargs="+",
+        choices=BACKENDS,
+        default=["db", "back4app"],
+        help="duckdb - файл --duckdb-path, заполненный командой duckdb",
+    )
+    parser.add_argument("--iterations", type=int, default=100)
+    parser.add_argument("--warmup", type=int, default=10)
+    parser.add_argument(
+        "--concurrency", nargs="+", type=int, default=[1, 4, 16]
+    )
+    parser.add_argument(
+        "--users",
+        nargs="*",
+        default=[],
+        help="имена для findUserDeviceTypes (по умолчанию - из БД)",
+    )
+    parser.add_argument(
+        "--users-sample",
+        type=int,
+        default=3,
+        help="сколько имён взять из БД, если --users не задан",
+    )
+    parser.add_argument(
+        "--db-url", default=DB_URL, help="например, локальная БД"
+    )
+    parser.add_argument(
+        "--db-async-url",
+        default=DB_ASYNC_URL,
+        help="та же БД с асинхронным драйвером (бэкенд db_async)",
+    )
+    parser.add_argument(
+        "--back4app-url",
+        default=SERVER_URL,
+        help="например, локальный mock Parse Server",
+    )
+    parser.add_argument("--duckdb-path", default=DUCKDB_PATH)
+    parser.add_argument("--json", type=Path)
+    parser.add_argument("--csv", type=Path)
+    return parser.parse_args(argv)
+
+
+def benchmark_user_names(
+    args: argparse.Namespace,
+    make_session: sessionmaker[Session],
+    duckdb_con: duckdb.DuckDBPyConnection | None,
+) -> list[str]:
+    """Пользователи из --users или выборка из БД (db) или DuckDB"""
+    if args.users:
+        return list(args.users)
+    if {"db", "db_async"} & set(args.backends):
+        with make_session() as session:
+            return sample_user_names(session, args.users_sample)
+    if duckdb_con is not None:
+        return [
+            name
+            for (name,) in duckdb_con.execute(
+                "SELECT name FROM Users ORDER BY id LIMIT $count",
+                {"count": args.users_sample},
+            ).fetchall()
+        ]
+    raise SystemExit("без бэкенда db или duckdb нужно указать --users")
+
+
+def main(argv: Sequence[str] | None = None) -> None:
+    logging.basicConfig(level=logging.INFO)
+    args = parse_args(argv)
+    pool_size = max(args.concurrency)
+
+    engine = create_db_engine(args.db_url, pool_size=pool_size)
+    make_session = sessionmaker(bind=engine)
+    if "db" in args.backends:
+        warm_up(engine, pool_size)
+
+    duckdb_con = (
+        connect(args.duckdb_path, read_only=True)
+        if "duckdb" in args.backends
+        else None
+    )
+
+    user_names = benchmark_user_names(args, make_session, duckdb_con)
+
+    queries: list[BenchmarkQuery] = []
+    if "db" in args.backends:
+        queries += db_queries(make_session, user_names)
+    if duckdb_con is not None:
+        queries += duckdb_queries(duckdb_con, user_names)
+
+    with asyncio.Runner() as runner, ExitStack() as stack:
+        # пул AsyncEngine привязан к циклу runner - все замеры в нём
+        async_engine = None
+        if "db_async" in args.backends:
+            async_engine = create_async_db_engine(
+                args.db_async_url, pool_size=pool_size
+            )
+            runner.run(warm_up_async(async_engine, pool_size))
+            queries += db_async_queries(
+                async_session_factory(async_engine), user_names
+            )
+        if "back4app" in args.backends:
+            application_id, rest_api_key = back4app_credentials()
+            back4app_api = stack.enter_context(
+                Back4AppApi(
+                    application_id=application_id,
+                    rest_api_key=rest_api_key,
+                    pool_size=pool_size,
+                    server_url=args.back4app_url,
+                )
+            )
+            queries += back4app_queries(back4app_api, user_names)
+
+        results = [
+            run_benchmark(
+                query,
+                iterations=args.iterations,
+                warmup=args.warmup,
+                concurrency=concurrency,
+                runner=runner,
+            )
+            for concurrency in args.concurrency
+            for query in queries
+        ]
+
+        if async_engine is not None:
+            log_pool_stats(async_engine.sync_engine)
+            runner.run(async_engine.dispose())
+
+    log_pool_stats(engine)
+    engine.dispose()
+    if duckdb_con is not None:
+        duckdb_con.close()
+
+    log_results(results)
+    log_cache_stats()
+    log_breakdown()
+    if args.json is not None:
+        write_json(results, args.json)
+    if args.csv is not None:
+        write_csv(results, args.csv)
+
+
+if __name__ == "__main__":
+    main()
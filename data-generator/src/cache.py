@@ -0,0 +1,394 @@
+import functools
+import inspect
+import pickle
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from collections.abc import Callable, Iterable, Mapping, Sequence
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, cast
+
+from config import RESULT_CACHE_PATH
+
+# Бэкенды, чьи записи отслеживаются: "db" - MySQL, "back4app" - Parse
+type WriteListener = Callable[[str, frozenset[str]], None]
+
+_write_listeners: list[WriteListener] = []
+
+
+def on_write(listener: WriteListener) -> None:
+    """listener(backend, tables) вызывается после записи генератором"""
+    _write_listeners.append(listener)
+
+
+def notify_write(backend: str, tables: Iterable[str]) -> None:
+    names = frozenset(tables)
+    if not names:
+        return
+    for listener in _write_listeners:
+        listener(backend, names)
+
+
+@dataclass
+class CacheStats:
+    hits: int = 0
+    misses: int = 0
+    # записи, вытесненные по размеру или истёкшие по TTL
+    evictions: int = 0
+
+    @property
+    def hit_ratio(self) -> float:
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+
+class TTLCache[K, V]:
+    """
+    LRU на maxsize записей, запись живёт ttl секунд.
+    Потокобезопасен - кеш общий для потоков бенчмарка
+    """
+
+    def __init__(
+        self,
+        maxsize: int,
+        ttl: float,
+        *,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.clock = clock
+        self.stats = CacheStats()
+        self._items: OrderedDict[K, tuple[float, V]] = OrderedDict()
+        self._lock = threading.Lock()
+        # растёт при clear: значение, загруженное до сброса, не сохраняется
+        self._generation = 0
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+    def get_or_load(self, key: K, load: Callable[[], V]) -> V:
+        """
+        Значение из кеша или load() при промахе. load выполняется
+        без блокировки, одновременные промахи по ключу загрузят его дважды
+        """
+        now = self.clock()
+        with self._lock:
+            generation = self._generation
+            item = self._items.get(key)
+            if item is not None and item[0] > now:
+                self._items.move_to_end(key)
+                self.stats.hits += 1
+                return item[1]
+            if item is not None:
+                del self._items[key]
+                self.stats.evictions += 1
+            self.stats.misses += 1
+
+        value = load()
+        with self._lock:
+            if generation != self._generation:
+                return value
+            self._items[key] = (now + self.ttl, value)
+            self._items.move_to_end(key)
+            while len(self._items) > self.maxsize:
+                self._items.popitem(last=False)
+                self.stats.evictions += 1
+        return value
+
+    def clear(self) -> None:
+        with self._lock:
+            self._items.clear()
+            self._generation += 1
+
+
+# Таблицы, от которых зависят права пользователей на типы устройств
+PERMISSION_TABLES = frozenset(
+    {"Users", "UserTypes", "DeviceTypes", "DeviceTypesToUserTypes"}
+)
+
+# тип пользователя -> [(тип устройства, название)]
+type PermissionMatrix = Mapping[str, Sequence[tuple[str, str]]]
+
+
+class PermissionCache:
+    """
+    Права пользователей на типы устройств для одного бэкенда:
+    имя -> типы пользователей через TTLCache, тип пользователя ->
+    типы устройств - матрица целиком в словаре (она маленькая).
+    Сбрасывается при записи генератором в PERMISSION_TABLES бэкенда
+    """
+
+    def __init__(self, backend: str, maxsize: int, ttl: float) -> None:
+        self.backend = backend
+        self.user_types = TTLCache[str, tuple[str, ...]](maxsize, ttl)
+        self.matrix_stats = CacheStats()
+        self._matrix: PermissionMatrix | None = None
+        self._lock = threading.Lock()
+        self._generation = 0
+        on_write(self._on_write)
+
+    def _on_write(self, backend: str, tables: frozenset[str]) -> None:
+        if backend == self.backend and tables & PERMISSION_TABLES:
+            self.invalidate()
+
+    def invalidate(self) -> None:
+        self.user_types.clear()
+        with self._lock:
+            self._matrix = None
+            self._generation += 1
+
+    def matrix(self, load: Callable[[], PermissionMatrix]) -> PermissionMatrix:
+        with self._lock:
+            if self._matrix is not None:
+                self.matrix_stats.hits += 1
+                return self._matrix
+            self.matrix_stats.misses += 1
+            generation = self._generation
+        matrix = load()
+        with self._lock:
+            if generation == self._generation:
+                self._matrix = matrix
+        return matrix
+
+    def device_types(
+        self,
+        user_name: str,
+        load_user_types: Callable[[], Sequence[str]],
+        load_matrix: Callable[[], PermissionMatrix],
+    ) -> list[tuple[str, str, str]]:
+        """
+        (тип пользователя, тип устройства, название) для всех
+        пользователей с именем user_name
+        """
+        user_types = self.user_types.get_or_load(
+            user_name, lambda: tuple(load_user_types())
+        )
+        if not user_types:
+            return []
+        matrix = self.matrix(load_matrix)
+        return [
+            (user_type, device_type, device_name)
+            for user_type in user_types
+            for device_type, device_name in matrix.get(user_type, ())
+        ]
+
+    def stats(self) -> dict[str, CacheStats]:
+        return {
+            "user_types": self.user_types.stats,
+            "matrix": self.matrix_stats,
+        }
+
+
+class SQLiteStore:
+    """
+    Второй уровень кеша результатов в файле SQLite: результаты (pickle)
+    и версии таблиц. Файл общий для процессов, поэтому запись
+    генератором в одном процессе сбрасывает кеш в другом
+    """
+
+    def __init__(self, path: Path) -> None:
+        self.path = path
+        self._lock = threading.Lock()
+        self._db: sqlite3.Connection | None = None
+
+    def _connection(self) -> sqlite3.Connection:
+        """Файл открывается при первом обращении, а не при импорте"""
+        if self._db is None:
+            db = sqlite3.connect(
+                self.path, check_same_thread=False, isolation_level=None
+            )
+            db.executescript(
+                """CREATE TABLE IF NOT EXISTS results (
+    key TEXT PRIMARY KEY,
+    expires REAL NOT NULL,
+    value BLOB NOT NULL
+);
+CREATE TABLE IF NOT EXISTS versions (
+    backend TEXT NOT NULL,
+    name TEXT NOT NULL,
+    version INTEGER NOT NULL,
+    PRIMARY KEY (backend, name)
+);"""
+            )
+            db.execute(
+                "DELETE FROM results WHERE expires <= ?", (time.time(),)
+            )
+            self._db = db
+        return self._db
+
+    def close(self) -> None:
+        with self._lock:
+            if self._db is not None:
+                self._db.close()
+                self._db = None
+
+    def get(self, key: str) -> tuple[bool, Any]:
+        with self._lock:
+            row = (
+                self._connection()
+                .execute(
+                    "SELECT value FROM results WHERE key = ? AND expires > ?",
+                    (key, time.time()),
+                )
+                .fetchone()
+            )
+        if row is None:
+            return False, None
+        # файл пишет только этот кеш
+        return True, pickle.loads(row[0])
+
+    def put(self, key: str, value: object, ttl: float) -> None:
+        data = pickle.dumps(value)
+        now = time.time()
+        with self._lock:
+            self._connection().execute(
+                "INSERT OR REPLACE INTO results VALUES (?, ?, ?)",
+                (key, now + ttl, data),
+            )
+
+    def purge(self) -> None:
+        """Удаление истёкших результатов"""
+        with self._lock:
+            self._connection().execute(
+                "DELETE FROM results WHERE expires <= ?", (time.time(),)
+            )
+
+    def versions(self, backend: str, tables: Sequence[str]) -> tuple[int, ...]:
+        with self._lock:
+            rows = dict(
+                self._connection()
+                .execute(
+                    "SELECT name, version FROM versions WHERE backend = ?",
+                    (backend,),
+                )
+                .fetchall()
+            )
+        return tuple(rows.get(table, 0) for table in tables)
+
+    def bump(self, backend: str, tables: Iterable[str]) -> None:
+        with self._lock:
+            self._connection().executemany(
+                "INSERT INTO versions VALUES (?, ?, 1) "
+                "ON CONFLICT (backend, name) "
+                "DO UPDATE SET version = version + 1",
+                [(backend, table) for table in tables],
+            )
+
+
+class TableVersions:
+    """
+    Счётчики записей генераторами по таблицам бэкендов.
+    Результат в кеше помнит версии своих таблиц и не совпадает
+    с ключом после записи в них. При store счётчики хранятся в файле
+    """
+
+    def __init__(self, store: SQLiteStore | None = None) -> None:
+        self.store = store
+        self._versions: dict[tuple[str, str], int] = {}
+        self._lock = threading.Lock()
+
+    def get(self, backend: str, tables: Sequence[str]) -> tuple[int, ...]:
+        if self.store is not None:
+            return self.store.versions(backend, tables)
+        with self._lock:
+            return tuple(
+                self._versions.get((backend, table), 0) for table in tables
+            )
+
+    def bump(self, backend: str, tables: frozenset[str]) -> None:
+        if self.store is not None:
+            self.store.bump(backend, tables)
+            return
+        with self._lock:
+            for table in tables:
+                key = (backend, table)
+                self._versions[key] = self._versions.get(key, 0) + 1
+
+
+store = SQLiteStore(Path(RESULT_CACHE_PATH)) if RESULT_CACHE_PATH else None
+
+table_versions = TableVersions(store)
+on_write(table_versions.bump)
+
+
+class ResultCache:
+    """
+    Кеш результатов запросов одного бэкенда: LRU в памяти и, если задан
+    store, файл SQLite. Ключ - функция, параметры и версии таблиц,
+    от которых зависит результат
+    """
+
+    def __init__(
+        self,
+        backend: str,
+        maxsize: int,
+        ttl: float,
+        *,
+        versions: TableVersions = table_versions,
+        store: SQLiteStore | None = store,
+    ) -> None:
+        self.backend = backend
+        self.ttl = ttl
+        self.memory = TTLCache[str, Any](maxsize, ttl)
+        self.versions = versions
+        self.store = store
+        self.store_stats = CacheStats()
+
+    def get_or_load(
+        self, key: str, tables: Sequence[str], load: Callable[[], Any]
+    ) -> Any:  # noqa: ANN401
+        versioned = (
+            f"{self.backend}:{key}:{self.versions.get(self.backend, tables)}"
+        )
+
+        def load_from_store() -> Any:  # noqa: ANN401
+            if self.store is None:
+                return load()
+            found, value = self.store.get(versioned)
+            if found:
+                self.store_stats.hits += 1
+                return value
+            self.store_stats.misses += 1
+            value = load()
+            self.store.put(versioned, value, self.ttl)
+            return value
+
+        return self.memory.get_or_load(versioned, load_from_store)
+
+    def cached[**P, R](
+        self, *tables: str
+    ) -> Callable[[Callable[P, R]], Callable[P, R]]:
+        """
+        Декоратор запроса fn(session_или_api, *args, **kwargs): первый
+        параметр в ключ не входит, остальные - через repr, по именам
+        и со значениями по умолчанию, как бы их ни передали
+        """
+
+        def decorator(fn: Callable[P, R]) -> Callable[P, R]:
+            signature = inspect.signature(fn)
+            first = next(iter(signature.parameters))
+
+            @functools.wraps(fn)
+            def wrapper(*args: P.args, **kwargs: P.kwargs) -> R:
+                bound = signature.bind(*args, **kwargs)
+                bound.apply_defaults()
+                params = [
+                    item
+                    for item in bound.arguments.items()
+                    if item[0] != first
+                ]
+                key = f"{fn.__qualname__}:{params!r}"
+                return cast(
+                    "R",
+                    self.get_or_load(key, tables, lambda: fn(*args, **kwargs)),
+                )
+
+            return wrapper
+
+        return decorator
+
+    def stats(self) -> dict[str, CacheStats]:
+        return {"memory": self.memory.stats, "store": self.store_stats}
@@ -9,11 +9,93 @@ DB_PASSWORD = os.getenv("DB_PASSWORD")
 DB_HOST = os.getenv("DB_HOST")
 DB_PORT = os.getenv("DB_PORT")
 DB_NAME = os.getenv("DB_NAME")
+# Драйвер MySQL: pymysql (чистый Python) или mysqldb (mysqlclient на C,
+# extra mysqlclient)
+DB_DRIVER = os.getenv("DB_DRIVER", "pymysql")
+DB_CHARSET = os.getenv("DB_CHARSET", "utf8mb4")
 
 DB_URL = (
-    f"mysql+pymysql://{DB_USER}:{DB_PASSWORD}@{DB_HOST}:{DB_PORT}/{DB_NAME}"
+    f"mysql+{DB_DRIVER}://{DB_USER}:{DB_PASSWORD}@{DB_HOST}:{DB_PORT}/{DB_NAME}"
+    f"?charset={DB_CHARSET}"
 )
 
+# Пул соединений MySQL: постоянных соединений и временных сверх них,
+# пересоздание соединения через DB_POOL_RECYCLE секунд, ожидание
+# свободного соединения. DB_POOL_PRE_PING=1 - проверка соединения перед
+# выдачей (лишний запрос к серверу на каждую выдачу).
+# DB_ISOLATION_LEVEL: пусто - уровень сервера, READ COMMITTED,
+# REPEATABLE READ, AUTOCOMMIT...
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "10"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "3600"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))
+DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "0") != "0"
+DB_ISOLATION_LEVEL = os.getenv("DB_ISOLATION_LEVEL", "")
+# Соединений пула db_conn.engine, открываемых при запуске
+# (по умолчанию - DB_POOL_SIZE); 0 - не прогревать
+DB_POOL_WARMUP = int(os.getenv("DB_POOL_WARMUP", str(DB_POOL_SIZE)))
+
+# Асинхронный драйвер MySQL для AsyncEngine (в зависимостях - aiomysql).
+# DB_ASYNC_CONCURRENCY - одновременных запросов из одного цикла событий,
+# столько же соединений в пуле AsyncEngine
+DB_ASYNC_DRIVER = os.getenv("DB_ASYNC_DRIVER", "aiomysql")
+DB_ASYNC_URL = (
+    f"mysql+{DB_ASYNC_DRIVER}://{DB_USER}:{DB_PASSWORD}@{DB_HOST}:{DB_PORT}"
+    f"/{DB_NAME}?charset={DB_CHARSET}"
+)
+DB_ASYNC_CONCURRENCY = int(os.getenv("DB_ASYNC_CONCURRENCY", "100"))
+
 
 BACK4APP_APPLICATION_ID = os.getenv("BACK4APP_APPLICATION_ID")
 BACK4APP_REST_API_KEY = os.getenv("BACK4APP_REST_API_KEY")
+BACK4APP_POOL_SIZE = int(os.getenv("BACK4APP_POOL_SIZE", "10"))
+
+
+def back4app_credentials() -> tuple[str, str]:
+    """Ключи Back4app из .env, без них - выход с сообщением"""
+    if not BACK4APP_APPLICATION_ID or not BACK4APP_REST_API_KEY:
+        msg = (
+            "Не заданы BACK4APP_APPLICATION_ID и BACK4APP_REST_API_KEY "
+            "(для локального Parse Server подойдут любые значения)"
+        )
+        raise SystemExit(msg)
+    return BACK4APP_APPLICATION_ID, BACK4APP_REST_API_KEY
+
+
+# Адрес Parse Server: Back4app или локальный mock (bass/mock_server.py)
+BACK4APP_SERVER_URL = os.getenv(
+    "BACK4APP_SERVER_URL", "https://parseapi.back4app.com/"
+)
+
+# Локальный Parse Server: порт, задержка ответа (см. Latency),
+# запросов в секунду до 429 (0 - без лимита), доля ответов 500 и seed
+MOCK_PORT = int(os.getenv("MOCK_PORT", "1337"))
+MOCK_LATENCY = os.getenv("MOCK_LATENCY", "constant:0")
+MOCK_RATE_LIMIT = float(os.getenv("MOCK_RATE_LIMIT", "0"))
+MOCK_ERROR_RATE = float(os.getenv("MOCK_ERROR_RATE", "0"))
+MOCK_SEED = int(os.getenv("MOCK_SEED", "0"))
+
+# Множитель объёма генерируемых данных (1 - 200 домов, 400 измерений)
+SCALE_FACTOR = float(os.getenv("SCALE_FACTOR", "1"))
+
+# Секции Measures: сколько месяцев создавать вперёд и сколько хранить
+MEASURES_PARTITIONS_AHEAD = int(os.getenv("MEASURES_PARTITIONS_AHEAD", "3"))
+MEASURES_RETENTION_MONTHS = int(os.getenv("MEASURES_RETENTION_MONTHS", "12"))
+
+# Кеш прав пользователей на типы устройств: имён в LRU и их TTL, секунд
+PERMISSION_CACHE_SIZE = int(os.getenv("PERMISSION_CACHE_SIZE", "1024"))
+PERMISSION_CACHE_TTL = float(os.getenv("PERMISSION_CACHE_TTL", "300"))
+
+# Кеш результатов запросов: записей в памяти, TTL в секундах и файл
+# SQLite для второго уровня (пусто - только память)
+RESULT_CACHE_SIZE = int(os.getenv("RESULT_CACHE_SIZE", "256"))
+RESULT_CACHE_TTL = float(os.getenv("RESULT_CACHE_TTL", "60"))
+RESULT_CACHE_PATH = os.getenv("RESULT_CACHE_PATH", "")
+
+# Файл встроенной DuckDB (":memory:" - без файла)
+DUCKDB_PATH = os.getenv("DUCKDB_PATH", "smart_home.duckdb")
+
+# Замеры выражений SQL, запросов HTTP и операций (timing.py):
+# 0 - без хуков, TIMING_TOP - строк на вид в итоговой сводке
+TIMING_ENABLED = os.getenv("TIMING_ENABLED", "1") != "0"
+TIMING_TOP = int(os.getenv("TIMING_TOP", "15"))
@@ -1,8 +1,148 @@
-from sqlalchemy import create_engine
+import threading
+import time
+from contextlib import ExitStack
+from dataclasses import dataclass, field
+from logging import getLogger
+from typing import Any
+
+from sqlalchemy import Engine, create_engine
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import PoolProxiedConnection, QueuePool
+
+from config import (
+    DB_ISOLATION_LEVEL,
+    DB_MAX_OVERFLOW,
+    DB_POOL_PRE_PING,
+    DB_POOL_RECYCLE,
+    DB_POOL_SIZE,
+    DB_POOL_TIMEOUT,
+    DB_URL,
+)
+from timing import instrument_engine, registry
+
+logger = getLogger(name=__name__)
+
+
+@dataclass(slots=True)
+class PoolMetrics:
+    """Выдачи соединений пула: ожидание и число занятых"""
+
+    checkouts: int = 0
+    # ожидание свободного соединения (или создания нового), секунд
+    wait_total: float = 0.0
+    wait_max: float = 0.0
+    peak_in_use: int = 0
+    _lock: threading.Lock = field(default_factory=threading.Lock, repr=False)
+
+    def checkout(self, wait: float, in_use: int) -> None:
+        with self._lock:
+            self.checkouts += 1
+            self.wait_total += wait
+            self.wait_max = max(self.wait_max, wait)
+            self.peak_in_use = max(self.peak_in_use, in_use)
+
+
+class MeteredQueuePool(QueuePool):
+    """
+    QueuePool с PoolMetrics: замер вокруг Pool.connect(), через который
+    соединения берут движок и сессии, занятые - по checkedout().
+    Ожидание выдачи попадает и в timing (вид "pool") - с операцией,
+    которая ждала соединение
+    """
+
+    def __init__(self, *args: Any, **kwargs: Any) -> None:  # noqa: ANN401
+        super().__init__(*args, **kwargs)
+        self.metrics = PoolMetrics()
+
+    def connect(self) -> PoolProxiedConnection:
+        start = time.perf_counter()
+        connection = super().connect()
+        wait = time.perf_counter() - start
+        self.metrics.checkout(wait, self.checkedout())
+        registry.record("pool", "checkout", wait)
+        return connection
+
+    def recreate(self) -> QueuePool:
+        """После engine.dispose() метрики продолжаются"""
+        pool = super().recreate()
+        if isinstance(pool, MeteredQueuePool):
+            pool.metrics = self.metrics
+        return pool
+
+
+def create_db_engine(  # noqa: PLR0913
+    url: str = DB_URL,
+    *,
+    pool_size: int = DB_POOL_SIZE,
+    max_overflow: int = DB_MAX_OVERFLOW,
+    pool_recycle: int = DB_POOL_RECYCLE,
+    pool_pre_ping: bool = DB_POOL_PRE_PING,
+    pool_timeout: float = DB_POOL_TIMEOUT,
+    isolation_level: str = DB_ISOLATION_LEVEL,
+) -> Engine:
+    """
+    Движок MySQL с настройками пула из config. Драйвер - в url
+    (DB_DRIVER: pymysql или mysqldb). isolation_level пустой -
+    уровень сервера, "AUTOCOMMIT" - без транзакций для чтения
+    """
+    options: dict[str, Any] = {}
+    if isolation_level:
+        options["isolation_level"] = isolation_level
+    engine = create_engine(
+        url,
+        poolclass=MeteredQueuePool,
+        pool_size=pool_size,
+        max_overflow=max_overflow,
+        pool_recycle=pool_recycle,
+        pool_pre_ping=pool_pre_ping,
+        pool_timeout=pool_timeout,
+        # local_infile - для загрузки через LOAD DATA LOCAL INFILE
+        connect_args={"local_infile": True},
+        **options,
+    )
+    instrument_engine(engine)
+    return engine
+
+
+def warm_up(engine: Engine, connections: int) -> None:
+    """
+    Открывает connections соединений заранее и возвращает их в пул:
+    первые параллельные запросы не ждут подключения к серверу.
+    Сверх pool_size соединения при возврате закрываются - их не открываем
+    """
+    if isinstance(engine.pool, QueuePool):
+        connections = min(connections, engine.pool.size())
+    start = time.perf_counter()
+    with ExitStack() as stack:
+        for _ in range(connections):
+            stack.enter_context(engine.connect())
+    logger.info(
+        "Пул прогрет: %d соединений за %.2f с",
+        connections,
+        time.perf_counter() - start,
+    )
+
+
+def pool_metrics(engine: Engine) -> PoolMetrics | None:
+    pool = engine.pool
+    return pool.metrics if isinstance(pool, MeteredQueuePool) else None
+
+
+def log_pool_stats(engine: Engine) -> None:
+    metrics = pool_metrics(engine)
+    if metrics is None or not metrics.checkouts:
+        return
+    logger.info(
+        "Пул: %s; выдач %d, ожидание среднее %.2f / макс. %.2f мс, "
+        "занято одновременно до %d",
+        engine.pool.status(),
+        metrics.checkouts,
+        1000 * metrics.wait_total / metrics.checkouts,
+        1000 * metrics.wait_max,
+        metrics.peak_in_use,
+    )
 
-from config import DB_URL
 
-engine = create_engine(DB_URL, echo=False)
+engine = create_db_engine()
 
 Session = sessionmaker(bind=engine)
@@ -0,0 +1,91 @@
+import asyncio
+import time
+from contextlib import AsyncExitStack
+from logging import getLogger
+from typing import Any
+
+from sqlalchemy.ext.asyncio import (
+    AsyncEngine,
+    AsyncSession,
+    async_sessionmaker,
+    create_async_engine,
+)
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+
+from config import (
+    DB_ASYNC_CONCURRENCY,
+    DB_ASYNC_URL,
+    DB_ISOLATION_LEVEL,
+    DB_POOL_PRE_PING,
+    DB_POOL_RECYCLE,
+    DB_POOL_TIMEOUT,
+)
+from db.db_conn import MeteredQueuePool
+from timing import instrument_engine
+
+logger = getLogger(name=__name__)
+
+# Движок не создаётся при импорте, как db_conn.engine: очередь пула
+# AsyncEngine привязана к циклу событий, в котором её впервые ждали
+
+
+class MeteredAsyncQueuePool(MeteredQueuePool, AsyncAdaptedQueuePool):
+    """MeteredQueuePool для AsyncEngine: ожидание соединения - в asyncio"""
+
+
+def create_async_db_engine(  # noqa: PLR0913
+    url: str = DB_ASYNC_URL,
+    *,
+    pool_size: int = DB_ASYNC_CONCURRENCY,
+    max_overflow: int = 0,
+    pool_recycle: int = DB_POOL_RECYCLE,
+    pool_pre_ping: bool = DB_POOL_PRE_PING,
+    pool_timeout: float = DB_POOL_TIMEOUT,
+    isolation_level: str = DB_ISOLATION_LEVEL,
+) -> AsyncEngine:
+    """
+    AsyncEngine с теми же настройками пула, что create_db_engine.
+    Драйвер - в url (DB_ASYNC_DRIVER, по умолчанию aiomysql).
+    Выражения SQL замеряются хуками синхронного движка под ним
+    """
+    options: dict[str, Any] = {}
+    if isolation_level:
+        options["isolation_level"] = isolation_level
+    engine = create_async_engine(
+        url,
+        poolclass=MeteredAsyncQueuePool,
+        pool_size=pool_size,
+        max_overflow=max_overflow,
+        pool_recycle=pool_recycle,
+        pool_pre_ping=pool_pre_ping,
+        pool_timeout=pool_timeout,
+        **options,
+    )
+    instrument_engine(engine.sync_engine)
+    return engine
+
+
+def async_session_factory(
+    engine: AsyncEngine,
+) -> async_sessionmaker[AsyncSession]:
+    return async_sessionmaker(bind=engine, expire_on_commit=False)
+
+
+async def warm_up_async(engine: AsyncEngine, connections: int) -> None:
+    """warm_up для AsyncEngine: соединения открываются параллельно"""
+    pool = engine.sync_engine.pool
+    if isinstance(pool, AsyncAdaptedQueuePool):
+        connections = min(connections, pool.size())
+    start = time.perf_counter()
+    async with AsyncExitStack() as stack:
+        await asyncio.gather(
+            *(
+                stack.enter_async_context(engine.connect())
+                for _ in range(connections)
+            )
+        )
+    logger.info(
+        "Пул прогрет: %d соединений за %.2f с",
+        connections,
+        time.perf_counter() - start,
+    )
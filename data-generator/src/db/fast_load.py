@@ -0,0 +1,196 @@
+import os
+import tempfile
+import threading
+from collections.abc import Generator, Iterable, Iterator, Sequence
+from concurrent.futures import Future, ThreadPoolExecutor, wait
+from contextlib import contextmanager, suppress
+from datetime import datetime
+from itertools import chain, takewhile
+from pathlib import Path
+from typing import Any
+
+from sqlalchemy import ForeignKeyConstraint, Table, inspect, text
+from sqlalchemy.orm import Session
+from sqlalchemy.schema import (
+    AddConstraint,
+    CreateIndex,
+    DropConstraint,
+    DropIndex,
+)
+
+# Формат LOAD DATA по умолчанию: поля через \t, строки через \n,
+# экранирование обратным слэшем, NULL - \N
+NULL = r"\N"
+
+_ESCAPES = str.maketrans(
+    {
+        "\\": "\\\\",
+        "\t": "\\t",
+        "\n": "\\n",
+        "\r": "\\r",
+        "\0": "\\0",
+    }
+)
+
+
+def to_tsv_field(value: object) -> str:
+    if value is None:
+        return NULL
+    if isinstance(value, bool):
+        return str(int(value))
+    if isinstance(value, datetime):
+        # как pymysql: без часового пояса
+        return value.strftime("%Y-%m-%d %H:%M:%S.%f")
+    if isinstance(value, str):
+        return value.translate(_ESCAPES)
+    return str(value)
+
+
+def tsv_lines(
+    rows: Iterable[dict[str, Any]], columns: Sequence[str]
+) -> Iterator[str]:
+    for row in rows:
+        yield "\t".join(to_tsv_field(row[column]) for column in columns)
+        yield "\n"
+
+
+def write_tsv(path: Path, lines: Iterable[str]) -> None:
+    with path.open("w", encoding="utf-8", newline="\n") as file:
+        file.writelines(lines)
+
+
+def _write_fifo(
+    path: Path, lines: Iterable[str], stop: threading.Event
+) -> None:
+    # читатель закрыл канал - ошибку вернёт сам LOAD DATA
+    with suppress(BrokenPipeError):
+        write_tsv(path, takewhile(lambda _: not stop.is_set(), lines))
+
+
+def _drain_fifo(path: Path, writer: Future[None]) -> None:
+    """
+    Чтение канала до остановки писателя, иначе он зависнет
+    на open или на записи в заполненный канал
+    """
+    fd = os.open(path, os.O_RDONLY | os.O_NONBLOCK)
+    try:
+        while not writer.done():
+            with suppress(BlockingIOError):
+                os.read(fd, 1 << 16)
+            wait([writer], timeout=0.01)
+    finally:
+        os.close(fd)
+
+
+def load_rows(
+    session: Session,
+    table: Table,
+    rows: Iterable[dict[str, Any]],
+    *,
+    fifo: bool = False,
+) -> None:
+    """Загрузка строк-словарей через LOAD DATA LOCAL INFILE"""
+    it = iter(rows)
+    first = next(it, None)
+    if first is None:
+        return
+    columns = list(first)
+    load_tsv(
+        session,
+        table,
+        columns,
+        tsv_lines(chain([first], it), columns),
+        fifo=fifo,
+    )
+
+
+def load_tsv(
+    session: Session,
+    table: Table,
+    columns: Sequence[str],
+    lines: Iterable[str],
+    *,
+    fifo: bool = False,
+) -> None:
+    """
+    Загрузка готового TSV (столбцы columns) через LOAD DATA LOCAL INFILE.
+    Текст пишется во временный файл, а при fifo=True - в именованный
+    канал, который сервер читает одновременно с генерацией
+    """
+    preparer = session.get_bind().dialect.identifier_preparer
+    statement = text(
+        "LOAD DATA LOCAL INFILE :path "
+        f"INTO TABLE {preparer.format_table(table)} "
+        "CHARACTER SET utf8mb4 "
+        f"({', '.join(preparer.quote(column) for column in columns)})"
+    )
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = Path(tmp) / f"{table.name}.tsv"
+
+        if not fifo:
+            write_tsv(path, lines)
+            session.execute(statement, {"path": str(path)})
+            return
+
+        os.mkfifo(path)
+        stop = threading.Event()
+        with ThreadPoolExecutor(max_workers=1) as pool:
+            # ошибка писателя поднимется из writer.result()
+            writer = pool.submit(_write_fifo, path, lines, stop)
+            try:
+                session.execute(statement, {"path": str(path)})
+            except BaseException:
+                stop.set()
+                _drain_fifo(path, writer)
+                raise
+            writer.result()
+
+
+@contextmanager
+def checks_disabled(session: Session) -> Generator[None]:
+    """
+    Отключение проверок внешних ключей и уникальности
+    на соединении сессии
+    """
+    session.execute(text("SET foreign_key_checks = 0, unique_checks = 0"))
+    try:
+        yield
+    finally:
+        # соединение вернётся в пул - возвращаем проверки
+        session.execute(text("SET foreign_key_checks = 1, unique_checks = 1"))
+
+
+@contextmanager
+def keys_dropped(session: Session, tables: Sequence[Table]) -> Generator[None]:
+    """
+    Удаление внешних ключей и вторичных индексов tables на время загрузки,
+    после загрузки они создаются заново (индекс строится один раз,
+    а не обновляется на каждую строку).
+    DDL в MySQL завершает текущую транзакцию
+    """
+    # Только ключи, которые есть в БД: ключ с ddl_if (Measures -> Devices)
+    # на секционированной таблице не создается
+    inspector = inspect(session.connection())
+    foreign_keys: list[ForeignKeyConstraint] = []
+    for table in tables:
+        existing = {
+            key["name"] for key in inspector.get_foreign_keys(table.name)
+        }
+        foreign_keys += [
+            fk for fk in table.foreign_key_constraints if fk.name in existing
+        ]
+    indexes = [index for table in tables for index in table.indexes]
+
+    for fk in foreign_keys:
+        session.execute(DropConstraint(fk))
+    for index in indexes:
+        session.execute(DropIndex(index))
+
+    try:
+        yield
+    finally:
+        for index in indexes:
+            session.execute(CreateIndex(index))
+        for fk in foreign_keys:
+            session.execute(AddConstraint(fk))
@@ -1,12 +1,33 @@
+import asyncio
+import csv
+import json
 import random
+from collections.abc import Callable, Generator, Iterable, Iterator, Sequence
+from contextlib import ExitStack, contextmanager, nullcontext
 from datetime import UTC, datetime, time, timedelta
 from decimal import Decimal
+from itertools import batched, chain
 from logging import getLogger
+from pathlib import Path
+from time import perf_counter
+from typing import Any, Literal, cast
 
+import numpy as np
 from faker import Faker
-from sqlalchemy.orm import Session
+from sqlalchemy import Select, Table, func, insert, select
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+from sqlalchemy.orm import Session, sessionmaker
 from tqdm import tqdm
 
+from cache import notify_write
+from config import DB_ASYNC_CONCURRENCY
+from db.fast_load import checks_disabled, keys_dropped, load_rows, load_tsv
+from db.measure_stats import (
+    DeviceStats,
+    collect_columns,
+    collect_rows,
+    upsert_measure_stats,
+)
 from db.models import (
     ActivationsToDevices,
     Base,
@@ -21,39 +42,303 @@ from db.models import (
     Users,
     UserTypes,
 )
+from db.partitions import add_partitions
+from db.vectorized import (
+    Columns,
+    column_count,
+    column_rows,
+    column_tuples,
+    events_chunks,
+    measures_chunks,
+    tsv_block,
+)
+from scale import CHUNK_SIZE, GenerationCounts
+from scheduler import Stage, derive_seed, run_stages
+from shards import ShardPool, shard_faker
+from timing import operation
 
 logger = getLogger(name=__name__)
 
-random.seed(42)
+type Row = dict[str, Any]
+type StageFill = Callable[[Session, random.Random, Faker], None]
+
+# orm - unit of work, bulk - executemany, infile/fifo - LOAD DATA LOCAL
+# INFILE через временный файл / именованный канал
+type InsertMode = Literal["orm", "bulk", "infile", "fifo"]
+
+INSERT_MODES: tuple[InsertMode, ...] = ("orm", "bulk", "infile", "fifo")
 
-Faker.seed(42)
+SEED = 42
+
+DEVICES_PER_HOUSE = 6
+
+rng = random.Random(SEED)
 
 fake = Faker("ru_RU")
+fake.seed_instance(SEED)
 
 
-def generate_time_between(hour_start: int, hour_end: int) -> time:
+def generate_time_between(
+    hour_start: int, hour_end: int, *, rng: random.Random = rng
+) -> time:
     """Случайное время в диапазоне часов"""
-    hour = random.randint(hour_start, hour_end)
-    minute = random.randint(0, 59)
+    hour = rng.randint(hour_start, hour_end)
+    minute = rng.randint(0, 59)
     return time(hour, minute)
 
 
-def create_reference_data(
+def first_free_id(table: Table) -> Select[tuple[int]]:
+    """max(id) + 1: первичные ключи новых строк назначаются заранее"""
+    return select(func.coalesce(func.max(table.c.id), 0) + 1)
+
+
+def extend_id_run(table: Table, ids: range, objects: Sequence[Any]) -> range:
+    """
+    ids, продолженный id только что записанной пачки objects.
+    Id должны идти подряд, иначе их нельзя вернуть как range
+    """
+    first = ids.stop if ids else objects[0].id
+    if (objects[0].id, objects[-1].id) != (first, first + len(objects) - 1):
+        msg = f"{table.name}: id новых строк идут не подряд"
+        raise RuntimeError(msg)
+    return range(ids.start if ids else first, first + len(objects))
+
+
+def insert_orm(
+    session: Session, model: type[Base], rows: Iterable[Row], chunk_size: int
+) -> Sequence[int]:
+    """
+    insert_rows в режиме orm: id выдаёт AUTO_INCREMENT при flush.
+    Таблицу пишет одна сессия, поэтому id идут подряд
+    """
+    table = cast("Table", model.__table__)
+    ids = range(0)
+    for chunk in batched(rows, chunk_size, strict=False):
+        objects: list[Any] = [model(**row) for row in chunk]
+        session.add_all(objects)
+        session.flush()
+        if "id" in table.c:
+            ids = extend_id_run(table, ids, objects)
+        for obj in objects:
+            session.expunge(obj)
+    notify_write("db", [table.name])
+    return ids
+
+
+def insert_rows(
     session: Session,
-) -> tuple[list[UserTypes], list[DeviceTypes]]:
-    """Создаём справочники — их обычно немного и они стабильны"""
+    model: type[Base],
+    rows: Iterable[Row],
+    *,
+    mode: InsertMode = "orm",
+    chunk_size: int = CHUNK_SIZE,
+) -> Sequence[int]:
+    """
+    Запись строк в таблицу модели пачками по chunk_size, строки
+    генерируются лениво, поэтому память не растёт с объёмом данных.
+    Возвращает id новых строк как range (для таблиц-связей без id -
+    пустой). В режимах bulk/infile/fifo запись идёт в обход
+    unit of work, первичные ключи назначаются заранее
+    """
+    if mode == "orm":
+        return insert_orm(session, model, rows, chunk_size)
+
+    table = cast("Table", model.__table__)
+    has_id = "id" in table.c
+
+    start = next_id = 1
+    if has_id:
+        start = next_id = session.execute(first_free_id(table)).scalar_one()
+
+    def with_ids(rows: Iterable[Row]) -> Iterator[Row]:
+        nonlocal next_id
+        for row in rows:
+            row["id"] = next_id
+            next_id += 1
+            yield row
+
+    if has_id:
+        rows = with_ids(rows)
+
+    if mode == "bulk":
+        for chunk in batched(rows, chunk_size, strict=False):
+            session.execute(insert(table), list(chunk))
+    else:
+        load_rows(session, table, rows, fifo=mode == "fifo")
+
+    notify_write("db", [table.name])
+    return range(start, next_id) if has_id else []
+
+
+def insert_columns(
+    session: Session,
+    model: type[Base],
+    chunks: Iterable[Columns],
+    *,
+    mode: InsertMode = "orm",
+    chunk_size: int = CHUNK_SIZE,
+) -> Sequence[int]:
+    """
+    Запись строк, сгенерированных столбцами (db.vectorized), в таблицу
+    с id. bulk - executemany кортежами в обход SQLAlchemy Core,
+    infile/fifo - TSV собирается из столбцов целиком.
+    В режиме orm столбцы разворачиваются в строки для insert_rows
+    """
+    if mode == "orm":
+        rows = chain.from_iterable(map(column_rows, chunks))
+        return insert_rows(
+            session, model, rows, mode=mode, chunk_size=chunk_size
+        )
+
+    table = cast("Table", model.__table__)
+    start = next_id = session.execute(first_free_id(table)).scalar_one()
+
+    def with_ids(chunks: Iterable[Columns]) -> Iterator[Columns]:
+        nonlocal next_id
+        for columns in chunks:
+            count = column_count(columns)
+            yield {"id": np.arange(next_id, next_id + count), **columns}
+            next_id += count
+
+    it = with_ids(chunks)
+    first = next(it, None)
+    if first is None:
+        return []
+
+    names = list(first)
+
+    if mode == "bulk":
+        statement = insert(table).compile(
+            dialect=session.get_bind().dialect, column_keys=names
+        )
+        # порядок столбцов - порядок позиционных параметров выражения
+        order = statement.positiontup or names
+        for columns in chain([first], it):
+            session.connection().exec_driver_sql(
+                statement.string,
+                column_tuples({name: columns[name] for name in order}),
+            )
+    else:
+        load_tsv(
+            session,
+            table,
+            names,
+            map(tsv_block, chain([first], it)),
+            fifo=mode == "fifo",
+        )
+
+    notify_write("db", [table.name])
+    return range(start, next_id)
+
+
+def ingest_measures(
+    session: Session,
+    rows: Iterable[Row],
+    *,
+    mode: InsertMode = "orm",
+    chunk_size: int = CHUNK_SIZE,
+) -> Sequence[int]:
+    """
+    Запись измерений с обновлением сводки DeviceMeasureStats.
+    Новые строки Measures должны записываться только через неё
+    (или ingest_measure_columns), иначе сводку придётся пересчитать
+    rebuild_measure_stats
+    """
+    stats: DeviceStats = {}
+    ids = insert_rows(
+        session,
+        Measures,
+        collect_rows(stats, rows),
+        mode=mode,
+        chunk_size=chunk_size,
+    )
+    upsert_measure_stats(session, stats, chunk_size=chunk_size)
+    return ids
+
+
+def ingest_measure_columns(
+    session: Session,
+    chunks: Iterable[Columns],
+    *,
+    mode: InsertMode = "orm",
+    chunk_size: int = CHUNK_SIZE,
+) -> Sequence[int]:
+    """То же, что ingest_measures, для измерений столбцами"""
+    stats: DeviceStats = {}
+    ids = insert_columns(
+        session,
+        Measures,
+        collect_columns(stats, chunks),
+        mode=mode,
+        chunk_size=chunk_size,
+    )
+    upsert_measure_stats(session, stats, chunk_size=chunk_size)
+    return ids
+
+
+async def insert_rows_async(
+    make_session: async_sessionmaker[AsyncSession],
+    model: type[Base],
+    rows: Iterable[Row],
+    *,
+    chunk_size: int = CHUNK_SIZE,
+    concurrency: int = DB_ASYNC_CONCURRENCY,
+) -> Sequence[int]:
+    """
+    insert_rows в режиме bulk на AsyncEngine: id назначаются заранее,
+    пачки по chunk_size пишутся параллельно, каждая в своей сессии
+    и транзакции. Одновременно в памяти и в записи - не больше
+    concurrency пачек
+    """
+    table = cast("Table", model.__table__)
+    has_id = "id" in table.c
+
+    start = next_id = 1
+    if has_id:
+        async with make_session() as session:
+            res = await session.execute(first_free_id(table))
+            start = next_id = res.scalar_one()
+
+    def with_ids(rows: Iterable[Row]) -> Iterator[Row]:
+        nonlocal next_id
+        for row in rows:
+            row["id"] = next_id
+            next_id += 1
+            yield row
+
+    if has_id:
+        rows = with_ids(rows)
+
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def write(chunk: Sequence[Row]) -> None:
+        try:
+            async with make_session() as session:
+                await session.execute(insert(table), list(chunk))
+                await session.commit()
+        finally:
+            semaphore.release()
+
+    async with asyncio.TaskGroup() as group:
+        for chunk in batched(rows, chunk_size, strict=False):
+            await semaphore.acquire()
+            group.create_task(write(chunk))
+
+    notify_write("db", [table.name])
+    return range(start, next_id) if has_id else []
+
 
-    user_types_data = [
+def user_types_rows() -> list[Row]:
+    return [
         {"type": "Взрослый"},
         {"type": "Ребёнок"},
         {"type": "Гость"},
         {"type": "Пенсионер"},
     ]
-    user_types = [UserTypes(**d) for d in user_types_data]
-    session.add_all(user_types)
-    session.flush()
 
-    device_types_data = [
+
+def device_types_rows() -> list[Row]:
+    return [
         {"type": "light", "name": "Умная лампа"},
         {"type": "socket", "name": "Умная розетка"},
         {"type": "thermostat", "name": "Термостат"},
@@ -61,200 +346,887 @@ def create_reference_data(
         {"type": "door", "name": "Датчик открытия двери"},
         {"type": "camera", "name": "Камера"},
     ]
-    device_types = [DeviceTypes(**d) for d in device_types_data]
-    session.add_all(device_types)
-    session.flush()
 
-    associations: list[DeviceTypesToUserTypes] = []
-    for dt in tqdm(device_types, desc="device_types"):
-        allowed_user_types = random.sample(
-            user_types, k=random.randint(1, len(user_types))
+
+def type_associations(
+    device_type_ids: Sequence[int],
+    user_type_ids: Sequence[int],
+    *,
+    rng: random.Random = rng,
+) -> list[Row]:
+    """Каждому типу устройства - случайные типы пользователей"""
+    associations: list[Row] = []
+    for dt_id in tqdm(device_type_ids, desc="device_types"):
+        allowed_user_type_ids = rng.sample(
+            user_type_ids, k=rng.randint(1, len(user_type_ids))
         )
         associations.extend(
-            DeviceTypesToUserTypes(device_type_id=dt.id, user_type_id=ut.id)
-            for ut in allowed_user_types
+            {"device_type_id": dt_id, "user_type_id": ut_id}
+            for ut_id in allowed_user_type_ids
         )
-    session.add_all(associations)
-    session.flush()
+    return associations
+
+
+def create_reference_data(
+    session: Session, *, mode: InsertMode = "orm", rng: random.Random = rng
+) -> tuple[Sequence[int], Sequence[int]]:
+    """Создаём справочники — их обычно немного и они стабильны"""
+    user_type_ids = insert_rows(
+        session, UserTypes, user_types_rows(), mode=mode
+    )
+    device_type_ids = insert_rows(
+        session, DeviceTypes, device_types_rows(), mode=mode
+    )
+    insert_rows(
+        session,
+        DeviceTypesToUserTypes,
+        type_associations(device_type_ids, user_type_ids, rng=rng),
+        mode=mode,
+    )
+
+    return user_type_ids, device_type_ids
 
-    return user_types, device_types
 
+def houses_shard(seed: int, count: int) -> list[Row]:
+    fake = shard_faker(seed)
+    return [{"address": fake.address()} for _ in range(count)]
 
-def create_houses_and_devices(
+
+def create_houses(  # noqa: PLR0913
     session: Session,
-    device_types: list[DeviceTypes],
     count_houses: int = 5,
-    devices_per_house: int = 6,
-) -> tuple[list[Houses], list[Devices]]:
-    houses: list[Houses] = []
-    all_devices: list[Devices] = []
-
-    for _ in tqdm(range(count_houses), desc="create_houses_and_devices"):
-        house = Houses(
-            address=(
-                fake.address()
-                # .replace("\n", ", ")
+    *,
+    mode: InsertMode = "orm",
+    chunk_size: int = CHUNK_SIZE,
+    fake: Faker = fake,
+    pool: ShardPool | None = None,
+) -> Sequence[int]:
+    houses: Iterable[Row] = (
+        pool.generate(houses_shard, "create_houses", count_houses)
+        if pool is not None
+        else (
+            {"address": fake.address()}
+            for _ in tqdm(range(count_houses), desc="create_houses")
+        )
+    )
+    return insert_rows(
+        session, Houses, houses, mode=mode, chunk_size=chunk_size
+    )
+
+
+def house_devices(
+    house_id: int,
+    device_type_ids: Sequence[int],
+    devices_per_house: int,
+    *,
+    rng: random.Random = rng,
+) -> list[Row]:
+    return [
+        {"house_id": house_id, "device_type_id": dt_id}
+        for dt_id in rng.sample(
+            device_type_ids, k=min(devices_per_house, len(device_type_ids))
+        )
+    ]
+
+
+def devices_shard(
+    seed: int,
+    house_ids: Sequence[int],
+    device_type_ids: Sequence[int],
+    devices_per_house: int,
+) -> list[Row]:
+    shard_rng = random.Random(seed)
+    return [
+        row
+        for house_id in house_ids
+        for row in house_devices(
+            house_id, device_type_ids, devices_per_house, rng=shard_rng
+        )
+    ]
+
+
+def create_devices(  # noqa: PLR0913
+    session: Session,
+    house_ids: Sequence[int],
+    device_type_ids: Sequence[int],
+    devices_per_house: int = DEVICES_PER_HOUSE,
+    *,
+    mode: InsertMode = "orm",
+    chunk_size: int = CHUNK_SIZE,
+    rng: random.Random = rng,
+    pool: ShardPool | None = None,
+) -> Sequence[int]:
+    devices: Iterable[Row]
+    if pool is not None:
+        # шард - chunk_size домов со всеми их устройствами
+        shards = (
+            (
+                house_ids[start : start + pool.chunk_size],
+                device_type_ids,
+                devices_per_house,
             )
+            for start in range(0, len(house_ids), pool.chunk_size)
         )
-        houses.append(house)
-        session.add(house)
-        session.flush()
+        devices = chain.from_iterable(
+            pool.map_shards(devices_shard, "create_devices", shards)
+        )
+    else:
+        devices = (
+            row
+            for house_id in tqdm(house_ids, desc="create_devices")
+            for row in house_devices(
+                house_id, device_type_ids, devices_per_house, rng=rng
+            )
+        )
+    return insert_rows(
+        session, Devices, devices, mode=mode, chunk_size=chunk_size
+    )
 
-        for dt in random.sample(
-            device_types, k=min(devices_per_house, len(device_types))
-        ):
-            device = Devices(house_id=house.id, device_type_id=dt.id)
-            all_devices.append(device)
-            session.add(device)
 
-    session.flush()
-    return houses, all_devices
+def user_row(
+    user_type_ids: Sequence[int],
+    *,
+    rng: random.Random = rng,
+    fake: Faker = fake,
+) -> Row:
+    ut_id = rng.choice(user_type_ids)
+    return {"name": fake.name(), "user_type_id": ut_id}
 
 
-def create_users(
-    session: Session, user_types: list[UserTypes], count_users: int = 12
-) -> list[Users]:
-    users: list[Users] = []
+def users_shard(
+    seed: int, count: int, user_type_ids: Sequence[int]
+) -> list[Row]:
+    shard_rng = random.Random(seed)
+    shard_fake = shard_faker(seed)
+    return [
+        user_row(user_type_ids, rng=shard_rng, fake=shard_fake)
+        for _ in range(count)
+    ]
+
+
+def iter_users(
+    user_type_ids: Sequence[int],
+    count_users: int,
+    *,
+    rng: random.Random = rng,
+    fake: Faker = fake,
+) -> Iterator[Row]:
     for _ in tqdm(
         range(count_users),
         desc="create_users",
     ):
-        ut = random.choice(user_types)
-        user = Users(name=fake.name(), user_type_id=ut.id)
-        users.append(user)
-        session.add(user)
-    session.flush()
-    return users
+        yield user_row(user_type_ids, rng=rng, fake=fake)
 
 
-def create_scenarios(
-    session: Session, count_scenarios: int = 8
-) -> list[Scenarios]:
-    scenarios: list[Scenarios] = []
+def create_users(  # noqa: PLR0913
+    session: Session,
+    user_type_ids: Sequence[int],
+    count_users: int = 12,
+    *,
+    mode: InsertMode = "orm",
+    chunk_size: int = CHUNK_SIZE,
+    rng: random.Random = rng,
+    fake: Faker = fake,
+    pool: ShardPool | None = None,
+) -> Sequence[int]:
+    users = (
+        pool.generate(users_shard, "create_users", count_users, user_type_ids)
+        if pool is not None
+        else iter_users(user_type_ids, count_users, rng=rng, fake=fake)
+    )
+    return insert_rows(session, Users, users, mode=mode, chunk_size=chunk_size)
+
+
+def iter_scenarios(
+    count_scenarios: int, *, rng: random.Random = rng
+) -> Iterator[Row]:
     for _ in tqdm(range(count_scenarios), desc="create_scenarios"):
-        t_from = generate_time_between(6, 22)
+        t_from = generate_time_between(6, 22, rng=rng)
         t_till = (
-            generate_time_between(t_from.hour + 1, 23)
+            generate_time_between(t_from.hour + 1, 23, rng=rng)
             if t_from.hour < 22
             else time(23, 59)
         )
 
-        sc = Scenarios(time_from=t_from, time_till=t_till)
-        scenarios.append(sc)
-        session.add(sc)
-    session.flush()
-    return scenarios
+        yield {"time_from": t_from, "time_till": t_till}
 
 
-def create_activations_and_cone(
-    session: Session, devices: list[Devices], scenarios: list[Scenarios]
-) -> None:
-    activations = []
-    cones = []
-
-    for scenario in tqdm(scenarios, desc="create_activations_and_cone"):
-        selected_devices = random.sample(
-            devices, k=random.randint(2, min(6, len(devices)))
-        )
-
-        for dev in selected_devices:
-            if random.random() < 0.75:  # ~75% устройств активируются
-                activations.append(
-                    ActivationsToDevices(
-                        scenario_id=scenario.id,
-                        device_id=dev.id,
-                        is_on=random.choice([0, 1]),
-                        affect_time=generate_time_between(0, 23)
-                        if random.random() < 0.4
-                        else None,
-                    )
-                )
+def create_scenarios(
+    session: Session,
+    count_scenarios: int = 8,
+    *,
+    mode: InsertMode = "orm",
+    chunk_size: int = CHUNK_SIZE,
+    rng: random.Random = rng,
+) -> Sequence[int]:
+    scenarios = iter_scenarios(count_scenarios, rng=rng)
+    return insert_rows(
+        session, Scenarios, scenarios, mode=mode, chunk_size=chunk_size
+    )
 
-            if random.random() < 0.35:
-                cones.append(
-                    CoNEToDevices(
-                        scenario_id=scenario.id,
-                        device_id=dev.id,
-                        is_on=random.choice([0, 1]),
-                    )
-                )
 
-    session.add_all(activations)
-    session.add_all(cones)
-    session.flush()
+def scenario_links(
+    scenario_id: int,
+    device_ids: Sequence[int],
+    *,
+    rng: random.Random = rng,
+) -> tuple[list[Row], list[Row]]:
+    """Активации и условия (CoNE) устройств одного сценария"""
+    activations: list[Row] = []
+    cones: list[Row] = []
+    selected_device_ids = rng.sample(
+        device_ids, k=rng.randint(2, min(6, len(device_ids)))
+    )
 
+    for device_id in selected_device_ids:
+        if rng.random() < 0.75:  # ~75% устройств активируются
+            activations.append(
+                {
+                    "scenario_id": scenario_id,
+                    "device_id": device_id,
+                    "is_on": rng.choice([0, 1]),
+                    "affect_time": generate_time_between(0, 23, rng=rng)
+                    if rng.random() < 0.4
+                    else None,
+                }
+            )
 
-def create_events_and_measures(
+        if rng.random() < 0.35:
+            cones.append(
+                {
+                    "scenario_id": scenario_id,
+                    "device_id": device_id,
+                    "is_on": rng.choice([0, 1]),
+                }
+            )
+
+    return activations, cones
+
+
+def create_activations_and_cone(  # noqa: PLR0913
     session: Session,
-    users: list[Users],
-    devices: list[Devices],
-    scenarios: list[Scenarios],
-    count_events: int = 150,
-    count_measures: int = 400,
+    device_ids: Sequence[int],
+    scenario_ids: Sequence[int],
+    *,
+    mode: InsertMode = "orm",
+    chunk_size: int = CHUNK_SIZE,
+    rng: random.Random = rng,
 ) -> None:
-    events = []
-    measures = []
+    activations: list[Row] = []
+    cones: list[Row] = []
+
+    def flush(*, force: bool = False) -> None:
+        for model, rows in (
+            (ActivationsToDevices, activations),
+            (CoNEToDevices, cones),
+        ):
+            if rows and (force or len(rows) >= chunk_size):
+                insert_rows(session, model, rows, mode=mode)
+                rows.clear()
+
+    for scenario_id in tqdm(scenario_ids, desc="create_activations_and_cone"):
+        scenario_activations, scenario_cones = scenario_links(
+            scenario_id, device_ids, rng=rng
+        )
+        activations.extend(scenario_activations)
+        cones.extend(scenario_cones)
+        flush()
+
+    flush(force=True)
+
+
+def event_row(
+    user_ids: Sequence[int],
+    device_ids: Sequence[int],
+    scenario_ids: Sequence[int],
+    *,
+    rng: random.Random = rng,
+) -> Row:
+    return {
+        "value": rng.choice([0, 1]),
+        "user_id": rng.choice([None, rng.choice(user_ids)]),
+        "device_id": rng.choice([None, rng.choice(device_ids)]),
+        "scenario_id": rng.choice([None, rng.choice(scenario_ids)]),
+    }
+
+
+def measure_row(
+    device_ids: Sequence[int], now: datetime, *, rng: random.Random = rng
+) -> Row:
+    past = now - timedelta(days=rng.randint(0, 60), hours=rng.randint(0, 23))
+    return {
+        "device_id": rng.choice(device_ids),
+        "measure_time": past,
+        "value": Decimal(rng.uniform(0.0, 100.0)).quantize(Decimal("0.01")),
+    }
 
-    now = datetime.now(UTC)
 
+def events_shard(
+    seed: int,
+    count: int,
+    user_ids: Sequence[int],
+    device_ids: Sequence[int],
+    scenario_ids: Sequence[int],
+) -> list[Row]:
+    shard_rng = random.Random(seed)
+    return [
+        event_row(user_ids, device_ids, scenario_ids, rng=shard_rng)
+        for _ in range(count)
+    ]
+
+
+def measures_shard(
+    seed: int, count: int, device_ids: Sequence[int], now: datetime
+) -> list[Row]:
+    shard_rng = random.Random(seed)
+    return [measure_row(device_ids, now, rng=shard_rng) for _ in range(count)]
+
+
+def iter_events(
+    user_ids: Sequence[int],
+    device_ids: Sequence[int],
+    scenario_ids: Sequence[int],
+    count_events: int,
+    *,
+    rng: random.Random = rng,
+) -> Iterator[Row]:
     for _ in tqdm(
         range(count_events),
         desc="create_events",
     ):
-        ev = Events(
-            value=random.choice([0, 1]),
-            user_id=random.choice([None, random.choice(users).id]),
-            device_id=random.choice([None, random.choice(devices).id]),
-            scenario_id=random.choice([None, random.choice(scenarios).id]),
-        )
-        events.append(ev)
+        yield event_row(user_ids, device_ids, scenario_ids, rng=rng)
 
+
+def iter_measures(
+    device_ids: Sequence[int],
+    count_measures: int,
+    now: datetime,
+    *,
+    rng: random.Random = rng,
+) -> Iterator[Row]:
     for _ in tqdm(
         range(count_measures),
         desc="create_measures",
     ):
-        past = now - timedelta(
-            days=random.randint(0, 60), hours=random.randint(0, 23)
-        )
-        meas = Measures(
-            device_id=random.choice(devices).id,
-            measure_time=past,
-            value=Decimal(random.uniform(0.0, 100.0)).quantize(
-                Decimal("0.01")
+        yield measure_row(device_ids, now, rng=rng)
+
+
+def create_events_and_measures(  # noqa: PLR0913
+    session: Session,
+    user_ids: Sequence[int],
+    device_ids: Sequence[int],
+    scenario_ids: Sequence[int],
+    *,
+    count_events: int = 150,
+    count_measures: int = 400,
+    mode: InsertMode = "orm",
+    chunk_size: int = CHUNK_SIZE,
+    rng: random.Random = rng,
+    pool: ShardPool | None = None,
+    gen: np.random.Generator | None = None,
+) -> None:
+    """
+    gen - генератор NumPy: события и измерения создаются столбцами
+    (db.vectorized) и пишутся через insert_columns
+    """
+    now = datetime.now(UTC)
+
+    if gen is not None:
+        insert_columns(
+            session,
+            Events,
+            events_chunks(
+                gen,
+                user_ids,
+                device_ids,
+                scenario_ids,
+                count_events,
+                chunk_size=chunk_size,
+            ),
+            mode=mode,
+            chunk_size=chunk_size,
+        )
+        ingest_measure_columns(
+            session,
+            measures_chunks(
+                gen, device_ids, count_measures, now, chunk_size=chunk_size
             ),
+            mode=mode,
+            chunk_size=chunk_size,
+        )
+        return
+
+    events = (
+        pool.generate(
+            events_shard,
+            "create_events",
+            count_events,
+            user_ids,
+            device_ids,
+            scenario_ids,
+        )
+        if pool is not None
+        else iter_events(
+            user_ids, device_ids, scenario_ids, count_events, rng=rng
+        )
+    )
+    insert_rows(session, Events, events, mode=mode, chunk_size=chunk_size)
+
+    measures = (
+        pool.generate(
+            measures_shard, "create_measures", count_measures, device_ids, now
         )
-        measures.append(meas)
+        if pool is not None
+        else iter_measures(device_ids, count_measures, now, rng=rng)
+    )
+    ingest_measures(session, measures, mode=mode, chunk_size=chunk_size)
 
-    session.add_all(events)
-    session.add_all(measures)
 
+def table_references() -> dict[str, set[str]]:
+    """Таблица -> таблицы, на которые она ссылается внешними ключами"""
+    return {
+        table.name: {fk.column.table.name for fk in table.foreign_keys}
+        for table in Base.metadata.sorted_tables
+    }
 
-def populate_database(session: Session, *, clear_first: bool = True) -> None:
+
+def add_measure_partitions(session: Session) -> list[str]:
     """
-    Основная функция - запуск всего генератора
+    Месячные секции Measures под генерируемые измерения, чтобы они
+    не попали в pmax. Возвращает имена новых секций
     """
+    # measure_row - не старше 60 дней и 23 часов
+    now = datetime.now(UTC)
+    return add_partitions(
+        session, now.date(), since=(now - timedelta(days=61)).date()
+    )
+
+
+def prepare_database(
+    session: Session, *, clear_first: bool, partitions: bool
+) -> None:
+    """
+    Секции под измерения (partitions=True) и удаление строк всех таблиц
+    (clear_first=True), от зависимых к справочникам
+    """
+    if partitions:
+        add_measure_partitions(session)
+
     if clear_first:
         for table in tqdm(
             reversed(Base.metadata.sorted_tables), desc="table.delete"
         ):
             session.execute(table.delete())
+        notify_write("db", Base.metadata.tables)
+
+
+def stage_runner(
+    name: str,
+    fill: StageFill,
+    *,
+    session: Session,
+    stage_session: sessionmaker[Session] | None,
+    fast: bool,
+) -> Callable[[], None]:
+    """
+    Запуск этапа: без stage_session - в session с общими rng и fake,
+    иначе (параллельные этапы) - в своей сессии и со своим seed
+    """
 
-    user_types, device_types = create_reference_data(session)
-    houses, devices = create_houses_and_devices(
-        session, device_types, count_houses=200
+    def run() -> None:
+        if stage_session is None:
+            fill(session, rng, fake)
+            return
+
+        stage_fake = Faker("ru_RU")
+        stage_fake.seed_instance(derive_seed(SEED, name))
+        with (
+            stage_session() as s,
+            checks_disabled(s) if fast else nullcontext(),
+        ):
+            fill(s, random.Random(derive_seed(SEED, name)), stage_fake)
+            s.commit()
+
+    return run
+
+
+@contextmanager
+def generation(
+    session: Session, *, processes: int, chunk_size: int, fast: bool
+) -> Generator[ShardPool | None]:
+    """
+    Пул процессов для шардов (при processes > 1), а в режимах
+    infile/fifo - без проверок, внешних ключей и вторичных индексов
+    """
+    with ExitStack() as stack:
+        pool = (
+            stack.enter_context(
+                ShardPool(processes, SEED, chunk_size=chunk_size)
+            )
+            if processes > 1
+            else None
+        )
+        if fast:
+            stack.enter_context(checks_disabled(session))
+            stack.enter_context(
+                keys_dropped(session, Base.metadata.sorted_tables)
+            )
+        yield pool
+
+
+def populate_database(  # noqa: PLR0913
+    session: Session,
+    *,
+    clear_first: bool = True,
+    max_workers: int = 1,
+    mode: InsertMode = "orm",
+    scale_factor: float = 1.0,
+    chunk_size: int = CHUNK_SIZE,
+    processes: int = 1,
+    vectorized: bool = False,
+    partitions: bool = False,
+) -> dict[str, float]:
+    """
+    Основная функция - запуск всего генератора.
+    Порядок этапов выводится из внешних ключей моделей.
+    max_workers > 1 - независимые этапы выполняются параллельно, каждый
+    в своей сессии и со своим seed (данные воспроизводимы, но отличаются
+    от последовательного режима).
+    mode - способ записи строк (см. InsertMode). В режимах infile/fifo
+    на время загрузки удаляются внешние ключи и вторичные индексы,
+    а проверки внешних ключей и уникальности отключаются.
+    scale_factor умножает количество всех сущностей, строки генерируются
+    и пишутся пачками по chunk_size.
+    processes > 1 - дома, устройства, пользователи, события и измерения
+    генерируются шардами по chunk_size в пуле процессов и пишутся
+    одним потоком (данные воспроизводимы при том же chunk_size).
+    vectorized=True - события и измерения генерируются столбцами NumPy
+    (распределение то же, сами значения другие).
+    partitions=True - сначала add_measure_partitions (только MySQL
+    с секционированной Measures).
+    Возвращает время выполнения этапов
+    """
+    prepare_database(session, clear_first=clear_first, partitions=partitions)
+
+    parallel = max_workers > 1
+    fast = mode in {"infile", "fifo"}
+    if parallel or fast:
+        session.commit()
+    stage_session = sessionmaker(
+        bind=session.get_bind(), expire_on_commit=False
     )
-    users = create_users(session, user_types, count_users=200)
-    scenarios = create_scenarios(session, count_scenarios=50)
 
-    create_activations_and_cone(session, devices, scenarios)
-    create_events_and_measures(session, users, devices, scenarios)
+    counts = GenerationCounts.scaled(scale_factor)
+    data: dict[str, Sequence[int]] = {}
+
+    def reference(s: Session, rng: random.Random, _: Faker) -> None:
+        data["user_types"], data["device_types"] = create_reference_data(
+            s, mode=mode, rng=rng
+        )
+
+    def houses(s: Session, _: random.Random, fake: Faker) -> None:
+        data["houses"] = create_houses(
+            s,
+            count_houses=counts.houses,
+            mode=mode,
+            chunk_size=chunk_size,
+            fake=fake,
+            pool=pool,
+        )
+
+    def devices(s: Session, rng: random.Random, _: Faker) -> None:
+        data["devices"] = create_devices(
+            s,
+            data["houses"],
+            data["device_types"],
+            mode=mode,
+            chunk_size=chunk_size,
+            rng=rng,
+            pool=pool,
+        )
+
+    def users(s: Session, rng: random.Random, fake: Faker) -> None:
+        data["users"] = create_users(
+            s,
+            data["user_types"],
+            count_users=counts.users,
+            mode=mode,
+            chunk_size=chunk_size,
+            rng=rng,
+            fake=fake,
+            pool=pool,
+        )
+
+    def scenarios(s: Session, rng: random.Random, _: Faker) -> None:
+        data["scenarios"] = create_scenarios(
+            s,
+            count_scenarios=counts.scenarios,
+            mode=mode,
+            chunk_size=chunk_size,
+            rng=rng,
+        )
+
+    def activations_and_cone(s: Session, rng: random.Random, _: Faker) -> None:
+        create_activations_and_cone(
+            s,
+            data["devices"],
+            data["scenarios"],
+            mode=mode,
+            chunk_size=chunk_size,
+            rng=rng,
+        )
+
+    def events_and_measures(s: Session, rng: random.Random, _: Faker) -> None:
+        create_events_and_measures(
+            s,
+            data["users"],
+            data["devices"],
+            data["scenarios"],
+            count_events=counts.events,
+            count_measures=counts.measures,
+            mode=mode,
+            chunk_size=chunk_size,
+            rng=rng,
+            pool=pool,
+            gen=np.random.default_rng(derive_seed(SEED, "events_and_measures"))
+            if vectorized
+            else None,
+        )
+
+    stages = [
+        Stage(
+            name,
+            tables,
+            stage_runner(
+                name,
+                fill,
+                session=session,
+                stage_session=stage_session if parallel else None,
+                fast=fast,
+            ),
+        )
+        for name, tables, fill in (
+            (
+                "reference",
+                ("UserTypes", "DeviceTypes", "DeviceTypesToUserTypes"),
+                reference,
+            ),
+            ("houses", ("Houses",), houses),
+            ("devices", ("Devices",), devices),
+            ("users", ("Users",), users),
+            ("scenarios", ("Scenarios",), scenarios),
+            (
+                "activations_and_cone",
+                ("ActivationsToDevices", "CoNEToDevices"),
+                activations_and_cone,
+            ),
+            (
+                "events_and_measures",
+                ("Events", "Measures", "DeviceMeasureStats"),
+                events_and_measures,
+            ),
+        )
+    ]
+    with generation(
+        session, processes=processes, chunk_size=chunk_size, fast=fast
+    ) as pool:
+        timings = run_stages(
+            stages, table_references(), max_workers=max_workers
+        )
 
     session.commit()
+    # кеши могли перечитать данные до коммита
+    notify_write("db", Base.metadata.tables)
     log = (
         f"Сгенерировано:\n"
-        f"  домов       : {len(houses)}\n"
-        f"  устройств    : {len(devices)}\n"
-        f"  пользователей: {len(users)}\n"
-        f"  сценариев    : {len(scenarios)}"
+        f"  домов       : {len(data['houses'])}\n"
+        f"  устройств    : {len(data['devices'])}\n"
+        f"  пользователей: {len(data['users'])}\n"
+        f"  сценариев    : {len(data['scenarios'])}"
     )
     logger.info(log)
+    return timings
+
+
+async def populate_database_async(  # noqa: PLR0913
+    make_session: async_sessionmaker[AsyncSession],
+    *,
+    clear_first: bool = True,
+    scale_factor: float = 1.0,
+    chunk_size: int = CHUNK_SIZE,
+    concurrency: int = DB_ASYNC_CONCURRENCY,
+    partitions: bool = False,
+) -> dict[str, float]:
+    """
+    Асинхронный генератор на AsyncEngine. Таблицы пишутся по очереди
+    в порядке внешних ключей, пачки одной таблицы - параллельно
+    (insert_rows_async), поэтому random вызывается в том же порядке,
+    что и в populate_database, и данные совпадают с последовательным
+    режимом. partitions - как в populate_database.
+    Возвращает время выполнения этапов
+    """
+    async with make_session() as session:
+        if partitions:
+            await session.run_sync(add_measure_partitions)
+        if clear_first:
+            for table in reversed(Base.metadata.sorted_tables):
+                await session.execute(table.delete())
+        await session.commit()
+    if clear_first:
+        notify_write("db", Base.metadata.tables)
+
+    counts = GenerationCounts.scaled(scale_factor)
+    timings: dict[str, float] = {}
+
+    @contextmanager
+    def stage(name: str) -> Generator[None]:
+        start = perf_counter()
+        with operation(f"stage.{name}"):
+            yield
+        timings[name] = perf_counter() - start
+        logger.info("Этап %s: %.2f с", name, timings[name])
+
+    async def write(model: type[Base], rows: Iterable[Row]) -> Sequence[int]:
+        return await insert_rows_async(
+            make_session,
+            model,
+            rows,
+            chunk_size=chunk_size,
+            concurrency=concurrency,
+        )
+
+    with stage("reference"):
+        user_type_ids = await write(UserTypes, user_types_rows())
+        device_type_ids = await write(DeviceTypes, device_types_rows())
+        await write(
+            DeviceTypesToUserTypes,
+            type_associations(device_type_ids, user_type_ids),
+        )
+
+    with stage("houses"):
+        house_ids = await write(
+            Houses,
+            (
+                {"address": fake.address()}
+                for _ in tqdm(range(counts.houses), desc="create_houses")
+            ),
+        )
+
+    with stage("devices"):
+        device_ids = await write(
+            Devices,
+            (
+                row
+                for house_id in tqdm(house_ids, desc="create_devices")
+                for row in house_devices(
+                    house_id, device_type_ids, DEVICES_PER_HOUSE
+                )
+            ),
+        )
+
+    with stage("users"):
+        user_ids = await write(Users, iter_users(user_type_ids, counts.users))
+
+    with stage("scenarios"):
+        scenario_ids = await write(Scenarios, iter_scenarios(counts.scenarios))
+
+    with stage("activations_and_cone"):
+        activations: list[Row] = []
+        cones: list[Row] = []
+        for scenario_id in tqdm(
+            scenario_ids, desc="create_activations_and_cone"
+        ):
+            scenario_activations, scenario_cones = scenario_links(
+                scenario_id, device_ids
+            )
+            activations.extend(scenario_activations)
+            cones.extend(scenario_cones)
+        await write(ActivationsToDevices, activations)
+        await write(CoNEToDevices, cones)
+
+    with stage("events_and_measures"):
+        await write(
+            Events,
+            iter_events(user_ids, device_ids, scenario_ids, counts.events),
+        )
+        stats: DeviceStats = {}
+        await write(
+            Measures,
+            collect_rows(
+                stats,
+                iter_measures(device_ids, counts.measures, datetime.now(UTC)),
+            ),
+        )
+        async with make_session() as session:
+            await session.run_sync(
+                upsert_measure_stats, stats, chunk_size=chunk_size
+            )
+            await session.commit()
+
+    # кеши могли перечитать данные до последней пачки
+    notify_write("db", Base.metadata.tables)
+    log = (
+        f"Сгенерировано:\n"
+        f"  домов       : {len(house_ids)}\n"
+        f"  устройств    : {len(device_ids)}\n"
+        f"  пользователей: {len(user_ids)}\n"
+        f"  сценариев    : {len(scenario_ids)}"
+    )
+    logger.info(log)
+    return timings
+
+
+def compare_insert_modes(
+    make_session: Callable[[], Session],
+    modes: Sequence[InsertMode] = INSERT_MODES,
+    *,
+    scale_factor: float = 1.0,
+    max_workers: int = 1,
+    partitions: bool = False,
+) -> dict[InsertMode, dict[str, float]]:
+    """
+    Заполнение базы каждым из способов записи подряд,
+    возвращает и логирует время этапов для каждого способа.
+    partitions - как в populate_database
+    """
+    results: dict[InsertMode, dict[str, float]] = {}
+    for mode in modes:
+        with make_session() as session:
+            results[mode] = populate_database(
+                session,
+                mode=mode,
+                scale_factor=scale_factor,
+                max_workers=max_workers,
+                partitions=partitions,
+            )
+
+    for mode, timings in results.items():
+        logger.info(
+            "%-6s: всего %.2f с, events_and_measures %.2f с",
+            mode,
+            sum(timings.values()),
+            timings["events_and_measures"],
+        )
+    return results
+
+
+def write_mode_timings_json(
+    results: dict[InsertMode, dict[str, float]], path: Path
+) -> None:
+    """Результат compare_insert_modes: {способ: {этап: секунды}}"""
+    with path.open("w", encoding="utf-8") as file:
+        json.dump(results, file, ensure_ascii=False, indent=2)
+
+
+def write_mode_timings_csv(
+    results: dict[InsertMode, dict[str, float]], path: Path
+) -> None:
+    """Результат compare_insert_modes: строка на способ и этап"""
+    with path.open("w", encoding="utf-8", newline="") as file:
+        writer = csv.writer(file)
+        writer.writerow(("mode", "stage", "seconds"))
+        writer.writerows(
+            (mode, stage, seconds)
+            for mode, timings in results.items()
+            for stage, seconds in timings.items()
+        )
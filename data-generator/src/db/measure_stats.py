@@ -0,0 +1,319 @@
+import math
+from collections.abc import Iterable, Iterator, Mapping
+from dataclasses import asdict, dataclass, fields
+from datetime import datetime
+from itertools import batched
+from typing import Any, Self, cast
+
+import numpy as np
+from sqlalchemy import (
+    Select,
+    Table,
+    and_,
+    case,
+    delete,
+    func,
+    insert,
+    or_,
+    select,
+)
+from sqlalchemy.dialects.mysql import insert as mysql_insert
+from sqlalchemy.orm import Session, aliased
+
+from cache import notify_write
+from db.models import DeviceMeasureStats, Measures
+from db.vectorized import Columns
+from scale import CHUNK_SIZE
+
+
+@dataclass
+class MeasureStats:
+    """Сводка измерений одного устройства, как строка DeviceMeasureStats"""
+
+    value_count: int
+    value_sum: float
+    min_value: float
+    max_value: float
+    max_time: datetime
+    last_time: datetime
+    last_value: float
+
+    @classmethod
+    def of(cls, measure_time: datetime, value: float) -> Self:
+        return cls(1, value, value, value, measure_time, measure_time, value)
+
+    def merge(self, other: "MeasureStats") -> None:
+        """
+        Добавление другой сводки. При равных значениях выбор max_time
+        и last_value такой же, как в upsert_measure_stats и stats_select
+        """
+        if other.max_value > self.max_value or (
+            other.max_value == self.max_value
+            and other.max_time < self.max_time
+        ):
+            self.max_time = other.max_time
+        if (other.last_time, other.last_value) > (
+            self.last_time,
+            self.last_value,
+        ):
+            self.last_time = other.last_time
+            self.last_value = other.last_value
+        self.value_count += other.value_count
+        self.value_sum += other.value_sum
+        self.min_value = min(self.min_value, other.min_value)
+        self.max_value = max(self.max_value, other.max_value)
+
+    @property
+    def avg_value(self) -> float:
+        return self.value_sum / self.value_count
+
+
+type DeviceStats = dict[int, MeasureStats]
+
+
+def merge_stats(
+    target: DeviceStats, source: Mapping[int, MeasureStats]
+) -> None:
+    for device_id, stats in source.items():
+        if device_id in target:
+            target[device_id].merge(stats)
+        else:
+            target[device_id] = stats
+
+
+def collect_rows(
+    stats: DeviceStats, rows: Iterable[dict[str, Any]]
+) -> Iterator[dict[str, Any]]:
+    """Строки Measures без изменений, по пути сводка копится в stats"""
+    for row in rows:
+        if row["value"] is not None:
+            merge_stats(
+                stats,
+                {
+                    row["device_id"]: MeasureStats.of(
+                        row["measure_time"], float(row["value"])
+                    )
+                },
+            )
+        yield row
+
+
+def columns_stats(columns: Columns) -> DeviceStats:
+    """Сводка по столбцам измерений (db.vectorized) без цикла по строкам"""
+    values = columns["value"].astype(float)
+    known = ~np.isnan(values)
+    devices = columns["device_id"][known]
+    times = columns["measure_time"][known]
+    values = values[known]
+    if not len(devices):
+        return {}
+
+    ticks = times.astype("datetime64[us]").astype(np.int64)
+    # в каждой сортировке устройства идут подряд, группы начинаются
+    # с одних и тех же позиций
+    order = np.argsort(devices, kind="stable")
+    grouped = devices[order]
+    starts = np.flatnonzero(np.r_[True, grouped[1:] != grouped[:-1]])
+    counts = np.diff(np.r_[starts, len(grouped)])
+    sorted_values = values[order]
+    # первым в группе - наибольшее значение, из них самое раннее
+    by_max = np.lexsort((ticks, -values, devices))[starts]
+    # первым в группе - самое позднее, из них наибольшее значение
+    by_last = np.lexsort((-values, -ticks, devices))[starts]
+
+    return {
+        device_id: MeasureStats(*stats)
+        for device_id, *stats in zip(
+            grouped[starts].tolist(),
+            counts.tolist(),
+            np.add.reduceat(sorted_values, starts).tolist(),
+            np.minimum.reduceat(sorted_values, starts).tolist(),
+            np.maximum.reduceat(sorted_values, starts).tolist(),
+            times[by_max].astype("datetime64[us]").tolist(),
+            times[by_last].astype("datetime64[us]").tolist(),
+            values[by_last].tolist(),
+            strict=True,
+        )
+    }
+
+
+def collect_columns(
+    stats: DeviceStats, chunks: Iterable[Columns]
+) -> Iterator[Columns]:
+    """Столбцы измерений без изменений, по пути сводка копится в stats"""
+    for columns in chunks:
+        merge_stats(stats, columns_stats(columns))
+        yield columns
+
+
+def upsert_measure_stats(
+    session: Session,
+    stats: Mapping[int, MeasureStats],
+    *,
+    chunk_size: int = CHUNK_SIZE,
+) -> None:
+    """
+    Добавление сводки новых измерений к DeviceMeasureStats одним
+    INSERT ... ON DUPLICATE KEY UPDATE на пачку устройств.
+    MySQL вычисляет присваивания слева направо по уже обновлённым
+    значениям, поэтому max_time и last_value стоят до max_value
+    и last_time
+    """
+    table = cast("Table", DeviceMeasureStats.__table__)
+    old = table.c
+    stmt = mysql_insert(table)
+    new = stmt.inserted
+    stmt = stmt.on_duplicate_key_update(
+        [
+            ("value_count", old.value_count + new.value_count),
+            ("value_sum", old.value_sum + new.value_sum),
+            ("min_value", func.least(old.min_value, new.min_value)),
+            (
+                "max_time",
+                case(
+                    (
+                        or_(
+                            new.max_value > old.max_value,
+                            and_(
+                                new.max_value == old.max_value,
+                                new.max_time < old.max_time,
+                            ),
+                        ),
+                        new.max_time,
+                    ),
+                    else_=old.max_time,
+                ),
+            ),
+            ("max_value", func.greatest(old.max_value, new.max_value)),
+            (
+                "last_value",
+                case(
+                    (
+                        or_(
+                            new.last_time > old.last_time,
+                            and_(
+                                new.last_time == old.last_time,
+                                new.last_value > old.last_value,
+                            ),
+                        ),
+                        new.last_value,
+                    ),
+                    else_=old.last_value,
+                ),
+            ),
+            ("last_time", func.greatest(old.last_time, new.last_time)),
+        ]
+    )
+
+    rows = (
+        {"device_id": device_id, **asdict(device_stats)}
+        for device_id, device_stats in stats.items()
+    )
+    for chunk in batched(rows, chunk_size, strict=False):
+        session.execute(stmt, list(chunk))
+    notify_write("db", [table.name])
+
+
+def stats_select() -> Select[Any]:
+    """
+    Сводка по всем Measures заново: группировка и две выборки
+    на устройство по индексам device_value и device_time
+    """
+    m = Measures.__table__
+    agg = (
+        select(
+            m.c.device_id,
+            func.count(m.c.value).label("value_count"),
+            func.sum(m.c.value).label("value_sum"),
+            func.min(m.c.value).label("min_value"),
+            func.max(m.c.value).label("max_value"),
+            func.max(m.c.measure_time).label("last_time"),
+        )
+        .where(m.c.value.is_not(None))
+        .group_by(m.c.device_id)
+        .subquery("agg")
+    )
+    inner = aliased(m, name="m")
+    max_time = (
+        select(func.min(inner.c.measure_time))
+        .where(
+            inner.c.device_id == agg.c.device_id,
+            inner.c.value == agg.c.max_value,
+        )
+        .scalar_subquery()
+    )
+    last_value = (
+        select(func.max(inner.c.value))
+        .where(
+            inner.c.device_id == agg.c.device_id,
+            inner.c.measure_time == agg.c.last_time,
+        )
+        .scalar_subquery()
+    )
+    return select(
+        agg.c.device_id,
+        agg.c.value_count,
+        agg.c.value_sum,
+        agg.c.min_value,
+        agg.c.max_value,
+        max_time.label("max_time"),
+        agg.c.last_time,
+        last_value.label("last_value"),
+    )
+
+
+def rebuild_measure_stats(session: Session) -> None:
+    """Пересчёт DeviceMeasureStats с нуля по Measures"""
+    table = cast("Table", DeviceMeasureStats.__table__)
+    session.execute(delete(table))
+    session.execute(
+        insert(table).from_select(
+            ["device_id", *(field.name for field in fields(MeasureStats))],
+            stats_select(),
+        )
+    )
+    notify_write("db", [table.name])
+
+
+def same_stats(a: MeasureStats, b: MeasureStats) -> bool:
+    """Суммы могут отличаться порядком сложения"""
+    return (
+        a.value_count == b.value_count
+        and math.isclose(a.value_sum, b.value_sum, rel_tol=1e-9)
+        and a.min_value == b.min_value
+        and a.max_value == b.max_value
+        and a.max_time == b.max_time
+        and a.last_time == b.last_time
+        and a.last_value == b.last_value
+    )
+
+
+def check_measure_stats(session: Session) -> list[int]:
+    """
+    Сверка DeviceMeasureStats с пересчётом по Measures,
+    возвращает устройства с расхождениями
+    """
+
+    def to_stats(rows: Iterable[Any]) -> DeviceStats:
+        return {
+            row.device_id: MeasureStats(
+                value_count=row.value_count,
+                value_sum=float(row.value_sum),
+                min_value=float(row.min_value),
+                max_value=float(row.max_value),
+                max_time=row.max_time,
+                last_time=row.last_time,
+                last_value=float(row.last_value),
+            )
+            for row in rows
+        }
+
+    expected = to_stats(session.execute(stats_select()))
+    actual = to_stats(session.execute(select(DeviceMeasureStats.__table__)))
+    return sorted(
+        device_id
+        for device_id in expected.keys() | actual.keys()
+        if device_id not in expected
+        or device_id not in actual
+        or not same_stats(expected[device_id], actual[device_id])
+    )
@@ -11,6 +11,7 @@ from sqlalchemy import (
     Time,
 )
 from sqlalchemy.dialects.mysql import INTEGER, TINYINT
+from sqlalchemy.engine import Dialect
 from sqlalchemy.orm import DeclarativeBase, Mapped, mapped_column, relationship
 
 
@@ -94,7 +95,8 @@ class DeviceTypesToUserTypes(Base):
             ["UserTypes.id"],
             name="DeviceTypesToUserTypes_ibfk_1",
         ),
-        Index("user_type_id", "user_type_id"),
+        # доступные типу пользователя типы устройств - только по индексу
+        Index("user_type_device_type", "user_type_id", "device_type_id"),
     )
     device_type_id: Mapped[int] = mapped_column(INTEGER(11), primary_key=True)
     user_type_id: Mapped[int] = mapped_column(INTEGER(11), primary_key=True)
@@ -110,7 +112,8 @@ class Devices(Base):
             ["house_id"], ["Houses.id"], name="Devices_ibfk_1"
         ),
         Index("device_type_id", "device_type_id"),
-        Index("house_id", "house_id"),
+        # устройства дома нужных типов (find_controllable_devices)
+        Index("house_device_type", "house_id", "device_type_id"),
     )
 
     id: Mapped[int] = mapped_column(INTEGER(11), primary_key=True)
@@ -131,7 +134,12 @@ class Devices(Base):
         "Events", back_populates="device"
     )
     Measures: Mapped[list["Measures"]] = relationship(
-        "Measures", back_populates="device"
+        "Measures",
+        back_populates="device",
+        primaryjoin="Devices.id == foreign(Measures.device_id)",
+    )
+    measure_stats: Mapped[Optional["DeviceMeasureStats"]] = relationship(
+        "DeviceMeasureStats", back_populates="device"
     )
 
 
@@ -240,24 +248,82 @@ class Events(Base):
     )
 
 
+def unpartitioned(*_: object, dialect: Dialect, **__: object) -> bool:
+    """Условие DDL (ddl_if): Measures не секционирована - СУБД не MySQL"""
+    return dialect.name != "mysql"
+
+
 class Measures(Base):
+    """
+    В MySQL секционирована по месяцам measure_time (db.partitions),
+    а секционированные таблицы MySQL не поддерживают внешние ключи:
+    целостность device_id там держит генератор, а measure_time входит
+    в первичный ключ. Цена - вставка измерения несуществующего
+    устройства не отклоняется, зато старые месяцы удаляются
+    DROP PARTITION. На других СУБД секций нет, и внешний ключ на
+    Devices создаётся как обычно
+    """
+
     __tablename__ = "Measures"
     __table_args__ = (
         ForeignKeyConstraint(
             ["device_id"], ["Devices.id"], name="Measures_ibfk_1"
-        ),
-        Index("device_id", "device_id"),
+        ).ddl_if(callable_=unpartitioned),
+        Index("device_value", "device_id", "value"),
+        Index("device_time", "device_id", "measure_time"),
+        Index("measure_time", "measure_time"),
+        {
+            "mysql_partition_by": "RANGE COLUMNS(measure_time) "
+            "(PARTITION pmax VALUES LESS THAN (MAXVALUE))"
+        },
     )
 
-    id: Mapped[int] = mapped_column(INTEGER(11), primary_key=True)
+    id: Mapped[int] = mapped_column(
+        INTEGER(11), primary_key=True, autoincrement=True
+    )
     device_id: Mapped[int] = mapped_column(INTEGER(11), nullable=False)
     measure_time: Mapped[datetime.datetime] = mapped_column(
-        DateTime, nullable=False
+        DateTime, primary_key=True
     )
     value: Mapped[decimal.Decimal | None] = mapped_column(
         Double(asdecimal=True)
     )
 
     device: Mapped["Devices"] = relationship(
-        "Devices", back_populates="Measures"
+        "Devices",
+        back_populates="Measures",
+        primaryjoin="foreign(Measures.device_id) == Devices.id",
+    )
+
+
+class DeviceMeasureStats(Base):
+    """
+    Сводка измерений устройства, обновляется при записи Measures
+    (db.measure_stats). Учитываются только измерения с value
+    """
+
+    __tablename__ = "DeviceMeasureStats"
+    __table_args__ = (
+        ForeignKeyConstraint(
+            ["device_id"], ["Devices.id"], name="DeviceMeasureStats_ibfk_1"
+        ),
+    )
+
+    device_id: Mapped[int] = mapped_column(INTEGER(11), primary_key=True)
+    value_count: Mapped[int] = mapped_column(INTEGER(11), nullable=False)
+    value_sum: Mapped[float] = mapped_column(Double, nullable=False)
+    min_value: Mapped[float] = mapped_column(Double, nullable=False)
+    max_value: Mapped[float] = mapped_column(Double, nullable=False)
+    # самое раннее измерение с max_value
+    max_time: Mapped[datetime.datetime] = mapped_column(
+        DateTime, nullable=False
+    )
+    last_time: Mapped[datetime.datetime] = mapped_column(
+        DateTime, nullable=False
+    )
+    # наибольшее значение среди измерений в last_time
+    last_value: Mapped[float] = mapped_column(Double, nullable=False)
+
+    device: Mapped["Devices"] = relationship(
+        "Devices", back_populates="measure_stats"
     )
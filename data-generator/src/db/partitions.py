@@ -0,0 +1,190 @@
+from collections.abc import Sequence
+from dataclasses import dataclass
+from datetime import date, datetime, time
+
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+from cache import notify_write
+from db.models import Measures
+
+# Последняя секция Measures: всё, что позже месячных секций
+MAX_PARTITION = "pmax"
+
+
+def month_start(day: date) -> date:
+    return date(day.year, day.month, 1)
+
+
+def add_months(month: date, months: int) -> date:
+    index = month.year * 12 + month.month - 1 + months
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def partition_name(month: date) -> str:
+    return f"p{month:%Y%m}"
+
+
+@dataclass
+class Partition:
+    name: str
+    # граница VALUES LESS THAN, None - MAXVALUE
+    less_than: date | None
+    # оценка из information_schema, не точное число
+    rows: int
+
+
+def list_partitions(session: Session) -> list[Partition]:
+    """Секции Measures по порядку"""
+    stmt = text("""SELECT PARTITION_NAME,
+    PARTITION_DESCRIPTION,
+    TABLE_ROWS
+FROM information_schema.PARTITIONS
+WHERE TABLE_SCHEMA = DATABASE()
+    AND TABLE_NAME = :table
+    AND PARTITION_NAME IS NOT NULL
+ORDER BY PARTITION_ORDINAL_POSITION;""")
+
+    res = session.execute(stmt, {"table": Measures.__tablename__})
+
+    return [
+        Partition(
+            name=name,
+            # RANGE COLUMNS хранит границу как литерал: '2026-11-01 00:00:00'
+            less_than=None
+            if description == "MAXVALUE"
+            else datetime.fromisoformat(description.strip("'")).date(),
+            rows=rows or 0,
+        )
+        for name, description, rows in res
+    ]
+
+
+def add_partitions(
+    session: Session, until: date, *, since: date | None = None
+) -> list[str]:
+    """
+    Месячные секции до месяца until включительно: новые месяцы
+    отделяются от pmax через REORGANIZE PARTITION, пока pmax пуста -
+    без копирования данных.
+    since - первый месяц, если месячных секций ещё нет (всё, что раньше,
+    попадёт в него же). Возвращает имена новых секций
+    """
+    bounds = [p.less_than for p in list_partitions(session) if p.less_than]
+    start = max(bounds) if bounds else month_start(since or until)
+    months: list[date] = []
+    month = start
+    while month <= until:
+        months.append(month)
+        month = add_months(month, 1)
+    if not months:
+        return []
+
+    definitions = ", ".join(
+        f"PARTITION {partition_name(month)} "
+        f"VALUES LESS THAN ('{add_months(month, 1).isoformat()}')"
+        for month in months
+    )
+    session.execute(
+        text(
+            f"ALTER TABLE {Measures.__tablename__} "
+            f"REORGANIZE PARTITION {MAX_PARTITION} INTO ({definitions}, "
+            f"PARTITION {MAX_PARTITION} VALUES LESS THAN (MAXVALUE))"
+        )
+    )
+    return [partition_name(month) for month in months]
+
+
+def drop_partitions(session: Session, before: date) -> list[str]:
+    """
+    Удаление секций, все измерения которых раньше месяца before.
+    DROP PARTITION удаляет файл секции целиком, без построчного DELETE.
+    Сводка DeviceMeasureStats после этого устаревает
+    (см. rebuild_measure_stats). Возвращает имена удалённых секций
+    """
+    expired = [
+        p.name
+        for p in list_partitions(session)
+        if p.less_than is not None and p.less_than <= month_start(before)
+    ]
+    if expired:
+        session.execute(
+            text(
+                f"ALTER TABLE {Measures.__tablename__} "
+                f"DROP PARTITION {', '.join(expired)}"
+            )
+        )
+        notify_write("db", [Measures.__tablename__])
+    return expired
+
+
+def maintain_partitions(
+    session: Session,
+    today: date,
+    *,
+    months_ahead: int,
+    retention_months: int,
+) -> tuple[list[str], list[str]]:
+    """
+    Секции на months_ahead месяцев вперёд и удаление тех, что старше
+    retention_months месяцев. Возвращает добавленные и удалённые секции
+    """
+    month = month_start(today)
+    added = add_partitions(
+        session,
+        add_months(month, months_ahead),
+        since=add_months(month, -retention_months),
+    )
+    dropped = drop_partitions(session, add_months(month, -retention_months))
+    return added, dropped
+
+
+def explain_partitions(
+    session: Session, start: datetime, end: datetime
+) -> list[str]:
+    """
+    Секции, которые MySQL читает для измерений в [start, end) -
+    столбец partitions из EXPLAIN (в MySQL 8 он есть без EXPLAIN
+    PARTITIONS). Проверка, что запросы по времени отсекают секции
+    """
+    stmt = text("""EXPLAIN SELECT m.id,
+    m.device_id,
+    m.measure_time,
+    m.value
+FROM Measures m
+WHERE m.measure_time >= :start
+    AND m.measure_time < :end;""")
+
+    row = session.execute(stmt, {"start": start, "end": end}).mappings().one()
+    return row["partitions"].split(",") if row["partitions"] else []
+
+
+def window_partitions(
+    partitions: Sequence[Partition], start: datetime, end: datetime
+) -> list[str]:
+    """Секции, пересекающиеся с [start, end): только их должен читать запрос"""
+    names: list[str] = []
+    lower: date | None = None
+    for partition in partitions:
+        upper = partition.less_than
+        if (lower is None or datetime.combine(lower, time()) < end) and (
+            upper is None or datetime.combine(upper, time()) > start
+        ):
+            names.append(partition.name)
+        lower = upper
+    return names
+
+
+def unpruned_partitions(
+    session: Session, start: datetime, end: datetime
+) -> list[str]:
+    """
+    Секции, которые запрос за [start, end) читает, хотя измерений окна
+    в них нет. Пустой список - отсечение секций работает
+    """
+    expected = window_partitions(list_partitions(session), start, end)
+    return [
+        name
+        for name in explain_partitions(session, start, end)
+        if name not in expected
+    ]
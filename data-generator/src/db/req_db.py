@@ -1,11 +1,30 @@
+import heapq
+import json
+from collections import defaultdict
+from collections.abc import Callable, Iterable, Iterator, Mapping
 from dataclasses import dataclass
-from datetime import datetime
+from datetime import datetime, timedelta
+from itertools import batched
+from logging import getLogger
+from operator import attrgetter, itemgetter
+from typing import Any, NamedTuple
 
-from sqlalchemy import text
+from sqlalchemy import TextClause, bindparam, text
 from sqlalchemy.orm import Session
 
+from cache import PermissionCache, PermissionMatrix, ResultCache
+from config import (
+    PERMISSION_CACHE_SIZE,
+    PERMISSION_CACHE_TTL,
+    RESULT_CACHE_SIZE,
+    RESULT_CACHE_TTL,
+)
+from timing import timed
 
-@dataclass
+logger = getLogger(name=__name__)
+
+
+@dataclass(slots=True)
 class UserDeviceTypes:
     user_name: str
     user_type: str
@@ -13,10 +32,7 @@ class UserDeviceTypes:
     device_name: str
 
 
-def find_user_device_types(
-    session: Session, user_name: str
-) -> list[UserDeviceTypes]:
-    stmt = text("""SELECT u.name,
+FIND_USER_DEVICE_TYPES = text("""SELECT u.name,
     ut.type,
     dt.type,
     dt.name
@@ -27,7 +43,12 @@ FROM DeviceTypesToUserTypes dttut
     AND u.name = :user_name
 WHERE u.id IS NOT Null;""")
 
-    res = session.execute(stmt, {"user_name": user_name})
+
+@timed
+def find_user_device_types(
+    session: Session, user_name: str
+) -> list[UserDeviceTypes]:
+    res = session.execute(FIND_USER_DEVICE_TYPES, {"user_name": user_name})
 
     return [
         UserDeviceTypes(
@@ -40,22 +61,200 @@ WHERE u.id IS NOT Null;""")
     ]
 
 
-@dataclass
+# Строк на одно чтение из серверного курсора в потоковых запросах
+STREAM_ROWS = 1000
+
+
+class UserDeviceTypesRow(NamedTuple):
+    user_name: str
+    user_type: str
+    device_type: str
+    device_name: str
+
+
+@timed
+def stream_user_device_types(
+    session: Session, user_name: str, *, yield_per: int = STREAM_ROWS
+) -> Iterator[UserDeviceTypesRow]:
+    """
+    find_user_device_types без списка: строки читаются через серверный
+    курсор (SSCursor pymysql) по yield_per штук. Пока генератор
+    не дочитан или не закрыт, соединение сессии занято им
+    """
+    res = session.execute(
+        FIND_USER_DEVICE_TYPES,
+        {"user_name": user_name},
+        execution_options={"yield_per": yield_per},
+    )
+    with res:
+        yield from map(UserDeviceTypesRow._make, res)
+
+
+# Результаты запросов, сбрасываются записью генераторов в их таблицы
+result_cache = ResultCache("db", RESULT_CACHE_SIZE, RESULT_CACHE_TTL)
+
+permission_cache = PermissionCache(
+    "db", PERMISSION_CACHE_SIZE, PERMISSION_CACHE_TTL
+)
+
+
+@timed
+def load_user_types(session: Session, user_name: str) -> list[str]:
+    """Типы всех пользователей с именем user_name"""
+    stmt = text("""SELECT ut.type
+FROM Users u
+    INNER JOIN UserTypes ut ON ut.id = u.user_type_id
+WHERE u.name = :user_name;""")
+
+    return list(session.scalars(stmt, {"user_name": user_name}))
+
+
+@timed
+def load_permission_matrix(session: Session) -> PermissionMatrix:
+    """Тип пользователя -> доступные типы устройств"""
+    stmt = text("""SELECT ut.type,
+    dt.type,
+    dt.name
+FROM DeviceTypesToUserTypes dttut
+    INNER JOIN DeviceTypes dt ON dt.id = dttut.device_type_id
+    INNER JOIN UserTypes ut ON ut.id = dttut.user_type_id;""")
+
+    matrix: defaultdict[str, list[tuple[str, str]]] = defaultdict(list)
+    for user_type, device_type, device_name in session.execute(stmt):
+        matrix[user_type].append((device_type, device_name))
+    return dict(matrix)
+
+
+def find_user_device_types_cached(
+    session: Session,
+    user_name: str,
+    cache: PermissionCache = permission_cache,
+) -> list[UserDeviceTypes]:
+    """
+    То же, что find_user_device_types, через кеш прав:
+    к БД обращается только при промахе
+    """
+    return [
+        UserDeviceTypes(
+            user_name=user_name,
+            user_type=user_type,
+            device_type=device_type,
+            device_name=device_name,
+        )
+        for user_type, device_type, device_name in cache.device_types(
+            user_name,
+            lambda: load_user_types(session, user_name),
+            lambda: load_permission_matrix(session),
+        )
+    ]
+
+
+@dataclass(slots=True)
+class ControllableDevice:
+    device_id: int
+    device_type: str
+    device_name: str
+
+
+@timed
+def find_controllable_devices(
+    session: Session, user_id: int, house_id: int
+) -> list[ControllableDevice]:
+    """
+    Устройства дома, которыми может управлять пользователь:
+    тип устройства разрешён типу пользователя
+    """
+    stmt = text("""SELECT d.id,
+    dt.type,
+    dt.name
+FROM Users u
+    INNER JOIN DeviceTypesToUserTypes dttut
+        ON dttut.user_type_id = u.user_type_id
+    INNER JOIN Devices d ON d.house_id = :house_id
+    AND d.device_type_id = dttut.device_type_id
+    INNER JOIN DeviceTypes dt ON dt.id = d.device_type_id
+WHERE u.id = :user_id
+ORDER BY d.id;""")
+
+    res = session.execute(stmt, {"user_id": user_id, "house_id": house_id})
+
+    return [
+        ControllableDevice(
+            device_id=device[0], device_type=device[1], device_name=device[2]
+        )
+        for device in res
+    ]
+
+
+# Пар (пользователь, дом) в одном запросе
+PAIRS_PER_QUERY = 500
+
+CONTROLLABLE_DEVICES_BATCH = text("""SELECT p.user_id,
+    p.house_id,
+    d.id,
+    dt.type,
+    dt.name
+FROM JSON_TABLE(
+    :pairs,
+    '$[*]' COLUMNS (
+        user_id INT PATH '$[0]',
+        house_id INT PATH '$[1]'
+    )
+) p
+    INNER JOIN Users u ON u.id = p.user_id
+    INNER JOIN DeviceTypesToUserTypes dttut
+        ON dttut.user_type_id = u.user_type_id
+    INNER JOIN Devices d ON d.house_id = p.house_id
+    AND d.device_type_id = dttut.device_type_id
+    INNER JOIN DeviceTypes dt ON dt.id = d.device_type_id
+ORDER BY d.id;""")
+
+
+@timed
+def find_controllable_devices_batch(
+    session: Session, pairs: Iterable[tuple[int, int]]
+) -> dict[tuple[int, int], list[ControllableDevice]]:
+    """
+    find_controllable_devices сразу для многих пар (user_id, house_id):
+    пары передаются JSON-массивом в JSON_TABLE, один запрос
+    на PAIRS_PER_QUERY пар. Для пары без устройств - пустой список
+    """
+    result: dict[tuple[int, int], list[ControllableDevice]] = {
+        pair: [] for pair in pairs
+    }
+    for chunk in batched(result, PAIRS_PER_QUERY, strict=False):
+        res = session.execute(
+            CONTROLLABLE_DEVICES_BATCH, {"pairs": json.dumps(chunk)}
+        )
+        for user_id, house_id, *device in res:
+            result[user_id, house_id].append(
+                ControllableDevice(
+                    device_id=device[0],
+                    device_type=device[1],
+                    device_name=device[2],
+                )
+            )
+    return result
+
+
+@dataclass(slots=True)
 class HousesWithActivatedDevices:
     id: int
     address: str
 
 
-def get_houses_with_activated_devices(
-    session: Session,
-) -> list[HousesWithActivatedDevices]:
-    stmt = text("""SELECT DISTINCT h.id,
+HOUSES_WITH_ACTIVATED_DEVICES = text("""SELECT DISTINCT h.id,
     h.address
 FROM Houses h
     INNER JOIN Devices d ON h.id = d.house_id
     INNER JOIN ActivationsToDevices atd ON d.id = atd.device_id;""")
 
-    res = session.execute(stmt)
+
+@timed
+def get_houses_with_activated_devices(
+    session: Session,
+) -> list[HousesWithActivatedDevices]:
+    res = session.execute(HOUSES_WITH_ACTIVATED_DEVICES)
 
     return [
         HousesWithActivatedDevices(id=house[0], address=house[1])
@@ -63,27 +262,123 @@ FROM Houses h
     ]
 
 
-@dataclass
+class HouseRow(NamedTuple):
+    id: int
+    address: str
+
+
+@timed
+def stream_houses_with_activated_devices(
+    session: Session, *, yield_per: int = STREAM_ROWS
+) -> Iterator[HouseRow]:
+    """
+    get_houses_with_activated_devices без списка: память на yield_per
+    строк при любом числе домов. Соединение занято до конца чтения
+    """
+    res = session.execute(
+        HOUSES_WITH_ACTIVATED_DEVICES,
+        execution_options={"yield_per": yield_per},
+    )
+    with res:
+        yield from map(HouseRow._make, res)
+
+
+@dataclass(slots=True)
 class MaxThermostatValue:
     address: str
     measure_time: datetime
     value: float
 
 
+MAX_THERMOSTAT_VALUE = text("""SELECT h.address,
+    s.max_time,
+    s.max_value
+FROM DeviceMeasureStats s
+    INNER JOIN Devices d ON d.id = s.device_id
+    INNER JOIN DeviceTypes dt ON d.device_type_id = dt.id
+    INNER JOIN Houses h ON h.id = d.house_id
+WHERE dt.type = 'thermostat'
+ORDER BY s.max_value DESC,
+    s.max_time
+LIMIT 1;""")
+
+
+@timed
 def get_max_thermostat_value(session: Session) -> MaxThermostatValue:
-    stmt = text("""SELECT h.address,
+    """
+    По сводке DeviceMeasureStats: одна строка на устройство,
+    измерения не читаются. LookupError - сводка термостатов пуста
+    """
+    res = session.execute(MAX_THERMOSTAT_VALUE).first()
+
+    if res is None:
+        msg = "Нет сводки измерений термостатов"
+        raise LookupError(msg)
+    return MaxThermostatValue(
+        address=res[0],
+        measure_time=res[1],
+        value=res[2],
+    )
+
+
+get_houses_with_activated_devices_cached = result_cache.cached(
+    "Houses", "Devices", "ActivationsToDevices"
+)(get_houses_with_activated_devices)
+
+get_max_thermostat_value_cached = result_cache.cached(
+    "DeviceMeasureStats", "Devices", "DeviceTypes", "Houses"
+)(get_max_thermostat_value)
+
+
+THERMOSTAT_MAX_VALUES = text("""SELECT d.id,
+    (
+        SELECT MAX(m.value)
+        FROM Measures m
+        WHERE m.device_id = d.id
+    ) AS max_value
+FROM Devices d
+    INNER JOIN DeviceTypes dt ON d.device_type_id = dt.id
+WHERE dt.type = 'thermostat';""")
+
+DEVICE_MAX_MEASURE = text("""SELECT h.address,
     m.measure_time,
     m.value
 FROM Measures m
-    LEFT JOIN Devices d ON m.device_id = d.id
-    LEFT JOIN DeviceTypes dt ON d.device_type_id = dt.id
-    LEFT JOIN Houses h ON h.id = d.house_id
-WHERE dt.type = 'thermostat'
+    INNER JOIN Devices d ON m.device_id = d.id
+    INNER JOIN Houses h ON h.id = d.house_id
+WHERE m.device_id = :device_id
 ORDER BY m.value DESC
 LIMIT 1;""")
 
-    res = session.execute(stmt).first()
 
+@timed
+def get_max_thermostat_value_from_measures(
+    session: Session,
+) -> MaxThermostatValue:
+    """
+    По сырым Measures, без DeviceMeasureStats.
+    Сначала максимум по каждому термостату (поиск по индексу
+    Measures(device_id, value) вместо полного просмотра с сортировкой),
+    затем само измерение лучшего термостата.
+    LookupError - у термостатов нет измерений
+    """
+    best = max(
+        (
+            row
+            for row in session.execute(THERMOSTAT_MAX_VALUES)
+            if row[1] is not None
+        ),
+        key=itemgetter(1),
+        default=None,
+    )
+    if best is None:
+        msg = "Нет измерений термостатов"
+        raise LookupError(msg)
+
+    res = session.execute(DEVICE_MAX_MEASURE, {"device_id": best[0]}).first()
+    if res is None:
+        msg = f"Нет измерений термостата {best[0]}"
+        raise LookupError(msg)
     return MaxThermostatValue(
         address=res[0],
         measure_time=res[1],
@@ -91,20 +386,319 @@ LIMIT 1;""")
     )
 
 
+# Строк измерений / интервалов в одной странице запроса
+PAGE_SIZE = 1000
+PAGE_BUCKETS = 500
+
+
+def check_measures_target(device_id: int | None, house_id: int | None) -> None:
+    if (device_id is None) == (house_id is None):
+        msg = "Нужен ровно один из device_id и house_id"
+        raise ValueError(msg)
+
+
+@dataclass(slots=True)
+class MeasurePoint:
+    id: int
+    device_id: int
+    measure_time: datetime
+    value: float | None
+
+
+DEVICE_MEASURES_PAGE = text("""SELECT m.id,
+    m.device_id,
+    m.measure_time,
+    m.value
+FROM Measures m
+WHERE m.device_id = :device_id
+    AND m.measure_time >= :after_time
+    AND m.measure_time < :end
+    AND (
+        m.measure_time > :after_time
+        OR m.id > :after_id
+    )
+ORDER BY m.measure_time,
+    m.id
+LIMIT :page_size;""")
+
+HOUSE_DEVICES = text("""SELECT d.id
+FROM Devices d
+WHERE d.house_id = :house_id
+ORDER BY d.id;""")
+
+
+def measures_devices(
+    session: Session, device_id: int | None, house_id: int | None
+) -> list[int]:
+    """Устройства, чьи измерения запрошены: одно устройство или весь дом"""
+    check_measures_target(device_id, house_id)
+    if device_id is not None:
+        return [device_id]
+    return list(session.scalars(HOUSE_DEVICES, {"house_id": house_id}))
+
+
+def iter_device_measures(
+    session: Session,
+    device_id: int,
+    start: datetime,
+    end: datetime,
+    page_size: int,
+) -> Iterator[MeasurePoint]:
+    """
+    Измерения одного устройства в [start, end) по (measure_time, id).
+    Страницы по page_size строк читаются по ключу после последней
+    выданной строки, без OFFSET: каждая страница - переход по индексу
+    device_time (в InnoDB он продолжается первичным ключом с id)
+    """
+    # id начинаются с 1 - первая страница с самого start
+    after_time, after_id = start, 0
+    while True:
+        page = session.execute(
+            DEVICE_MEASURES_PAGE,
+            {
+                "device_id": device_id,
+                "end": end,
+                "after_time": after_time,
+                "after_id": after_id,
+                "page_size": page_size,
+            },
+        ).all()
+        for row in page:
+            yield MeasurePoint(
+                id=row[0], device_id=row[1], measure_time=row[2], value=row[3]
+            )
+        if len(page) < page_size:
+            return
+        after_id, _, after_time, _ = page[-1]
+
+
+@timed
+def iter_measures(  # noqa: PLR0913
+    session: Session,
+    start: datetime,
+    end: datetime,
+    *,
+    device_id: int | None = None,
+    house_id: int | None = None,
+    page_size: int = PAGE_SIZE,
+) -> Iterator[MeasurePoint]:
+    """
+    Измерения устройства или дома в [start, end) по возрастанию времени.
+    Устройства дома читаются по отдельности (iter_device_measures),
+    а их потоки сливаются heapq.merge: keyset по (measure_time, id)
+    после JOIN с Devices не опирается ни на один индекс.
+    В памяти - не больше страницы на устройство
+    """
+    yield from heapq.merge(
+        *(
+            iter_device_measures(session, device, start, end, page_size)
+            for device in measures_devices(session, device_id, house_id)
+        ),
+        key=attrgetter("measure_time", "id"),
+    )
+
+
+# Запрос к Measures -> индекс, по которому он должен читать измерения
+MEASURE_INDEXES: dict[str, tuple[TextClause, dict[str, Any], str]] = {
+    "thermostat_max_values": (THERMOSTAT_MAX_VALUES, {}, "device_value"),
+    "device_max_measure": (
+        DEVICE_MAX_MEASURE,
+        {"device_id": 0},
+        "device_value",
+    ),
+    "device_measures_page": (
+        DEVICE_MEASURES_PAGE,
+        {
+            "device_id": 0,
+            "end": "2000-02-01",
+            "after_time": "2000-01-01",
+            "after_id": 0,
+            "page_size": PAGE_SIZE,
+        },
+        "device_time",
+    ),
+}
+
+
+# Extra плана EXPLAIN, когда MySQL сортирует результат сам
+PLAN_SORTS = ("Using filesort", "Using temporary")
+
+
+@dataclass(slots=True)
+class MeasurePlan:
+    """План EXPLAIN запроса к Measures"""
+
+    # индекс Measures (строка m), None - полный просмотр
+    key: str | None
+    # Extra всех строк плана
+    extra: list[str]
+
+    def problem(self, expected_key: str) -> str | None:
+        """Чем план хуже ожидаемого: не тот индекс или сортировка"""
+        if self.key != expected_key:
+            return f"индекс {self.key}, ожидался {expected_key}"
+        sorts = [
+            sort
+            for sort in PLAN_SORTS
+            if any(sort in extra for extra in self.extra)
+        ]
+        return ", ".join(sorts) if sorts else None
+
+
+def explain_measure_indexes(session: Session) -> dict[str, MeasurePlan]:
+    """EXPLAIN каждого запроса MEASURE_INDEXES"""
+    plans: dict[str, MeasurePlan] = {}
+    for name, (stmt, params, _) in MEASURE_INDEXES.items():
+        rows = session.execute(text(f"EXPLAIN {stmt.text}"), params)
+        plan = list(rows.mappings())
+        plans[name] = MeasurePlan(
+            key=next(
+                (row["key"] for row in plan if row["table"] == "m"), None
+            ),
+            extra=[row["Extra"] for row in plan if row["Extra"]],
+        )
+    return plans
+
+
+def check_measure_plans(plans: Mapping[str, MeasurePlan]) -> dict[str, str]:
+    """
+    Запросы MEASURE_INDEXES, чей план читает не свой индекс
+    или сортирует (filesort, временная таблица): имя -> причина
+    """
+    problems: dict[str, str] = {}
+    for name, plan in plans.items():
+        problem = plan.problem(MEASURE_INDEXES[name][2])
+        if problem is not None:
+            problems[name] = problem
+    return problems
+
+
+MEASURE_BUCKETS = text("""SELECT FLOOR(
+        TIMESTAMPDIFF(SECOND, :start, m.measure_time) / :bucket_seconds
+    ) AS bucket,
+    AVG(m.value),
+    MIN(m.value),
+    MAX(m.value),
+    COUNT(m.value)
+FROM Measures m
+WHERE m.device_id IN :device_ids
+    AND m.measure_time >= :page_start
+    AND m.measure_time < :page_end
+    AND m.value IS NOT NULL
+GROUP BY bucket
+ORDER BY bucket;""").bindparams(bindparam("device_ids", expanding=True))
+
+
+@dataclass(slots=True)
+class MeasureBucket:
+    start: datetime
+    avg_value: float
+    min_value: float
+    max_value: float
+    count: int
+
+
+@timed
+def iter_measure_buckets(  # noqa: PLR0913
+    session: Session,
+    start: datetime,
+    end: datetime,
+    bucket_minutes: int,
+    *,
+    device_id: int | None = None,
+    house_id: int | None = None,
+    page_buckets: int = PAGE_BUCKETS,
+) -> Iterator[MeasureBucket]:
+    """
+    avg/min/max измерений устройства или дома по интервалам
+    bucket_minutes минут от start. Интервалы без измерений пропускаются.
+    Каждая страница - page_buckets интервалов, запрос ограничен
+    их диапазоном времени
+    """
+    device_ids = measures_devices(session, device_id, house_id)
+
+    bucket = timedelta(minutes=bucket_minutes)
+    page_start = start
+    while page_start < end:
+        page_end = min(end, page_start + page_buckets * bucket)
+        res = session.execute(
+            MEASURE_BUCKETS,
+            {
+                "device_ids": device_ids,
+                "start": start,
+                "bucket_seconds": int(bucket.total_seconds()),
+                "page_start": page_start,
+                "page_end": page_end,
+            },
+        )
+        for row in res:
+            yield MeasureBucket(
+                start=start + int(row[0]) * bucket,
+                avg_value=row[1],
+                min_value=row[2],
+                max_value=row[3],
+                count=row[4],
+            )
+        page_start = page_end
+
+
+def input_measures_query() -> dict[str, Any]:
+    """Устройство или дом и период [start, end) для консоли"""
+    device_id = input("ID устройства (пусто - измерения дома): ")
+    target = (
+        {"device_id": int(device_id)}
+        if device_id
+        else {"house_id": int(input("ID дома: "))}
+    )
+    return {
+        **target,
+        "start": datetime.fromisoformat(input("С (ГГГГ-ММ-ДД ЧЧ:ММ): ")),
+        "end": datetime.fromisoformat(input("По (ГГГГ-ММ-ДД ЧЧ:ММ): ")),
+    }
+
+
+# Функция консоли -> запрос с вводом параметров, строки для вывода.
+# Аргументы вычисляются слева направо - input вызывается в этом порядке
+CONSOLE_REQUESTS: dict[str, Callable[[Session], Iterable[object]]] = {
+    "findUserDeviceTypes": lambda session: stream_user_device_types(
+        session, input("Введите имя: ")
+    ),
+    "getHousesWithActivatedDevices": stream_houses_with_activated_devices,
+    "getMaxThermostatValue": lambda session: [
+        get_max_thermostat_value_cached(session)
+    ],
+    "findControllableDevices": lambda session: [
+        find_controllable_devices(
+            session,
+            int(input("ID пользователя: ")),
+            int(input("ID дома: ")),
+        )
+    ],
+    "getMeasures": lambda session: iter_measures(
+        session, **input_measures_query()
+    ),
+    "getMeasureBuckets": lambda session: iter_measure_buckets(
+        session,
+        **input_measures_query(),
+        bucket_minutes=int(input("Интервал, минут: ")),
+    ),
+}
+
+
 def start_req_db(session: Session) -> None:
     func = input(
         """Выберите функцию:
-        - findUserDeviceTypes, 
+        - findUserDeviceTypes
         - getHousesWithActivatedDevices
         - getMaxThermostatValue
+        - findControllableDevices
+        - getMeasures
+        - getMeasureBuckets
         : """
     )
-    if func == "findUserDeviceTypes":
-        user_name = input("Введите имя: ")
-        print(find_user_device_types(session=session, user_name=user_name))
-    elif func == "getHousesWithActivatedDevices":
-        print(get_houses_with_activated_devices(session=session))
-    elif func == "getMaxThermostatValue":
-        print(get_max_thermostat_value(session=session))
-    else:
-        print("Неверное имя функции")
+    request = CONSOLE_REQUESTS.get(func)
+    if request is None:
+        logger.error("Неверное имя функции: %s", func)
+        return
+    for row in request(session):
+        logger.info("%s", row)
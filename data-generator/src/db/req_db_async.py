@@ -0,0 +1,88 @@
+import asyncio
+from collections.abc import Iterable
+
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+from config import DB_ASYNC_CONCURRENCY
+from db.req_db import (
+    FIND_USER_DEVICE_TYPES,
+    HOUSES_WITH_ACTIVATED_DEVICES,
+    MAX_THERMOSTAT_VALUE,
+    HousesWithActivatedDevices,
+    MaxThermostatValue,
+    UserDeviceTypes,
+)
+from timing import timed
+
+# Те же запросы и типы результатов, что в db.req_db, на AsyncSession.
+# AsyncSession не разделяется между задачами - у каждой своя
+
+
+@timed
+async def find_user_device_types(
+    session: AsyncSession, user_name: str
+) -> list[UserDeviceTypes]:
+    res = await session.execute(
+        FIND_USER_DEVICE_TYPES, {"user_name": user_name}
+    )
+
+    return [
+        UserDeviceTypes(
+            user_name=utd[0],
+            user_type=utd[1],
+            device_type=utd[2],
+            device_name=utd[3],
+        )
+        for utd in res
+    ]
+
+
+@timed
+async def get_houses_with_activated_devices(
+    session: AsyncSession,
+) -> list[HousesWithActivatedDevices]:
+    res = await session.execute(HOUSES_WITH_ACTIVATED_DEVICES)
+
+    return [
+        HousesWithActivatedDevices(id=house[0], address=house[1])
+        for house in res
+    ]
+
+
+@timed
+async def get_max_thermostat_value(
+    session: AsyncSession,
+) -> MaxThermostatValue:
+    """LookupError - сводка термостатов пуста, как в db.req_db"""
+    res = (await session.execute(MAX_THERMOSTAT_VALUE)).first()
+
+    if res is None:
+        msg = "Нет сводки измерений термостатов"
+        raise LookupError(msg)
+    return MaxThermostatValue(
+        address=res[0],
+        measure_time=res[1],
+        value=res[2],
+    )
+
+
+async def find_many_user_device_types(
+    make_session: async_sessionmaker[AsyncSession],
+    user_names: Iterable[str],
+    *,
+    concurrency: int = DB_ASYNC_CONCURRENCY,
+) -> dict[str, list[UserDeviceTypes]]:
+    """
+    find_user_device_types для многих имён из одного цикла событий:
+    не больше concurrency запросов одновременно, каждый в своей сессии
+    (соединение из пула - на время запроса)
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def lookup(user_name: str) -> list[UserDeviceTypes]:
+        async with semaphore, make_session() as session:
+            return await find_user_device_types(session, user_name)
+
+    names = list(dict.fromkeys(user_names))
+    results = await asyncio.gather(*map(lookup, names))
+    return dict(zip(names, results, strict=True))
@@ -9,15 +9,37 @@ FROM DeviceTypesToUserTypes dttut
     LEFT JOIN Users u ON u.user_type_id = ut.id
     AND u.name = 'Рогов Филимон Геннадиевич'
 WHERE u.id IS NOT Null;
--- Самая большая зафиксированная температура
+-- Самая большая зафиксированная температура - по сводке DeviceMeasureStats
+SELECT h.address,
+    s.max_time,
+    s.max_value
+FROM DeviceMeasureStats s
+    INNER JOIN Devices d ON d.id = s.device_id
+    INNER JOIN DeviceTypes dt ON d.device_type_id = dt.id
+    INNER JOIN Houses h ON h.id = d.house_id
+WHERE dt.type = 'thermostat'
+ORDER BY s.max_value DESC,
+    s.max_time
+LIMIT 1;
+-- То же по сырым Measures
+-- 1. Максимум по каждому термостату - поиск по индексу device_value
+SELECT d.id,
+    (
+        SELECT MAX(m.value)
+        FROM Measures m
+        WHERE m.device_id = d.id
+    ) AS max_value
+FROM Devices d
+    INNER JOIN DeviceTypes dt ON d.device_type_id = dt.id
+WHERE dt.type = 'thermostat';
+-- 2. Измерение термостата с наибольшим максимумом (id из шага 1)
 SELECT h.address,
     m.measure_time,
     m.value
 FROM Measures m
-    LEFT JOIN Devices d ON m.device_id = d.id
-    LEFT JOIN DeviceTypes dt ON d.device_type_id = dt.id
-    LEFT JOIN Houses h ON h.id = d.house_id
-WHERE dt.type = 'thermostat'
+    INNER JOIN Devices d ON m.device_id = d.id
+    INNER JOIN Houses h ON h.id = d.house_id
+WHERE m.device_id = 1
 ORDER BY m.value DESC
 LIMIT 1;
 -- Все "умные" дома. Дома в которых есть сценарии
@@ -25,4 +47,49 @@ SELECT DISTINCT h.id,
     h.address
 FROM Houses h
     INNER JOIN Devices d ON h.id = d.house_id
-    INNER JOIN ActivationsToDevices atd ON d.id = atd.device_id;
\ No newline at end of file
+    INNER JOIN ActivationsToDevices atd ON d.id = atd.device_id;
+-- Измерения устройства за период, страница после (measure_time, id)
+-- последней строки предыдущей страницы
+SELECT m.id,
+    m.device_id,
+    m.measure_time,
+    m.value
+FROM Measures m
+WHERE m.device_id = 1
+    AND m.measure_time >= '2026-09-01 00:00:00'
+    AND m.measure_time < '2026-10-01 00:00:00'
+    AND (
+        m.measure_time > '2026-09-01 00:00:00'
+        OR m.id > 0
+    )
+ORDER BY m.measure_time,
+    m.id
+LIMIT 1000;
+-- avg/min/max измерений дома по 60 минут
+SELECT FLOOR(
+        TIMESTAMPDIFF(SECOND, '2026-09-01 00:00:00', m.measure_time) / 3600
+    ) AS bucket,
+    AVG(m.value),
+    MIN(m.value),
+    MAX(m.value),
+    COUNT(m.value)
+FROM Measures m
+    INNER JOIN Devices d ON d.id = m.device_id
+WHERE d.house_id = 1
+    AND m.measure_time >= '2026-09-01 00:00:00'
+    AND m.measure_time < '2026-10-01 00:00:00'
+    AND m.value IS NOT NULL
+GROUP BY bucket
+ORDER BY bucket;
+-- Устройства дома, которыми может управлять пользователь
+SELECT d.id,
+    dt.type,
+    dt.name
+FROM Users u
+    INNER JOIN DeviceTypesToUserTypes dttut
+        ON dttut.user_type_id = u.user_type_id
+    INNER JOIN Devices d ON d.house_id = 1
+    AND d.device_type_id = dttut.device_type_id
+    INNER JOIN DeviceTypes dt ON dt.id = d.device_type_id
+WHERE u.id = 1
+ORDER BY d.id;
\ No newline at end of file
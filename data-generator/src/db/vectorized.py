@@ -0,0 +1,138 @@
+from collections.abc import Iterator, Sequence
+from datetime import datetime
+from typing import Any
+
+import numpy as np
+
+from db.fast_load import NULL
+from scale import CHUNK_SIZE
+
+type Columns = dict[str, np.ndarray]
+
+# Доля NULL в choice_or_null, как у rng.choice([None, ...])
+NULL_SHARE = 0.5
+
+
+def as_array(ids: Sequence[int]) -> np.ndarray:
+    if isinstance(ids, range):
+        return np.arange(ids.start, ids.stop, ids.step)
+    return np.asarray(ids)
+
+
+def choice(
+    gen: np.random.Generator, ids: np.ndarray, count: int
+) -> np.ndarray:
+    return ids[gen.integers(0, len(ids), count)]
+
+
+def choice_or_null(
+    gen: np.random.Generator, ids: np.ndarray, count: int
+) -> np.ndarray:
+    """Как rng.choice([None, rng.choice(ids)]): NULL с вероятностью 1/2"""
+    values = choice(gen, ids, count).astype(object)
+    values[gen.random(count) < NULL_SHARE] = None
+    return values
+
+
+def events_columns(
+    gen: np.random.Generator,
+    count: int,
+    user_ids: np.ndarray,
+    device_ids: np.ndarray,
+    scenario_ids: np.ndarray,
+) -> Columns:
+    return {
+        "value": gen.integers(0, 2, count),
+        "user_id": choice_or_null(gen, user_ids, count),
+        "device_id": choice_or_null(gen, device_ids, count),
+        "scenario_id": choice_or_null(gen, scenario_ids, count),
+    }
+
+
+def measures_columns(
+    gen: np.random.Generator,
+    count: int,
+    device_ids: np.ndarray,
+    now: datetime,
+) -> Columns:
+    # те же 0-60 дней и 0-23 часа назад, что и в measure_row
+    offsets = (
+        gen.integers(0, 61, count) * 86400 + gen.integers(0, 24, count) * 3600
+    )
+    start = np.datetime64(now.replace(tzinfo=None), "us")
+    return {
+        "device_id": choice(gen, device_ids, count),
+        "measure_time": start - offsets.astype("timedelta64[s]"),
+        "value": np.round(gen.uniform(0.0, 100.0, count), 2),
+    }
+
+
+def events_chunks(  # noqa: PLR0913
+    gen: np.random.Generator,
+    user_ids: Sequence[int],
+    device_ids: Sequence[int],
+    scenario_ids: Sequence[int],
+    count_events: int,
+    *,
+    chunk_size: int = CHUNK_SIZE,
+) -> Iterator[Columns]:
+    """
+    События столбцами по chunk_size строк.
+    Распределение то же, что у event_row
+    """
+    users = as_array(user_ids)
+    devices = as_array(device_ids)
+    scenarios = as_array(scenario_ids)
+    for start in range(0, count_events, chunk_size):
+        count = min(chunk_size, count_events - start)
+        yield events_columns(gen, count, users, devices, scenarios)
+
+
+def measures_chunks(
+    gen: np.random.Generator,
+    device_ids: Sequence[int],
+    count_measures: int,
+    now: datetime,
+    *,
+    chunk_size: int = CHUNK_SIZE,
+) -> Iterator[Columns]:
+    """
+    Измерения столбцами по chunk_size строк.
+    Распределение то же, что у measure_row
+    """
+    devices = as_array(device_ids)
+    for start in range(0, count_measures, chunk_size):
+        count = min(chunk_size, count_measures - start)
+        yield measures_columns(gen, count, devices, now)
+
+
+def column_count(columns: Columns) -> int:
+    return len(next(iter(columns.values())))
+
+
+def column_tuples(columns: Columns) -> list[tuple[Any, ...]]:
+    """Строки-кортежи из столбцов, значения - обычные объекты Python"""
+    return list(
+        zip(*(column.tolist() for column in columns.values()), strict=True)
+    )
+
+
+def column_rows(columns: Columns) -> Iterator[dict[str, Any]]:
+    names = list(columns)
+    for row in column_tuples(columns):
+        yield dict(zip(names, row, strict=True))
+
+
+def tsv_column(column: np.ndarray) -> np.ndarray:
+    if column.dtype == object:
+        # None - массивом object, иначе ufunc без перегрузки для None
+        missing = np.equal(column, np.array(None, dtype=object))
+        return np.where(missing, NULL, column.astype(str))
+    # datetime64 -> 'YYYY-MM-DDTHH:MM:SS.ffffff', MySQL принимает T
+    return column.astype(str)
+
+
+def tsv_block(columns: Columns) -> str:
+    """Столбцы одним куском TSV для LOAD DATA"""
+    values = [tsv_column(column).tolist() for column in columns.values()]
+    return "\n".join(map("\t".join, zip(*values, strict=True))) + "\n"
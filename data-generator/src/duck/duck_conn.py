@@ -0,0 +1,92 @@
+import duckdb
+
+from config import DUCKDB_PATH
+
+# Таблицы и столбцы те же, что в MySQL (shch-mysql/src/01-create.sql).
+# Внешних ключей и индексов нет: DuckDB читает столбцы целиком,
+# а ключи только замедлили бы загрузку и очистку.
+# DeviceMeasureStats не нужна - Measures просматривается по столбцам
+SCHEMA = """CREATE TABLE IF NOT EXISTS UserTypes (
+    id INTEGER PRIMARY KEY,
+    type VARCHAR NOT NULL
+);
+CREATE TABLE IF NOT EXISTS DeviceTypes (
+    id INTEGER PRIMARY KEY,
+    type VARCHAR NOT NULL,
+    name VARCHAR NOT NULL
+);
+CREATE TABLE IF NOT EXISTS DeviceTypesToUserTypes (
+    device_type_id INTEGER NOT NULL,
+    user_type_id INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS Houses (
+    id INTEGER PRIMARY KEY,
+    address VARCHAR NOT NULL
+);
+CREATE TABLE IF NOT EXISTS Devices (
+    id INTEGER PRIMARY KEY,
+    house_id INTEGER NOT NULL,
+    device_type_id INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS Users (
+    id INTEGER PRIMARY KEY,
+    name VARCHAR NOT NULL,
+    user_type_id INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS Scenarios (
+    id INTEGER PRIMARY KEY,
+    time_from TIME NOT NULL,
+    time_till TIME NOT NULL
+);
+CREATE TABLE IF NOT EXISTS ActivationsToDevices (
+    scenario_id INTEGER NOT NULL,
+    device_id INTEGER NOT NULL,
+    is_on BOOLEAN NOT NULL,
+    affect_time TIME
+);
+CREATE TABLE IF NOT EXISTS CoNEToDevices (
+    scenario_id INTEGER NOT NULL,
+    device_id INTEGER NOT NULL,
+    is_on BOOLEAN NOT NULL
+);
+CREATE TABLE IF NOT EXISTS Events (
+    id INTEGER NOT NULL,
+    user_id INTEGER,
+    device_id INTEGER,
+    scenario_id INTEGER,
+    value BOOLEAN NOT NULL
+);
+CREATE TABLE IF NOT EXISTS Measures (
+    id INTEGER NOT NULL,
+    device_id INTEGER NOT NULL,
+    measure_time TIMESTAMP NOT NULL,
+    value DOUBLE
+);"""
+
+# В порядке создания: справочники раньше ссылающихся на них таблиц
+TABLES = (
+    "UserTypes",
+    "DeviceTypes",
+    "DeviceTypesToUserTypes",
+    "Houses",
+    "Devices",
+    "Users",
+    "Scenarios",
+    "ActivationsToDevices",
+    "CoNEToDevices",
+    "Events",
+    "Measures",
+)
+
+
+def connect(
+    path: str = DUCKDB_PATH, *, read_only: bool = False
+) -> duckdb.DuckDBPyConnection:
+    """
+    Соединение со встроенной DuckDB, таблицы создаются при первом
+    открытии. Для потоков - con.cursor(): соединение не потокобезопасно
+    """
+    con = duckdb.connect(path, read_only=read_only)
+    if not read_only:
+        con.execute(SCHEMA)
+    return con
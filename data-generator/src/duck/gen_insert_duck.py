@@ -0,0 +1,348 @@
+import random
+from collections.abc import Iterable, Iterator, Mapping, Sequence
+from datetime import UTC, datetime
+from functools import partial
+from itertools import batched
+from logging import getLogger
+from typing import Any
+
+import duckdb
+import numpy as np
+from faker import Faker
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+from tqdm import tqdm
+
+from cache import notify_write
+from db.gen_insert_db import (
+    DEVICES_PER_HOUSE,
+    SEED,
+    Row,
+    device_types_rows,
+    fake,
+    house_devices,
+    iter_events,
+    iter_measures,
+    iter_scenarios,
+    iter_users,
+    rng,
+    scenario_links,
+    table_references,
+    type_associations,
+    user_types_rows,
+)
+from db.models import Base
+from db.vectorized import (
+    Columns,
+    column_count,
+    events_chunks,
+    measures_chunks,
+)
+from duck.duck_conn import TABLES
+from scale import CHUNK_SIZE, GenerationCounts
+from scheduler import Stage, derive_seed, run_stages
+
+logger = getLogger(name=__name__)
+
+
+def plain(value: Any) -> Any:  # noqa: ANN401
+    """Время в MySQL и DuckDB хранится без зоны, в UTC"""
+    if isinstance(value, datetime) and value.tzinfo is not None:
+        return value.astimezone(UTC).replace(tzinfo=None)
+    return value
+
+
+def rows_columns(rows: Sequence[Mapping[str, Any]]) -> Columns:
+    """Пачка строк столбцами object: так DuckDB принимает None и Decimal"""
+    return {
+        name: np.array([plain(row[name]) for row in rows], dtype=object)
+        for name in rows[0]
+    }
+
+
+def load_columns(
+    con: duckdb.DuckDBPyConnection, table: str, columns: Columns
+) -> None:
+    """
+    Столбцы NumPy в таблицу одним INSERT: DuckDB читает массивы
+    напрямую, без построчного разбора параметров
+    """
+    con.register("chunk", columns)
+    try:
+        con.execute(f"INSERT INTO {table} BY NAME SELECT * FROM chunk")
+    finally:
+        con.unregister("chunk")
+
+
+def insert_columns(
+    con: duckdb.DuckDBPyConnection, table: str, chunks: Iterable[Columns]
+) -> Sequence[int]:
+    """
+    Запись столбцов (db.vectorized) в таблицу. Таблицам с id он
+    назначается подряд после наибольшего, как в режиме bulk
+    insert_rows MySQL. Возвращает id новых строк
+    """
+    has_id = "id" in con.table(table).columns
+    start = next_id = 1
+    if has_id:
+        row = con.execute(
+            f"SELECT coalesce(max(id), 0) FROM {table}"
+        ).fetchone()
+        start = next_id = 1 + (row[0] if row else 0)
+
+    for columns in chunks:
+        count = column_count(columns)
+        ids = {"id": np.arange(next_id, next_id + count)} if has_id else {}
+        load_columns(con, table, {**ids, **columns})
+        next_id += count
+
+    notify_write("duckdb", [table])
+    return range(start, next_id) if has_id else []
+
+
+def insert_rows(
+    con: duckdb.DuckDBPyConnection,
+    table: str,
+    rows: Iterable[Row],
+    *,
+    chunk_size: int = CHUNK_SIZE,
+) -> Sequence[int]:
+    """Строки генераторов db.gen_insert_db пачками по chunk_size"""
+    return insert_columns(
+        con, table, map(rows_columns, batched(rows, chunk_size, strict=False))
+    )
+
+
+def clear_tables(con: duckdb.DuckDBPyConnection) -> None:
+    for table in reversed(TABLES):
+        con.execute(f"DELETE FROM {table}")
+    notify_write("duckdb", TABLES)
+
+
+def all_house_devices(
+    house_ids: Sequence[int],
+    device_type_ids: Sequence[int],
+    *,
+    rng: random.Random,
+) -> Iterator[Row]:
+    """Строки Devices всех домов, по DEVICES_PER_HOUSE на дом"""
+    for house_id in tqdm(house_ids, desc="create_devices"):
+        yield from house_devices(
+            house_id, device_type_ids, DEVICES_PER_HOUSE, rng=rng
+        )
+
+
+def all_scenario_links(
+    scenario_ids: Sequence[int],
+    device_ids: Sequence[int],
+    *,
+    rng: random.Random,
+) -> tuple[list[Row], list[Row]]:
+    """Строки ActivationsToDevices и CoNEToDevices всех сценариев"""
+    activations: list[Row] = []
+    cones: list[Row] = []
+    for scenario_id in tqdm(scenario_ids, desc="create_activations_and_cone"):
+        scenario_activations, scenario_cones = scenario_links(
+            scenario_id, device_ids, rng=rng
+        )
+        activations.extend(scenario_activations)
+        cones.extend(scenario_cones)
+    return activations, cones
+
+
+def insert_events_and_measures_columns(
+    con: duckdb.DuckDBPyConnection,
+    data: Mapping[str, Sequence[int]],
+    counts: GenerationCounts,
+    now: datetime,
+    *,
+    chunk_size: int,
+) -> None:
+    """События и измерения столбцами NumPy (vectorized=True)"""
+    gen = np.random.default_rng(derive_seed(SEED, "events_and_measures"))
+    insert_columns(
+        con,
+        "Events",
+        events_chunks(
+            gen,
+            data["users"],
+            data["devices"],
+            data["scenarios"],
+            counts.events,
+            chunk_size=chunk_size,
+        ),
+    )
+    insert_columns(
+        con,
+        "Measures",
+        measures_chunks(
+            gen, data["devices"], counts.measures, now, chunk_size=chunk_size
+        ),
+    )
+
+
+def populate_duckdb(
+    con: duckdb.DuckDBPyConnection,
+    *,
+    clear_first: bool = True,
+    scale_factor: float = 1.0,
+    chunk_size: int = CHUNK_SIZE,
+    vectorized: bool = False,
+) -> dict[str, float]:
+    """
+    То же, что populate_database в последовательном режиме: те же
+    этапы, генераторы строк и seed. В новом процессе данные совпадают
+    с MySQL, заполненной в режиме bulk/infile/fifo (id - с 1 после
+    очистки). vectorized=True - события и измерения столбцами NumPy,
+    как в populate_database(vectorized=True).
+    Возвращает время выполнения этапов
+    """
+    if clear_first:
+        clear_tables(con)
+
+    counts = GenerationCounts.scaled(scale_factor)
+    data: dict[str, Sequence[int]] = {}
+
+    def reference(rng: random.Random, _: Faker) -> None:
+        data["user_types"] = insert_rows(con, "UserTypes", user_types_rows())
+        data["device_types"] = insert_rows(
+            con, "DeviceTypes", device_types_rows()
+        )
+        insert_rows(
+            con,
+            "DeviceTypesToUserTypes",
+            type_associations(
+                data["device_types"], data["user_types"], rng=rng
+            ),
+        )
+
+    def houses(_: random.Random, fake: Faker) -> None:
+        data["houses"] = insert_rows(
+            con,
+            "Houses",
+            (
+                {"address": fake.address()}
+                for _ in tqdm(range(counts.houses), desc="create_houses")
+            ),
+            chunk_size=chunk_size,
+        )
+
+    def devices(rng: random.Random, _: Faker) -> None:
+        data["devices"] = insert_rows(
+            con,
+            "Devices",
+            all_house_devices(data["houses"], data["device_types"], rng=rng),
+            chunk_size=chunk_size,
+        )
+
+    def users(rng: random.Random, fake: Faker) -> None:
+        data["users"] = insert_rows(
+            con,
+            "Users",
+            iter_users(data["user_types"], counts.users, rng=rng, fake=fake),
+            chunk_size=chunk_size,
+        )
+
+    def scenarios(rng: random.Random, _: Faker) -> None:
+        data["scenarios"] = insert_rows(
+            con,
+            "Scenarios",
+            iter_scenarios(counts.scenarios, rng=rng),
+            chunk_size=chunk_size,
+        )
+
+    def activations_and_cone(rng: random.Random, _: Faker) -> None:
+        activations, cones = all_scenario_links(
+            data["scenarios"], data["devices"], rng=rng
+        )
+        insert_rows(con, "ActivationsToDevices", activations)
+        insert_rows(con, "CoNEToDevices", cones)
+
+    def events_and_measures(rng: random.Random, _: Faker) -> None:
+        now = datetime.now(UTC)
+        if vectorized:
+            insert_events_and_measures_columns(
+                con, data, counts, now, chunk_size=chunk_size
+            )
+            return
+
+        insert_rows(
+            con,
+            "Events",
+            iter_events(
+                data["users"],
+                data["devices"],
+                data["scenarios"],
+                counts.events,
+                rng=rng,
+            ),
+            chunk_size=chunk_size,
+        )
+        insert_rows(
+            con,
+            "Measures",
+            iter_measures(data["devices"], counts.measures, now, rng=rng),
+            chunk_size=chunk_size,
+        )
+
+    stages = [
+        Stage(name, tables, partial(fill, rng, fake))
+        for name, tables, fill in (
+            (
+                "reference",
+                ("UserTypes", "DeviceTypes", "DeviceTypesToUserTypes"),
+                reference,
+            ),
+            ("houses", ("Houses",), houses),
+            ("devices", ("Devices",), devices),
+            ("users", ("Users",), users),
+            ("scenarios", ("Scenarios",), scenarios),
+            (
+                "activations_and_cone",
+                ("ActivationsToDevices", "CoNEToDevices"),
+                activations_and_cone,
+            ),
+            (
+                "events_and_measures",
+                ("Events", "Measures"),
+                events_and_measures,
+            ),
+        )
+    ]
+    timings = run_stages(stages, table_references(), max_workers=1)
+    logger.info(
+        "DuckDB: домов %d, устройств %d, пользователей %d, сценариев %d",
+        len(data["houses"]),
+        len(data["devices"]),
+        len(data["users"]),
+        len(data["scenarios"]),
+    )
+    return timings
+
+
+def copy_from_database(
+    con: duckdb.DuckDBPyConnection,
+    session: Session,
+    *,
+    chunk_size: int = CHUNK_SIZE,
+) -> dict[str, int]:
+    """
+    Копия таблиц MySQL в DuckDB - одни и те же данные для сравнения
+    строкового и столбцового хранения. Строки читаются серверным
+    курсором пачками по chunk_size. Возвращает число строк по таблицам
+    """
+    clear_tables(con)
+    copied: dict[str, int] = {}
+    for name in TABLES:
+        table = Base.metadata.tables[name]
+        columns = [table.c[column] for column in con.table(name).columns]
+        res = session.execute(
+            select(*columns), execution_options={"yield_per": chunk_size}
+        )
+        copied[name] = 0
+        with res:
+            for chunk in tqdm(res.mappings().partitions(), desc=name):
+                load_columns(con, name, rows_columns(chunk))
+                copied[name] += len(chunk)
+    notify_write("duckdb", TABLES)
+    return copied
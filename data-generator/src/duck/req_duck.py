@@ -0,0 +1,250 @@
+from collections.abc import Iterator
+from datetime import datetime, timedelta
+from logging import getLogger
+
+import duckdb
+
+from cache import ResultCache
+from config import RESULT_CACHE_SIZE, RESULT_CACHE_TTL
+from db.req_db import (
+    PAGE_SIZE,
+    ControllableDevice,
+    HousesWithActivatedDevices,
+    MaxThermostatValue,
+    MeasureBucket,
+    MeasurePoint,
+    UserDeviceTypes,
+    check_measures_target,
+)
+from timing import timed
+
+logger = getLogger(name=__name__)
+
+# Те же запросы и типы результатов, что в db.req_db.
+# Соединение не потокобезопасно: в потоках - каждому свой con.cursor()
+
+
+@timed
+def find_user_device_types(
+    con: duckdb.DuckDBPyConnection, user_name: str
+) -> list[UserDeviceTypes]:
+    res = con.execute(
+        """SELECT u.name,
+    ut.type,
+    dt.type,
+    dt.name
+FROM DeviceTypesToUserTypes dttut
+    INNER JOIN DeviceTypes dt ON dt.id = dttut.device_type_id
+    INNER JOIN UserTypes ut ON ut.id = dttut.user_type_id
+    INNER JOIN Users u ON u.user_type_id = ut.id
+WHERE u.name = $user_name;""",
+        {"user_name": user_name},
+    )
+
+    return [
+        UserDeviceTypes(
+            user_name=utd[0],
+            user_type=utd[1],
+            device_type=utd[2],
+            device_name=utd[3],
+        )
+        for utd in res.fetchall()
+    ]
+
+
+@timed
+def get_houses_with_activated_devices(
+    con: duckdb.DuckDBPyConnection,
+) -> list[HousesWithActivatedDevices]:
+    res = con.execute("""SELECT DISTINCT h.id,
+    h.address
+FROM Houses h
+    INNER JOIN Devices d ON h.id = d.house_id
+    INNER JOIN ActivationsToDevices atd ON d.id = atd.device_id;""")
+
+    return [
+        HousesWithActivatedDevices(id=house[0], address=house[1])
+        for house in res.fetchall()
+    ]
+
+
+@timed
+def get_max_thermostat_value(
+    con: duckdb.DuckDBPyConnection,
+) -> MaxThermostatValue:
+    """
+    Прямо по Measures, без сводки: DuckDB читает только нужные
+    столбцы, а ORDER BY ... LIMIT 1 выполняет как top-N без полной
+    сортировки
+    """
+    res = con.execute("""SELECT h.address,
+    m.measure_time,
+    m.value
+FROM Measures m
+    INNER JOIN Devices d ON d.id = m.device_id
+    INNER JOIN DeviceTypes dt ON d.device_type_id = dt.id
+    INNER JOIN Houses h ON h.id = d.house_id
+WHERE dt.type = 'thermostat'
+    AND m.value IS NOT NULL
+ORDER BY m.value DESC,
+    m.measure_time
+LIMIT 1;""").fetchone()
+
+    if res is None:
+        msg = "Нет измерений термостатов"
+        raise LookupError(msg)
+    return MaxThermostatValue(
+        address=res[0],
+        measure_time=res[1],
+        value=res[2],
+    )
+
+
+@timed
+def find_controllable_devices(
+    con: duckdb.DuckDBPyConnection, user_id: int, house_id: int
+) -> list[ControllableDevice]:
+    res = con.execute(
+        """SELECT d.id,
+    dt.type,
+    dt.name
+FROM Users u
+    INNER JOIN DeviceTypesToUserTypes dttut
+        ON dttut.user_type_id = u.user_type_id
+    INNER JOIN Devices d ON d.house_id = $house_id
+    AND d.device_type_id = dttut.device_type_id
+    INNER JOIN DeviceTypes dt ON dt.id = d.device_type_id
+WHERE u.id = $user_id
+ORDER BY d.id;""",
+        {"user_id": user_id, "house_id": house_id},
+    )
+
+    return [
+        ControllableDevice(
+            device_id=device[0], device_type=device[1], device_name=device[2]
+        )
+        for device in res.fetchall()
+    ]
+
+
+@timed
+def iter_measures(  # noqa: PLR0913
+    con: duckdb.DuckDBPyConnection,
+    start: datetime,
+    end: datetime,
+    *,
+    device_id: int | None = None,
+    house_id: int | None = None,
+    page_size: int = PAGE_SIZE,
+) -> Iterator[MeasurePoint]:
+    """
+    Измерения устройства или дома в [start, end) по (measure_time, id).
+    Без keyset: один запрос, результат читается по page_size строк
+    """
+    check_measures_target(device_id, house_id)
+    res = con.execute(
+        """SELECT m.id,
+    m.device_id,
+    m.measure_time,
+    m.value
+FROM Measures m
+    INNER JOIN Devices d ON d.id = m.device_id
+WHERE (d.id = $device_id OR d.house_id = $house_id)
+    AND m.measure_time >= $start
+    AND m.measure_time < $end
+ORDER BY m.measure_time,
+    m.id;""",
+        {
+            "device_id": device_id,
+            "house_id": house_id,
+            "start": start,
+            "end": end,
+        },
+    )
+    while page := res.fetchmany(page_size):
+        for row in page:
+            yield MeasurePoint(
+                id=row[0], device_id=row[1], measure_time=row[2], value=row[3]
+            )
+
+
+@timed
+def iter_measure_buckets(  # noqa: PLR0913
+    con: duckdb.DuckDBPyConnection,
+    start: datetime,
+    end: datetime,
+    bucket_minutes: int,
+    *,
+    device_id: int | None = None,
+    house_id: int | None = None,
+) -> Iterator[MeasureBucket]:
+    """
+    avg/min/max измерений по интервалам bucket_minutes минут от start,
+    как db.req_db.iter_measure_buckets, одним запросом
+    """
+    check_measures_target(device_id, house_id)
+    bucket = timedelta(minutes=bucket_minutes)
+    res = con.execute(
+        """SELECT FLOOR(
+        date_diff('second', $start, m.measure_time) / $bucket_seconds
+    ) AS bucket,
+    AVG(m.value),
+    MIN(m.value),
+    MAX(m.value),
+    COUNT(m.value)
+FROM Measures m
+    INNER JOIN Devices d ON d.id = m.device_id
+WHERE (d.id = $device_id OR d.house_id = $house_id)
+    AND m.measure_time >= $start
+    AND m.measure_time < $end
+    AND m.value IS NOT NULL
+GROUP BY bucket
+ORDER BY bucket;""",
+        {
+            "device_id": device_id,
+            "house_id": house_id,
+            "start": start,
+            "end": end,
+            "bucket_seconds": int(bucket.total_seconds()),
+        },
+    )
+    for row in res.fetchall():
+        yield MeasureBucket(
+            start=start + int(row[0]) * bucket,
+            avg_value=row[1],
+            min_value=row[2],
+            max_value=row[3],
+            count=row[4],
+        )
+
+
+# Результаты запросов, сбрасываются записью генератора в их таблицы
+result_cache = ResultCache("duckdb", RESULT_CACHE_SIZE, RESULT_CACHE_TTL)
+
+get_houses_with_activated_devices_cached = result_cache.cached(
+    "Houses", "Devices", "ActivationsToDevices"
+)(get_houses_with_activated_devices)
+
+get_max_thermostat_value_cached = result_cache.cached(
+    "Measures", "Devices", "DeviceTypes", "Houses"
+)(get_max_thermostat_value)
+
+
+def start_req_duck(con: duckdb.DuckDBPyConnection) -> None:
+    func = input(
+        """Выберите функцию:
+        - findUserDeviceTypes
+        - getHousesWithActivatedDevices
+        - getMaxThermostatValue
+        : """
+    )
+    if func == "findUserDeviceTypes":
+        user_name = input("Введите имя: ")
+        logger.info("%s", find_user_device_types(con, user_name))
+    elif func == "getHousesWithActivatedDevices":
+        for house in get_houses_with_activated_devices(con):
+            logger.info("%s", house)
+    elif func == "getMaxThermostatValue":
+        logger.info("%s", get_max_thermostat_value_cached(con))
+    else:
+        logger.error("Неверное имя функции: %s", func)
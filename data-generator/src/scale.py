@@ -0,0 +1,32 @@
+from dataclasses import dataclass, fields
+from typing import Self
+
+# Сколько строк пишется в БД / back4app за один раз
+CHUNK_SIZE = 10_000
+
+
+@dataclass(frozen=True)
+class GenerationCounts:
+    """
+    Объём генерируемых данных.
+    Значения по умолчанию - масштаб 1, scaled умножает все количества
+    на коэффициент масштаба (как SF в TPC-H)
+    """
+
+    houses: int = 200
+    users: int = 200
+    scenarios: int = 50
+    events: int = 150
+    measures: int = 400
+
+    @classmethod
+    def scaled(cls, scale_factor: float) -> Self:
+        base = cls()
+        return cls(
+            **{
+                field.name: max(
+                    1, round(getattr(base, field.name) * scale_factor)
+                )
+                for field in fields(cls)
+            }
+        )
@@ -0,0 +1,116 @@
+import time
+import zlib
+from collections.abc import Callable, Iterable, Mapping, Sequence
+from concurrent.futures import (
+    FIRST_COMPLETED,
+    Future,
+    ThreadPoolExecutor,
+    wait,
+)
+from dataclasses import dataclass
+from logging import getLogger
+
+from timing import operation
+
+logger = getLogger(name=__name__)
+
+
+@dataclass
+class Stage:
+    """Этап генерации: заполняет таблицы tables"""
+
+    name: str
+    tables: tuple[str, ...]
+    run: Callable[[], None]
+
+
+class StageCycleError(Exception):
+    def __init__(self, stages: Iterable[str]) -> None:
+        super().__init__(f"Циклическая зависимость этапов: {sorted(stages)}")
+
+
+def derive_seed(seed: int, name: str) -> int:
+    """Стабильный (не зависящий от PYTHONHASHSEED) seed для этапа"""
+    return zlib.crc32(f"{seed}:{name}".encode())
+
+
+def stage_dependencies(
+    stages: Sequence[Stage], references: Mapping[str, Iterable[str]]
+) -> dict[str, set[str]]:
+    """
+    Этап зависит от другого этапа, если одна из его таблиц ссылается
+    внешним ключом на таблицу другого этапа
+    """
+    owners = {table: stage.name for stage in stages for table in stage.tables}
+    return {
+        stage.name: {
+            owners[ref]
+            for table in stage.tables
+            for ref in references.get(table, ())
+            if ref in owners and owners[ref] != stage.name
+        }
+        for stage in stages
+    }
+
+
+def _run_timed(stage: Stage) -> float:
+    start = time.perf_counter()
+    with operation(f"stage.{stage.name}"):
+        stage.run()
+    elapsed = time.perf_counter() - start
+    logger.info("Этап %s: %.2f с", stage.name, elapsed)
+    return elapsed
+
+
+def run_stages(
+    stages: Sequence[Stage],
+    references: Mapping[str, Iterable[str]],
+    *,
+    max_workers: int = 1,
+) -> dict[str, float]:
+    """
+    Запуск этапов в порядке внешних ключей.
+    max_workers=1 - по очереди в порядке объявления,
+    иначе независимые этапы выполняются параллельно в потоках.
+    Возвращает время выполнения каждого этапа в секундах
+    """
+    deps = stage_dependencies(stages, references)
+    pending = list(stages)
+    done: set[str] = set()
+    timings: dict[str, float] = {}
+    start = time.perf_counter()
+
+    def ready() -> list[Stage]:
+        return [stage for stage in pending if deps[stage.name] <= done]
+
+    if max_workers == 1:
+        while pending:
+            stages_ready = ready()
+            if not stages_ready:
+                raise StageCycleError(stage.name for stage in pending)
+            stage = stages_ready[0]
+            pending.remove(stage)
+            timings[stage.name] = _run_timed(stage)
+            done.add(stage.name)
+    else:
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            running: dict[Future[float], Stage] = {}
+            while pending or running:
+                for stage in ready():
+                    pending.remove(stage)
+                    running[executor.submit(_run_timed, stage)] = stage
+                if not running:
+                    raise StageCycleError(stage.name for stage in pending)
+
+                finished, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    stage = running.pop(future)
+                    timings[stage.name] = future.result()
+                    done.add(stage.name)
+
+    logger.info(
+        "Все этапы: %.2f с (сумма по этапам %.2f с)",
+        time.perf_counter() - start,
+        sum(timings.values()),
+    )
+    return timings
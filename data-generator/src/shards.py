@@ -0,0 +1,82 @@
+from collections import deque
+from collections.abc import Callable, Iterable, Iterator
+from concurrent.futures import Future, ProcessPoolExecutor
+from typing import Any, Self
+
+from faker import Faker
+from tqdm import tqdm
+
+from scale import CHUNK_SIZE
+from scheduler import derive_seed
+
+
+def shard_faker(seed: int) -> Faker:
+    fake = Faker("ru_RU")
+    fake.seed_instance(seed)
+    return fake
+
+
+class ShardPool:
+    """
+    Пул процессов для генерации данных шардами.
+    Шард i таблицы name получает seed derive_seed(seed, "name:i"),
+    поэтому результат зависит от chunk_size, но не от числа процессов
+    """
+
+    def __init__(
+        self, processes: int, seed: int, *, chunk_size: int = CHUNK_SIZE
+    ) -> None:
+        self.processes = processes
+        self.seed = seed
+        self.chunk_size = chunk_size
+        self.executor = ProcessPoolExecutor(max_workers=processes)
+
+    def close(self) -> None:
+        self.executor.shutdown(cancel_futures=True)
+
+    def __enter__(self) -> Self:
+        return self
+
+    def __exit__(self, *_: object) -> None:
+        self.close()
+
+    def map_shards[T](
+        self,
+        fn: Callable[..., list[T]],
+        name: str,
+        shards: Iterable[tuple[Any, ...]],
+    ) -> Iterator[list[T]]:
+        """
+        fn(seed, *args) для каждого шарда в пуле процессов.
+        Результаты выдаются в порядке шардов, одновременно в работе
+        не больше двух шардов на процесс
+        """
+        pending: deque[Future[list[T]]] = deque()
+        for i, args in enumerate(shards):
+            seed = derive_seed(self.seed, f"{name}:{i}")
+            pending.append(self.executor.submit(fn, seed, *args))
+            if len(pending) >= 2 * self.processes:
+                yield pending.popleft().result()
+
+        while pending:
+            yield pending.popleft().result()
+
+    def generate[T](
+        self,
+        fn: Callable[..., list[T]],
+        name: str,
+        count: int,
+        *args: Any,  # noqa: ANN401
+    ) -> Iterator[T]:
+        """
+        count объектов из fn(seed, size, *args) шардами по chunk_size,
+        единым потоком в порядке шардов
+        """
+        shards = (
+            (min(self.chunk_size, count - start), *args)
+            for start in range(0, count, self.chunk_size)
+        )
+        with tqdm(total=count, desc=name) as progress:
+            for shard in self.map_shards(fn, name, shards):
+                progress.update(len(shard))
+                yield from shard
@@ -0,0 +1,267 @@
+import functools
+import inspect
+import threading
+import time
+from bisect import bisect_left
+from collections.abc import Awaitable, Callable, Generator, Iterator
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field, replace
+from logging import getLogger
+from typing import Any, NamedTuple, cast
+from urllib.parse import urlsplit
+
+import requests
+from sqlalchemy import Engine, event
+from sqlalchemy.engine import Connection
+from sqlalchemy.engine.interfaces import DBAPICursor
+
+from config import TIMING_ENABLED, TIMING_TOP
+
+logger = getLogger(name=__name__)
+
+# Границы корзин гистограммы, секунд: 0.1 мс * 2^i, до ~14 минут
+BUCKET_BOUNDS: tuple[float, ...] = tuple(0.0001 * 2**i for i in range(24))
+
+# Сколько символов SQL в имени выражения
+STATEMENT_CHARS = 80
+
+# Операция (запрос req_*, этап генератора), в которой идут выражения
+# SQL и HTTP-запросы текущего потока
+_operation: ContextVar[str] = ContextVar("operation", default="-")
+
+
+class TimingKey(NamedTuple):
+    # "operation", "db" - выражение SQL, "http" - запрос к Back4app,
+    # "pool" - ожидание соединения из пула
+    kind: str
+    operation: str
+    name: str
+
+
+@dataclass(slots=True)
+class Histogram:
+    """Длительности по логарифмическим корзинам и суммы по вызовам"""
+
+    buckets: list[int] = field(
+        default_factory=lambda: [0] * (len(BUCKET_BOUNDS) + 1)
+    )
+    count: int = 0
+    total: float = 0.0
+    longest: float = 0.0
+    rows: int = 0
+    size: int = 0
+    retries: int = 0
+
+    def add(
+        self, seconds: float, *, rows: int = 0, size: int = 0, retries: int = 0
+    ) -> None:
+        self.buckets[bisect_left(BUCKET_BOUNDS, seconds)] += 1
+        self.count += 1
+        self.total += seconds
+        self.longest = max(self.longest, seconds)
+        self.rows += rows
+        self.size += size
+        self.retries += retries
+
+    def quantile(self, q: float) -> float:
+        """Верхняя граница корзины q-квантиля, не больше longest"""
+        rank = q * self.count
+        seen = 0
+        for bound, count in zip(BUCKET_BOUNDS, self.buckets, strict=False):
+            seen += count
+            if seen >= rank:
+                return min(bound, self.longest)
+        return self.longest
+
+
+class TimingRegistry:
+    """Гистограммы по (вид, операция, имя), общие для потоков"""
+
+    def __init__(self) -> None:
+        self._histograms: dict[TimingKey, Histogram] = {}
+        self._lock = threading.Lock()
+
+    def record(  # noqa: PLR0913
+        self,
+        kind: str,
+        name: str,
+        seconds: float,
+        *,
+        rows: int = 0,
+        size: int = 0,
+        retries: int = 0,
+    ) -> None:
+        key = TimingKey(kind, _operation.get(), name)
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = Histogram()
+            histogram.add(seconds, rows=rows, size=size, retries=retries)
+        logger.debug(
+            "kind=%s operation=%s name=%r ms=%.3f rows=%d bytes=%d retries=%d",
+            *key,
+            1000 * seconds,
+            rows,
+            size,
+            retries,
+        )
+
+    def snapshot(self) -> dict[TimingKey, Histogram]:
+        with self._lock:
+            return {
+                key: replace(histogram, buckets=list(histogram.buckets))
+                for key, histogram in self._histograms.items()
+            }
+
+    def slowest(
+        self, kind: str, limit: int = TIMING_TOP
+    ) -> list[tuple[TimingKey, Histogram]]:
+        """Записи вида kind по убыванию суммарного времени"""
+        return sorted(
+            (
+                (key, histogram)
+                for key, histogram in self.snapshot().items()
+                if key.kind == kind
+            ),
+            key=lambda item: item[1].total,
+            reverse=True,
+        )[:limit]
+
+    def reset(self) -> None:
+        with self._lock:
+            self._histograms.clear()
+
+
+registry = TimingRegistry()
+
+
+@contextmanager
+def operation(name: str) -> Generator[None]:
+    """Время блока и метка операции для выражений и запросов внутри"""
+    token = _operation.set(name)
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        _operation.reset(token)
+        registry.record("operation", name, time.perf_counter() - start)
+
+
+def timed[**P, R](fn: Callable[P, R]) -> Callable[P, R]:
+    """
+    Декоратор запроса или генератора: операция с именем модуль.функция.
+    Для функции-генератора время - сумма шагов, без пауз потребителя,
+    для корутины - до её завершения (с ожиданием других задач цикла)
+    """
+    name = f"{fn.__module__}.{fn.__name__}"
+
+    if inspect.iscoroutinefunction(fn):
+
+        @functools.wraps(fn)
+        async def awaited(*args: P.args, **kwargs: P.kwargs) -> Any:  # noqa: ANN401
+            with operation(name):
+                return await cast("Awaitable[Any]", fn(*args, **kwargs))
+
+        return cast("Callable[P, R]", awaited)
+
+    if inspect.isgeneratorfunction(fn):
+
+        @functools.wraps(fn)
+        def steps(*args: P.args, **kwargs: P.kwargs) -> Iterator[Any]:
+            elapsed = 0.0
+            items = cast("Iterator[Any]", fn(*args, **kwargs))
+            try:
+                while True:
+                    token = _operation.set(name)
+                    start = time.perf_counter()
+                    try:
+                        item = next(items)
+                    except StopIteration:
+                        return
+                    finally:
+                        elapsed += time.perf_counter() - start
+                        _operation.reset(token)
+                    yield item
+            finally:
+                registry.record("operation", name, elapsed)
+
+        return cast("Callable[P, R]", steps)
+
+    @functools.wraps(fn)
+    def wrapper(*args: P.args, **kwargs: P.kwargs) -> R:
+        with operation(name):
+            return fn(*args, **kwargs)
+
+    return wrapper
+
+
+def statement_name(statement: str) -> str:
+    return " ".join(statement.split())[:STATEMENT_CHARS]
+
+
+def instrument_engine(engine: Engine) -> None:
+    """
+    Время выражений SQL движка: от отправки до ответа сервера.
+    rows - rowcount курсора (для потокового чтения yield_per не известен)
+    """
+    if not TIMING_ENABLED:
+        return
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def before(conn: Connection, *_: object) -> None:
+        conn.info["timing_start"] = time.perf_counter()
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def after(
+        conn: Connection, cursor: DBAPICursor, statement: str, *_: object
+    ) -> None:
+        seconds = time.perf_counter() - conn.info.pop("timing_start")
+        rows = cursor.rowcount if 0 <= cursor.rowcount < 2**63 - 1 else 0
+        registry.record("db", statement_name(statement), seconds, rows=rows)
+
+
+def record_response(res: requests.Response, *_: object, **__: object) -> None:
+    """
+    Хук ответа requests: время с повторами urllib3 и чтением тела,
+    размер тела и число повторов
+    """
+    start = time.perf_counter()
+    size = len(res.content)
+    retries = res.raw.retries
+    registry.record(
+        "http",
+        f"{res.request.method} {urlsplit(res.url).path.strip('/')}",
+        res.elapsed.total_seconds() + time.perf_counter() - start,
+        size=size,
+        retries=len(retries.history) if retries is not None else 0,
+    )
+
+
+def instrument_session(session: requests.Session) -> None:
+    if TIMING_ENABLED:
+        session.hooks["response"].append(record_response)
+
+
+def log_breakdown(limit: int = TIMING_TOP) -> None:
+    """
+    Самые долгие операции, выражения SQL, запросы HTTP и ожидания
+    соединений за процесс
+    """
+    for kind in ("operation", "db", "http", "pool"):
+        for key, histogram in registry.slowest(kind, limit):
+            logger.info(
+                "%-9s %-45s %-50s n=%-6d всего=%10.1f p50=%8.2f "
+                "p95=%8.2f max=%8.2f мс строк %d байт %d повторов %d",
+                kind,
+                key.operation,
+                key.name,
+                histogram.count,
+                1000 * histogram.total,
+                1000 * histogram.quantile(0.5),
+                1000 * histogram.quantile(0.95),
+                1000 * histogram.longest,
+                histogram.rows,
+                histogram.size,
+                histogram.retries,
+            )
@@ -1,7 +1,9 @@
 CREATE TABLE IF NOT EXISTS DeviceTypesToUserTypes (
 	device_type_id INT NOT NULL,
 	user_type_id INT NOT NULL,
-	PRIMARY KEY(device_type_id, user_type_id)
+	PRIMARY KEY(device_type_id, user_type_id),
+	-- доступные типу пользователя типы устройств - только по индексу
+	INDEX user_type_device_type(user_type_id, device_type_id)
 );
 
 
@@ -39,7 +41,10 @@ CREATE TABLE IF NOT EXISTS Devices (
 	id INT NOT NULL AUTO_INCREMENT,
 	house_id INT NOT NULL,
 	device_type_id INT NOT NULL,
-	PRIMARY KEY(id)
+	PRIMARY KEY(id),
+	-- устройства дома нужных типов; внешний ключ на house_id
+	-- использует этот же индекс
+	INDEX house_device_type(house_id, device_type_id)
 );
 
 
@@ -78,12 +83,38 @@ CREATE TABLE IF NOT EXISTS Events (
 );
 
 
+-- секции по месяцам measure_time: месячные секции добавляет и старые
+-- удаляет команда partitions генератора, pmax - всё после последней.
+-- Секционированная таблица не может иметь внешних ключей (device_id
+-- согласован с Devices генератором), а все её уникальные ключи
+-- должны включать measure_time
 CREATE TABLE IF NOT EXISTS Measures (
 	id INT NOT NULL AUTO_INCREMENT,
 	device_id INT NOT NULL,
 	measure_time DATETIME NOT NULL,
 	value REAL,
-	PRIMARY KEY(id)
+	PRIMARY KEY(id, measure_time),
+	-- максимум и временные окна по устройству без сортировки
+	INDEX device_value(device_id, value),
+	INDEX device_time(device_id, measure_time),
+	INDEX measure_time(measure_time)
+)
+PARTITION BY RANGE COLUMNS(measure_time) (
+	PARTITION pmax VALUES LESS THAN (MAXVALUE)
+);
+
+-- сводка по Measures, обновляется генератором при записи измерений;
+-- учитываются только измерения с value
+CREATE TABLE IF NOT EXISTS DeviceMeasureStats (
+	device_id INT NOT NULL,
+	value_count INT NOT NULL,
+	value_sum REAL NOT NULL,
+	min_value REAL NOT NULL,
+	max_value REAL NOT NULL,
+	max_time DATETIME NOT NULL,
+	last_time DATETIME NOT NULL,
+	last_value REAL NOT NULL,
+	PRIMARY KEY(device_id)
 );
 
 
@@ -111,5 +142,5 @@ ALTER TABLE Events
 ADD FOREIGN KEY(device_id) REFERENCES Devices(id);
 ALTER TABLE Events
 ADD FOREIGN KEY(scenario_id) REFERENCES Scenarios(id);
-ALTER TABLE Measures
+ALTER TABLE DeviceMeasureStats
 ADD FOREIGN KEY(device_id) REFERENCES Devices(id);
\ No newline at end of file